@@ -6,10 +6,11 @@
 # https://github.com/micropython/micropython-lib/tree/master/micropython/bluetooth/aioble
 
 import bluetooth
-import time
+import uasyncio as asyncio
 import wifi.wifi_connect as wifi_connect
 import random
 from ble.ble_advertising import advertising_payload
+from ble.framing import FrameDecoder, MODE_DELIMITED, MODE_LENGTH_PREFIXED
 
 from micropython import const
 
@@ -22,6 +23,11 @@ _FLAG_WRITE_NO_RESPONSE = const(0x0004)
 _FLAG_WRITE = const(0x0008)
 _FLAG_NOTIFY = const(0x0010)
 
+# Frame decoder sizes: short LABEL:value lines, or whole config bundles and
+# certificates in length-prefixed mode (a frame must fit in the buffer)
+_DELIMITED_CAPACITY = const(512)
+_LENGTH_PREFIXED_CAPACITY = const(4096)
+
 _UART_UUID = bluetooth.UUID("6E400001-B5A3-F393-E0A9-E50E24DCCA9E")
 _UART_TX = (
     bluetooth.UUID("6E400003-B5A3-F393-E0A9-E50E24DCCA9E"),
@@ -80,96 +86,86 @@ class BLESimplePeripheral:
     def on_write(self, callback):
         self._write_callback = callback
 
-async def receive_credentials():
+async def receive_credentials(timeout_ms=None, length_prefixed=False, capacity=None):
+    """Advertise the UART service until SSID, PASSWORD and IP have arrived.
+    Waits on a flag set from the BLE IRQ, so the event loop keeps running.
+    Messages are newline-terminated, or 2-byte length-prefixed frames when
+    length_prefixed is set. capacity is the largest frame accepted (default
+    512 bytes, 4 KB when length-prefixed). Returns (ssid, password,
+    central_ip), or None after timeout_ms."""
     ble = bluetooth.BLE()
     p = BLESimplePeripheral(ble)
 
-    stop = False
+    received = asyncio.ThreadSafeFlag()
     ssid = None
     password = None
     central_ip = None
     
-    # Buffer to accumulate chunked messages
-    message_buffer = bytearray()
-
-    def on_rx(v):
-        """Handles incoming BLE messages and stores data."""
-        nonlocal ssid, password, central_ip, stop, message_buffer
-        
-        print(f"Received chunk: {v}")
-        print(f"Chunk length: {len(v)} bytes")
+    def on_frame(frame):
+        """Handles one complete 'LABEL:value' message and stores data."""
+        nonlocal ssid, password, central_ip
         
         try:
-            # Add this chunk to the buffer
-            message_buffer.extend(v)
-            
-            # Try to process complete messages from buffer
-            while True:
-                try:
-                    # Convert buffer to string to check for complete messages
-                    buffer_str = message_buffer.decode('utf-8')
-                except UnicodeDecodeError:
-                    # Incomplete UTF-8 sequence, wait for more data
-                    print("Waiting for more data (incomplete UTF-8)")
-                    break
-                
-                # Look for newline (end of message)
-                newline_pos = buffer_str.find('\n')
-                if newline_pos == -1:
-                    # No complete message yet
-                    print(f"Buffering... current buffer: {len(message_buffer)} bytes")
-                    break
-                
-                # Extract complete message
-                complete_message = buffer_str[:newline_pos]
-                print(f"Complete message: '{complete_message}'")
-                print(f"Message length: {len(complete_message)} chars")
-                
-                # Remove processed message from buffer
-                bytes_processed = len(complete_message.encode('utf-8')) + 1  # +1 for newline
-                message_buffer = message_buffer[bytes_processed:]
-                
-                # Process the complete message
-                if ':' not in complete_message:
-                    print("Invalid message format (no colon)")
-                    continue
-                
-                label, content = complete_message.split(":", 1)
-                print(f"Label: '{label}', Content: '{content}' (length: {len(content)})")
-
-                # Store received values
-                if label == "SSID":
-                    ssid = content
-                    print(f"✅ SSID set: '{ssid}'")
-                elif label == "PASSWORD":
-                    password = content
-                    print(f"✅ PASSWORD set: length {len(password)}")
-                elif label == "IP":
-                    central_ip = content
-                    print(f"✅ IP set: '{central_ip}'")
-
-                # Check if all values are received
-                if ssid and password and central_ip:
-                    print("🎉 All credentials received!")
-                    stop = True
-                    break
+            message = bytes(frame).decode('utf-8')
+        except UnicodeError:
+            print("Invalid message encoding")
+            return
+        
+        # Process the complete message
+        if ':' not in message:
+            print("Invalid message format (no colon)")
+            return
+        
+        label, content = message.split(":", 1)
+
+        # Store received values
+        if label == "SSID":
+            ssid = content
+            print(f"✅ SSID set: '{ssid}'")
+        elif label == "PASSWORD":
+            password = content
+            print(f"✅ PASSWORD set: length {len(password)}")
+        elif label == "IP":
+            central_ip = content
+            print(f"✅ IP set: '{central_ip}'")
+
+        # Check if all values are received
+        if ssid and password and central_ip:
+            print("🎉 All credentials received!")
+            received.set()
+
+    # Chunks are reassembled in a fixed ring buffer; only new bytes are scanned
+    if capacity is None:
+        capacity = _LENGTH_PREFIXED_CAPACITY if length_prefixed else _DELIMITED_CAPACITY
+    decoder = FrameDecoder(on_frame, capacity, MODE_LENGTH_PREFIXED if length_prefixed else MODE_DELIMITED)
 
+    def on_rx(v):
+        try:
+            decoder.feed(v)
         except Exception as e:
             print(f"Error processing received data: {e}")
-            # Clear buffer on error to prevent corruption
-            message_buffer = bytearray()
+            # Drop partial data on error to prevent corruption
+            decoder.reset()
 
     p.on_write(on_rx)
 
     print("Waiting for data...")
-    while stop is False:
-        time.sleep_ms(100)  # Block until data is received
-        
-    ble.active(False)
+    try:
+        if timeout_ms is None:
+            await received.wait()
+        else:
+            await asyncio.wait_for_ms(received.wait(), timeout_ms)
+    except asyncio.TimeoutError:
+        print("⏰ BLE provisioning timed out")
+        return None
+    finally:
+        # Also runs when the task is cancelled because WiFi came back
+        ble.active(False)
     
     print(f"Final credentials:")
     print(f"SSID: '{ssid}' ({len(ssid) if ssid else 0} chars)")
     print(f"Password: {len(password) if password else 0} chars")
     print(f"IP: '{central_ip}' ({len(central_ip) if central_ip else 0} chars)")
     
-    wifi_connect.write_credentials(ssid, password, central_ip)
\ No newline at end of file
+    wifi_connect.write_credentials(ssid, password, central_ip)
+    return ssid, password, central_ip
@@ -0,0 +1,136 @@
+from micropython import const
+
+MODE_DELIMITED = "delimited"            # Frames end with a delimiter byte (default b"\n")
+MODE_LENGTH_PREFIXED = "length"         # 2-byte big-endian length, then the payload
+
+_HEADER_SIZE = const(2)
+
+
+class FrameDecoder:
+    """Splits a chunked byte stream into frames.
+
+    Chunks are copied into a fixed ring buffer and only the newly arrived bytes
+    are scanned, so work per chunk is linear and nothing is reallocated; safe
+    to call from the BLE IRQ. on_frame(view) receives a memoryview that is only
+    valid during the call (copy it with bytes(view) to keep it)."""
+
+    def __init__(self, on_frame, capacity=512, mode=MODE_DELIMITED, delimiter=b"\n"):
+        if mode not in (MODE_DELIMITED, MODE_LENGTH_PREFIXED):
+            raise ValueError("Invalid framing mode")
+        self.on_frame = on_frame
+        self.mode = mode
+        self.delimiter = delimiter[0]
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._scratch = bytearray(capacity)  # Frames that wrap around the ring end
+        self._head = 0      # First unconsumed byte
+        self._count = 0     # Unconsumed bytes
+        self._scanned = 0   # Unconsumed bytes already searched for a delimiter
+        self._discarding = False
+        self._skip = 0      # Bytes of an oversize length-prefixed frame still to drop
+        self.frames = 0
+        self.overflows = 0
+
+    def reset(self):
+        self._head = 0
+        self._count = 0
+        self._scanned = 0
+        self._discarding = False
+        self._skip = 0
+
+    def feed(self, data):
+        """Append a chunk and deliver every frame it completes"""
+        data = memoryview(data)
+        size = len(data)
+        offset = 0
+        while offset < size:
+            free = self.capacity - self._count
+            if free == 0:
+                # A frame larger than the buffer can never complete: drop it,
+                # along with the rest of it up to the next delimiter
+                self.overflows += 1
+                self.reset()
+                self._discarding = True
+                free = self.capacity
+            take = min(free, size - offset)
+            tail = (self._head + self._count) % self.capacity
+            first = min(take, self.capacity - tail)
+            self._buf[tail:tail + first] = data[offset:offset + first]
+            if first < take:
+                self._buf[0:take - first] = data[offset + first:offset + take]
+            self._count += take
+            offset += take
+
+            if self.mode == MODE_DELIMITED:
+                self._scan_delimited()
+            else:
+                self._scan_length_prefixed()
+
+    def _scan_delimited(self):
+        buf = self._buf
+        capacity = self.capacity
+        delimiter = self.delimiter
+        while self._scanned < self._count:
+            index = (self._head + self._scanned) % capacity
+            if buf[index] == delimiter:
+                length = self._scanned
+                if self._discarding:
+                    self._discarding = False
+                else:
+                    self._deliver(length)
+                self._consume(length + 1)
+            else:
+                self._scanned += 1
+
+    def _scan_length_prefixed(self):
+        while True:
+            if self._skip:
+                dropped = min(self._skip, self._count)
+                self._consume(dropped)
+                self._skip -= dropped
+                if self._skip:
+                    return
+            if self._count < _HEADER_SIZE:
+                return
+            buf = self._buf
+            high = buf[self._head]
+            low = buf[(self._head + 1) % self.capacity]
+            length = (high << 8) | low
+            if length + _HEADER_SIZE > self.capacity:
+                # Drop exactly this frame's payload, so the next header is
+                # read from the right place as the rest of it arrives
+                self.overflows += 1
+                self._consume(_HEADER_SIZE)
+                self._skip = length
+                continue
+            if self._count < length + _HEADER_SIZE:
+                return
+            self._consume(_HEADER_SIZE)
+            self._deliver(length)
+            self._consume(length)
+
+    def _deliver(self, length):
+        head = self._head
+        if head + length <= self.capacity:
+            frame = self._view[head:head + length]
+        else:
+            first = self.capacity - head
+            self._scratch[0:first] = self._view[head:]
+            self._scratch[first:length] = self._view[0:length - first]
+            frame = memoryview(self._scratch)[0:length]
+        self.frames += 1
+        self.on_frame(frame)
+
+    def _consume(self, length):
+        self._head = (self._head + length) % self.capacity
+        self._count -= length
+        self._scanned = 0
+
+
+def encode_length_prefixed(payload):
+    """Frame a payload for MODE_LENGTH_PREFIXED"""
+    length = len(payload)
+    if length > 0xFFFF:
+        raise ValueError("frame too large")
+    return bytes((length >> 8, length & 0xFF)) + payload
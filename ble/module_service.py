@@ -0,0 +1,237 @@
+# Persistent BLE GATT service exposing live module states.
+#
+# GATT tables are fixed once registered, while modules come and go, so the
+# service has MAX_SLOTS module characteristics plus an index characteristic
+# that maps slots to modules:
+#
+#   index:  [generation, count] + count * [slot, type code, 8-byte module UUID]
+#   slot:   [slot, type code] + module.pack_state()
+#
+# Slots notify when their packed state changes. Only when the service is
+# created with writable=True, writing a control's slot (the state bytes
+# alone, or with the 2-byte header) sets its output. Those writes need an
+# encrypted link, but the board has no display or keypad, so pairing is
+# "just works": it stops passive sniffing, NOT unknown centrals. Any phone
+# in range can pair and switch relays. Writable mode has no authentication;
+# only enable it where that is acceptable.
+
+import bluetooth
+import random
+import ubinascii
+import uasyncio as asyncio
+from micropython import const
+from ble.ble_advertising import advertising_payload
+from module.module_manager import ModuleManager
+from module.module import Control
+from utils.sampler import Sampler
+from utils.commands import CommandQueue
+
+_IRQ_CENTRAL_CONNECT = const(1)
+_IRQ_CENTRAL_DISCONNECT = const(2)
+_IRQ_GATTS_WRITE = const(3)
+_IRQ_MTU_EXCHANGED = const(21)
+_IRQ_ENCRYPTION_UPDATE = const(28)
+
+_FLAG_READ = const(0x0002)
+_FLAG_WRITE = const(0x0008)
+_FLAG_NOTIFY = const(0x0010)
+_FLAG_WRITE_ENCRYPTED = const(0x2000)
+
+_IO_CAPABILITY_NO_INPUT_OUTPUT = const(3)
+
+_DEFAULT_MTU = const(23)
+_ATT_HEADER = const(3)   # Notification payload is MTU - 3
+_SLOT_HEADER = const(2)
+_INDEX_ENTRY = const(10)
+_SLOT_BUFFER = const(32)
+
+MAX_SLOTS = 8
+
+# Module type codes used in the index and slot headers
+TYPE_CODES = {
+    "Led": 1,
+    "Relay": 2,
+    "GasSensor": 3,
+    "TemperatureSensor": 4,
+}
+
+_SERVICE_UUID = bluetooth.UUID("6E401000-B5A3-F393-E0A9-E50E24DCCA9E")
+_INDEX_CHAR = (
+    bluetooth.UUID("6E401001-B5A3-F393-E0A9-E50E24DCCA9E"),
+    _FLAG_READ | _FLAG_NOTIFY,
+)
+
+
+def _service(writable):
+    flags = _FLAG_READ | _FLAG_NOTIFY
+    if writable:
+        flags |= _FLAG_WRITE | _FLAG_WRITE_ENCRYPTED
+    slot_chars = tuple(
+        (bluetooth.UUID(f"6E4011{i:02X}-B5A3-F393-E0A9-E50E24DCCA9E"), flags)
+        for i in range(MAX_SLOTS)
+    )
+    return (_SERVICE_UUID, (_INDEX_CHAR,) + slot_chars)
+
+
+class BLEModuleService:
+    def __init__(self, ble=None, name="LICN-"+str(random.randint(10, 99)), writable=False):
+        self._ble = ble or bluetooth.BLE()
+        self._ble.active(True)
+        self.writable = writable
+        if writable:
+            # "Just works" LE secure connections pairing: encrypted, unauthenticated.
+            # No bonding, since keys would not survive a reboot without secret storage.
+            self._ble.config(bond=False, le_secure=True, io=_IO_CAPABILITY_NO_INPUT_OUTPUT)
+        self._ble.irq(self._irq)
+        ((self._handle_index, *self._slot_handles),) = self._ble.gatts_register_services((_service(writable),))
+        self._ble.gatts_set_buffer(self._handle_index, _SLOT_HEADER + MAX_SLOTS * _INDEX_ENTRY)
+        for handle in self._slot_handles:
+            self._ble.gatts_set_buffer(handle, _SLOT_BUFFER)
+        self._connections = {}   # conn_handle -> negotiated MTU
+        self._encrypted = set()  # conn_handles with an encrypted link
+        self._slot_uuids = [None] * MAX_SLOTS
+        self._slot_payloads = [None] * MAX_SLOTS
+        self._generation = 0
+        self._pending_writes = {}  # slot -> bytes, applied by run()
+        self._write_flag = asyncio.ThreadSafeFlag()
+        self._payload = advertising_payload(name=name, services=[_SERVICE_UUID])
+        Sampler.add_listener(self._on_sample)
+        self._advertise()
+
+    def _irq(self, event, data):
+        if event == _IRQ_CENTRAL_CONNECT:
+            conn_handle, _, _ = data
+            self._connections[conn_handle] = _DEFAULT_MTU
+        elif event == _IRQ_CENTRAL_DISCONNECT:
+            conn_handle, _, _ = data
+            self._connections.pop(conn_handle, None)
+            self._encrypted.discard(conn_handle)
+            self._advertise()
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            self._connections[conn_handle] = mtu
+        elif event == _IRQ_ENCRYPTION_UPDATE:
+            conn_handle, encrypted, _, _, _ = data
+            if encrypted:
+                self._encrypted.add(conn_handle)
+            else:
+                self._encrypted.discard(conn_handle)
+        elif event == _IRQ_GATTS_WRITE:
+            conn_handle, value_handle = data
+            if not self.writable or conn_handle not in self._encrypted:
+                return  # The stack enforces this too; don't rely on it alone
+            if value_handle in self._slot_handles:
+                # Control writes touch I2C: hand them to the event loop
+                slot = self._slot_handles.index(value_handle)
+                self._pending_writes[slot] = self._ble.gatts_read(value_handle)
+                self._write_flag.set()
+
+    def _advertise(self, interval_us=500000):
+        self._ble.gap_advertise(interval_us, adv_data=self._payload)
+
+    def _notify(self, handle, payload):
+        """Notify every connection; payloads that don't fit the MTU are sent
+        as a bare header so the central knows to read the full value"""
+        for conn_handle, mtu in self._connections.items():
+            data = payload if len(payload) <= mtu - _ATT_HEADER else payload[:_SLOT_HEADER]
+            try:
+                self._ble.gatts_notify(conn_handle, handle, data)
+            except OSError:
+                pass
+
+    def _sync_slots(self):
+        """Assign slots to modules that appeared and free slots of removed ones"""
+        modules = ModuleManager.modules
+        changed = False
+        for slot in range(MAX_SLOTS):
+            uuid = self._slot_uuids[slot]
+            if uuid is not None and uuid not in modules:
+                self._slot_uuids[slot] = None
+                self._slot_payloads[slot] = None
+                changed = True
+        for uuid in modules:
+            if uuid in self._slot_uuids:
+                continue
+            if None not in self._slot_uuids:
+                break  # More modules than slots: the rest stay HTTP-only
+            self._slot_uuids[self._slot_uuids.index(None)] = uuid
+            changed = True
+        if changed:
+            self._write_index()
+
+    def _write_index(self):
+        self._generation = (self._generation + 1) & 0xFF
+        entries = bytearray()
+        for slot, uuid in enumerate(self._slot_uuids):
+            if uuid is None:
+                continue
+            module = ModuleManager.modules.get(uuid)
+            entries.extend(bytes((slot, self._type_code(module))))
+            try:
+                entries.extend(ubinascii.unhexlify(uuid)[:8])
+            except ValueError:
+                entries.extend(bytes(8))
+        payload = bytes((self._generation, len(entries) // _INDEX_ENTRY)) + entries
+        self._ble.gatts_write(self._handle_index, payload)
+        self._notify(self._handle_index, payload)
+
+    @staticmethod
+    def _type_code(module):
+        return TYPE_CODES.get(module.module_type, 0) if module else 0
+
+    def _update_slot(self, slot, module, value=None):
+        payload = bytes((slot, self._type_code(module))) + module.pack_state(value)
+        if payload == self._slot_payloads[slot]:
+            return  # Unchanged: no write, no notification
+        self._slot_payloads[slot] = payload
+        handle = self._slot_handles[slot]
+        self._ble.gatts_write(handle, payload)
+        self._notify(handle, payload)
+
+    def _on_sample(self, uuid, value):
+        """Sampler listener: push new sensor values"""
+        if uuid not in self._slot_uuids:
+            return
+        module = ModuleManager.modules.get(uuid)
+        if module is not None:
+            self._update_slot(self._slot_uuids.index(uuid), module, value)
+
+    def _refresh_controls(self):
+        """Controls can also change over HTTP; packing them needs no bus access"""
+        for slot, uuid in enumerate(self._slot_uuids):
+            module = ModuleManager.modules.get(uuid) if uuid else None
+            if isinstance(module, Control):
+                self._update_slot(slot, module)
+
+    def _apply_writes(self):
+        writes = self._pending_writes
+        self._pending_writes = {}
+        for slot, data in writes.items():
+            uuid = self._slot_uuids[slot]
+            module = ModuleManager.modules.get(uuid) if uuid else None
+            if not isinstance(module, Control) or not data:
+                continue
+            if len(data) > _SLOT_HEADER and data[0] == slot:
+                data = data[_SLOT_HEADER:]  # Full slot value echoed back
+            try:
+                result = CommandQueue.submit(uuid, module.unpack_state(data))
+                if "error" in result:
+                    print(f"❌ BLE write to slot {slot} rejected: {result['error']}")
+            except Exception as e:
+                print(f"❌ BLE write to slot {slot} failed: {e}")
+            self._slot_payloads[slot] = None  # Re-publish the real state
+
+    async def run(self, interval_ms=1000):
+        """Keep slots in sync with the module table and apply control writes"""
+        print("📡 BLE module service advertising")
+        while True:
+            try:
+                await asyncio.wait_for_ms(self._write_flag.wait(), interval_ms)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                self._sync_slots()
+                self._apply_writes()
+                self._refresh_controls()
+            except Exception as e:
+                print(f"❌ BLE module service error: {e}")
@@ -2,33 +2,144 @@
 import uasyncio as asyncio
 import wifi.wifi_connect as wifi_connect
 from module.module_manager import ModuleManager
-from wifi.http_server import start_server
+from wifi.http_server import bind
 from ble.ble_simple_peripheral import receive_credentials
-from utils.sawtooth import init_sawtooth_thread
+from utils.sawtooth import init_sawtooth
+from utils.health import HealthMonitor
+import utils.battery as battery
+from utils.power import PowerManager
+from utils.core1 import Core1Scheduler
+from utils.sampler import Sampler
+from wifi.link_manager import LinkManager
+from utils.boot import BootTimeline
+from utils.snapshot import Snapshot
+from module.identify import DeviceIdentifier
+from utils.rules import RuleEngine
+from utils.commands import CommandQueue
 from machine import Pin
 
-async def main():
-    ip_address = None
-    while ip_address is None:
+# Feed the hardware watchdog only while the event loop is healthy
+ENABLE_WATCHDOG = False
+
+# Keep BLE on after boot with a GATT service for module states
+ENABLE_BLE_MODULE_SERVICE = False
+# Also accept control writes (relay/LED) over it: encrypted, but NOT authenticated,
+# any central in range can pair and write
+BLE_MODULE_SERVICE_WRITABLE = False
+
+# Saved network retry period, and how long each BLE provisioning window stays open
+WIFI_RETRY_MS = 30000
+PROVISIONING_TIMEOUT_MS = 300000
+
+# Work handed to core 1: "sample" (sensor reads), "downsample" (history) and/or
+# "dac" (DAC thread backend, which keeps core 1 busy while it streams)
+CORE1_WORKLOADS = ("sample", "downsample")
+
+# DAC output backend: "pio" (hardware, frees core 1), "thread" (core 1) or "timer"
+DAC_BACKEND = "thread" if "dac" in CORE1_WORKLOADS else "pio"
+
+async def connect_with_provisioning():
+    """Retry the saved network while BLE provisioning runs alongside; whichever
+    succeeds first wins, so a network that comes back needs no re-provisioning"""
+    ble_task = None
+    while True:
         try:
-            ip_address = wifi_connect.connect_to_wifi()
+            ip_address = await wifi_connect.connect_to_wifi_async()
+            if ble_task is not None and not ble_task.done():
+                ble_task.cancel()
+            return ip_address
         except Exception as e:
-            await receive_credentials()
-    
-    init_sawtooth_thread()
+            print(f"⚠️ WiFi not available: {e}")
+
+        if ble_task is None or ble_task.done():
+            ble_task = asyncio.create_task(receive_credentials(timeout_ms=PROVISIONING_TIMEOUT_MS))
+
+        # Retry early when new credentials arrive over BLE
+        try:
+            await asyncio.wait_for_ms(wifi_connect.credentials_changed.wait(), WIFI_RETRY_MS)
+        except asyncio.TimeoutError:
+            pass
+
+async def on_link_change(ip_address, old_ip):
+    """The link came back or got a new address: move the server if needed and
+    send the central a fresh module list"""
+    if ip_address != old_ip:
+        await bind(ip_address)
+    await ModuleManager.refresh_central()
+
+async def start_hardware():
+    """Boot work that needs no network; runs while WiFi associates"""
+    with BootTimeline.phase("core1"):
+        Core1Scheduler.start(CORE1_WORKLOADS)
+    with BootTimeline.phase("dac"):
+        init_sawtooth(DAC_BACKEND)
 
     # Initialize I2C
-    ModuleManager.initialize_i2c(scl_pin=5, sda_pin=4)
-    ModuleManager.set_i2c_scan_interval(0.5)
-    
-    await ModuleManager.load_modules()
-    
-    # Create async tasks
+    with BootTimeline.phase("i2c"):
+        ModuleManager.initialize_i2c(scl_pin=5, sda_pin=4)
+        ModuleManager.set_i2c_scan_interval(0.5)
+
+    with BootTimeline.phase("drivers"):
+        ModuleManager.load_device_descriptions()
+
+    # Registry only: the central is told once the network is up
+    await BootTimeline.run("modules", ModuleManager.load_modules(refresh_central=False))
+
+async def refresh_central_deferred():
+    """Tell the central about the modules once the HTTP server is already up,
+    then again whenever detection changes the module list"""
+    try:
+        await BootTimeline.run("central_refresh", ModuleManager.refresh_central())
+    except Exception as e:
+        print(f"⚠️ Central refresh failed: {e}")
+    await ModuleManager.run_central_sync()
+
+async def main():
+    # Start loop/heap monitoring first so blocking boot steps show up as lag
+    health_task = asyncio.create_task(HealthMonitor.run(tick_ms=100))
+    battery_task = asyncio.create_task(battery.run(interval_s=30))
+    core1_task = asyncio.create_task(Core1Scheduler.run())
+
+    # WiFi association and hardware bring-up overlap
+    wifi_task = asyncio.create_task(BootTimeline.run("wifi", connect_with_provisioning()))
+    await asyncio.sleep_ms(0)  # Let WiFi start associating first
+    await BootTimeline.run("hardware", start_hardware())
+
+    # Detection may start before WiFi: module changes only flag the central,
+    # which is refreshed after bind()
     i2c_detection_task = asyncio.create_task(ModuleManager.detect_i2c_modules())
-    http_server_task = asyncio.create_task(start_server(ip_address))
+    identify_task = asyncio.create_task(DeviceIdentifier.run())
+    sampler_task = asyncio.create_task(Sampler.run(interval_ms=1000))
+    snapshot_task = asyncio.create_task(Snapshot.run())
+    commands_task = asyncio.create_task(CommandQueue.run())
+    rules_task = asyncio.create_task(RuleEngine.run())
+
+    ip_address = await wifi_task
+
+    # Serve as soon as there is an IP; the central refresh runs afterwards
+    await BootTimeline.run("http", bind(ip_address))
+    central_task = asyncio.create_task(refresh_central_deferred())
+
+    # From here on the link manager owns WiFi and reconnects in the background
+    LinkManager.on_link_change(on_link_change)
+    link_task = asyncio.create_task(LinkManager.run(ip_address))
+
+    # Adjust scan/sample intervals, WiFi power save and CPU clock to activity
+    power_task = asyncio.create_task(PowerManager.run())
+
+    tasks = [i2c_detection_task, identify_task, health_task, battery_task, power_task, core1_task, sampler_task, commands_task, rules_task, snapshot_task, link_task, central_task]
+
+    if ENABLE_BLE_MODULE_SERVICE:
+        from ble.module_service import BLEModuleService
+        tasks.append(asyncio.create_task(BLEModuleService(writable=BLE_MODULE_SERVICE_WRITABLE).run()))
+
+    # Enable only after boot: WiFi/BLE setup blocks longer than the WDT allows
+    if ENABLE_WATCHDOG:
+        HealthMonitor.enable_watchdog(timeout_ms=8000, lag_limit_ms=1000)
     
-    print("🚀 Starting I2C detection, HTTP server, and sawtooth DAC...")
-    await asyncio.gather(i2c_detection_task, http_server_task)
+    BootTimeline.mark_complete()
+    print("🚀 Boot complete: I2C detection, HTTP server, and sawtooth DAC running")
+    await asyncio.gather(*tasks)
 
 try:
     asyncio.run(main())
@@ -1,40 +1,54 @@
 from module.module import Control
-import json
 import utils.battery as battery
+import utils.logger as logger
 
 class Led(Control):
-    def __init__(self,i2c_instance,i2c_address):  # ← Accepts i2c_address
+    def __init__(self,i2c_instance,i2c_address, initial_state=None):  # ← Accepts i2c_address
         super().__init__(i2c_instance,i2c_address)  # ← Passes i2c_address to parent
         self.i2c = i2c_instance
         self.i2c_address = i2c_address
-        self.set_state(0)
+        self._pwm_command = bytearray([0x40, 0])  # [CMD_SET_PWM, pwm_value], reused by every write
+        # Warm start restores the last output instead of forcing it off
+        self.set_state(initial_state if initial_state is not None else 0)
 
     def set_state(self, state):
         """Set LED brightness by sending 8-bit PWM value over I2C"""
-        print(f"🔅 LED: Setting brightness to {state}%")
+        logger.debug("🔅 LED: Setting brightness to %s%%", state)
         try:
             # Convert percentage to 0-100 range and validate
             state = max(0, min(100, float(state)))
             self.state = state
             
             # Convert percentage (0-100) to 8-bit value (0-255)
-            pwm_value = int((state / 100.0) * 255) 
+            pwm_value = Led.to_pwm(state)
             
             if self.i2c and self.i2c_address is not None:
-                # Send command: [CMD_SET_PWM, pwm_value]
-                data = bytes([0x40, pwm_value])
-                self.i2c.writeto(self.i2c_address, data)                
+                self.write_pwm(pwm_value)
             else:
-                print("⚠️ LED: I2C not available, cannot set brightness")    
+                logger.warning("⚠️ LED: I2C not available, cannot set brightness")    
         except Exception as e:
-            print(f"❌ LED: Error setting brightness: {e}")
+            logger.error("❌ LED: Error setting brightness: %s", e)
             self.state = 0
 
-    def get_state(self):
-        return json.dumps({
+    def normalize_state(self, state):
+        return max(0, min(100, float(state)))
+
+    @staticmethod
+    def to_pwm(state):
+        """Brightness percentage (0-100) to the 8-bit PWM value"""
+        return int((max(0, min(100, state)) / 100.0) * 255)
+
+    def write_pwm(self, pwm_value):
+        """Raw 8-bit write without conversion or logging, for transition frames.
+        The caller keeps self.state up to date."""
+        self._pwm_command[1] = pwm_value
+        self.i2c.writeto(self.i2c_address, self._pwm_command)
+
+    def state_dict(self):
+        return {
             "brightness": self.state,
             "batteryLevel": battery.getBatteryPercentage()
-        })
+        }
     
     def __del__(self):
         self.set_state(0)
\ No newline at end of file
@@ -1,13 +1,14 @@
 from module.module import Control
-import json
 import utils.battery as battery
+import utils.logger as logger
 
 class Relay(Control):
-    def __init__(self,i2c_instance,i2c_address):  # ← Accepts i2c_address
+    def __init__(self,i2c_instance,i2c_address, initial_state=None):  # ← Accepts i2c_address
         super().__init__(i2c_instance,i2c_address)  # ← Passes i2c_address to parent
         self.i2c = i2c_instance
         self.i2c_address = i2c_address
-        self.set_state(0)
+        # Warm start restores the last output instead of forcing it off
+        self.set_state(initial_state if initial_state is not None else 0)
 
     def set_state(self, state):
         if state == 'HIGH' or state == 1:
@@ -22,19 +23,26 @@ class Relay(Control):
                 data = bytes([0x50, relay_value])
                 self.i2c.writeto(self.i2c_address, data)                
             else:
-                print("⚠️ RELAY: I2C not available, cannot set state")    
+                logger.warning("⚠️ RELAY: I2C not available, cannot set state")    
         except Exception as e:
-            print(f"❌ RELAY: Error setting state: {e}")
+            logger.error("❌ RELAY: Error setting state: %s", e)
             
+    def normalize_state(self, state):
+        if state == 'HIGH' or state == 1:
+            return 1
+        if state == 'LOW' or state == 0:
+            return 0
+        raise ValueError("Relay state must be 0/1 or LOW/HIGH")
+
     def set_i2c(self, i2c_instance):
         """Set the I2C instance for communication"""
         self.i2c = i2c_instance
 
-    def get_state(self):
-        return json.dumps({
+    def state_dict(self):
+        return {
             "isOn": bool(self.state),
             "batteryLevel": battery.getBatteryPercentage()
-        })
+        }
     
     def __del__(self):
         self.set_state(0)
\ No newline at end of file
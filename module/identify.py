@@ -0,0 +1,242 @@
+import json
+import time
+import uasyncio as asyncio
+
+FINGERPRINT_FILE = "i2c_fingerprints.json"  # Per-address identification results
+
+# Known chips, tried in order; the first whose probes all match wins. Each
+# probe reads `length` bytes from register `register` and compares them to
+# `expected` after applying `mask`; an `expected` of None means the masked
+# bytes must not all be zero, so a device that reads zeros everywhere can't
+# pass on mask checks alone. module_type is the driver the address is
+# auto-mapped to, or None for chips recognised but not supported.
+# More specific fingerprints come before looser ones sharing the same range.
+FINGERPRINTS = (
+    {
+        "chip": "BME280",
+        "module_type": None,
+        "addresses": (0x76, 0x77),
+        "probes": ((0xD0, 1, b"\xff", b"\x60"),),       # chip_id
+    },
+    {
+        "chip": "BMP280",
+        "module_type": None,
+        "addresses": (0x76, 0x77),
+        "probes": ((0xD0, 1, b"\xff", b"\x58"),),       # chip_id
+    },
+    {
+        "chip": "MCP9808",
+        "module_type": None,
+        "addresses": tuple(range(0x18, 0x20)),
+        "probes": (
+            (0x06, 2, b"\xff\xff", b"\x00\x54"),         # Manufacturer ID
+            (0x07, 2, b"\xff\x00", b"\x04\x00"),         # Device ID (revision masked)
+        ),
+    },
+    {
+        "chip": "ADS1115",
+        "module_type": None,
+        "addresses": (0x48, 0x49, 0x4A, 0x4B),
+        "probes": (
+            (0x02, 2, b"\xff\xff", b"\x80\x00"),         # Lo_thresh reset value
+            (0x03, 2, b"\xff\xff", b"\x7f\xff"),         # Hi_thresh reset value
+        ),
+    },
+    {
+        "chip": "LM75B",
+        "module_type": "TemperatureSensor",
+        "addresses": tuple(range(0x48, 0x50)),
+        "probes": (
+            (0x00, 2, b"\x00\x1f", b"\x00\x00"),         # Temp: 11-bit, low bits read 0
+            (0x00, 2, b"\xff\xe0", None),                # Temp: a live reading, not all zeros
+            (0x01, 1, b"\xe0", b"\x00"),                 # Conf: bits 7-5 always read 0
+            (0x02, 2, b"\x00\x7f", b"\x00\x00"),         # Thyst: 9-bit, low bits read 0
+            (0x03, 2, b"\x00\x7f", b"\x00\x00"),         # Tos: 9-bit, low bits read 0
+        ),
+    },
+)
+
+
+class DeviceIdentifier:
+    """Identifies unmapped I2C devices in the background.
+
+    Addresses are queued by the scan loop and probed one register read at a
+    time, within a bus-time budget, so identification never stalls the scan or
+    the sampler. Every result, including "unknown", is cached per address in
+    flash: a device is probed once, not each time it reappears. Chips with a
+    driver are mapped to it automatically."""
+
+    window_ms = 100          # Bus-time budget window
+    budget_us = 2000         # Bus time identification may use per window
+    probe_gap_ms = 5         # Pause between two probe transactions
+
+    cache = None             # "0x48" -> {"chip", "moduleType"}
+    probes = 0
+    bus_us = 0
+    _queue = []
+    _wakeup = asyncio.Event()
+    _window_start_ms = time.ticks_ms()
+    _window_used_us = 0
+    running = False
+
+    @staticmethod
+    def _key(i2c_address):
+        return f"0x{i2c_address:02x}"
+
+    @staticmethod
+    def load():
+        """Read the cache; returns the address -> module type mappings it holds"""
+        try:
+            with open(FINGERPRINT_FILE, "r") as f:
+                DeviceIdentifier.cache = json.load(f)
+        except OSError:  # File doesn't exist in MicroPython
+            DeviceIdentifier.cache = {}
+        except Exception as e:
+            print(f"Error loading I2C fingerprints: {e}")
+            DeviceIdentifier.cache = {}
+        return {
+            int(key, 16): entry["moduleType"]
+            for key, entry in DeviceIdentifier.cache.items()
+            if entry.get("moduleType")
+        }
+
+    @staticmethod
+    def _save():
+        try:
+            with open(FINGERPRINT_FILE, "w") as f:
+                json.dump(DeviceIdentifier.cache, f)
+        except Exception as e:
+            print(f"Error saving I2C fingerprints: {e}")
+
+    @staticmethod
+    def lookup(i2c_address):
+        """Cached result for an address, or None if it was never probed"""
+        if DeviceIdentifier.cache is None:
+            DeviceIdentifier.load()
+        return DeviceIdentifier.cache.get(DeviceIdentifier._key(i2c_address))
+
+    @staticmethod
+    def enqueue(i2c_address):
+        """Queue an address for probing; cached addresses are not probed again"""
+        if DeviceIdentifier.lookup(i2c_address) is not None:
+            return False
+        if i2c_address not in DeviceIdentifier._queue:
+            DeviceIdentifier._queue.append(i2c_address)
+            DeviceIdentifier._wakeup.set()
+        return True
+
+    @staticmethod
+    def forget(i2c_address=None):
+        """Drop the cached result for one address (or all) so it is probed again"""
+        if DeviceIdentifier.cache is None:
+            DeviceIdentifier.load()
+        if i2c_address is None:
+            DeviceIdentifier.cache = {}
+        else:
+            DeviceIdentifier.cache.pop(DeviceIdentifier._key(i2c_address), None)
+        DeviceIdentifier._save()
+
+    @staticmethod
+    async def _throttle():
+        """Wait for the next window once this one's bus-time budget is spent"""
+        elapsed = time.ticks_diff(time.ticks_ms(), DeviceIdentifier._window_start_ms)
+        if elapsed >= DeviceIdentifier.window_ms:
+            DeviceIdentifier._window_start_ms = time.ticks_ms()
+            DeviceIdentifier._window_used_us = 0
+        elif DeviceIdentifier._window_used_us >= DeviceIdentifier.budget_us:
+            await asyncio.sleep_ms(DeviceIdentifier.window_ms - elapsed)
+            DeviceIdentifier._window_start_ms = time.ticks_ms()
+            DeviceIdentifier._window_used_us = 0
+
+    @staticmethod
+    async def _probe(i2c, i2c_address, register, length):
+        """One register read; None if the device NAKs it"""
+        await DeviceIdentifier._throttle()
+        start = time.ticks_us()
+        try:
+            data = i2c.readfrom_mem(i2c_address, register, length)
+        except OSError:
+            data = None
+        used = time.ticks_diff(time.ticks_us(), start)
+        DeviceIdentifier._window_used_us += used
+        DeviceIdentifier.bus_us += used
+        DeviceIdentifier.probes += 1
+        await asyncio.sleep_ms(DeviceIdentifier.probe_gap_ms)
+        return data
+
+    @staticmethod
+    async def identify(i2c, i2c_address):
+        """Match an address against FINGERPRINTS; returns the entry or None.
+        Register reads are shared between fingerprints probing the same register."""
+        readings = {}
+        for fingerprint in FINGERPRINTS:
+            if i2c_address not in fingerprint["addresses"]:
+                continue
+            matched = True
+            for register, length, mask, expected in fingerprint["probes"]:
+                key = (register, length)
+                if key not in readings:
+                    readings[key] = await DeviceIdentifier._probe(i2c, i2c_address, register, length)
+                data = readings[key]
+                if data is None:
+                    matched = False
+                elif expected is None:
+                    matched = any(data[i] & mask[i] for i in range(length))
+                else:
+                    matched = all((data[i] & mask[i]) == expected[i] for i in range(length))
+                if not matched:
+                    break
+            if matched:
+                return fingerprint
+        return None
+
+    @staticmethod
+    async def run():
+        """Probe queued addresses and auto-map the ones with a driver"""
+        from module.module_manager import ModuleManager
+
+        if DeviceIdentifier.running:
+            return
+        DeviceIdentifier.running = True
+        if DeviceIdentifier.cache is None:
+            DeviceIdentifier.load()
+        while True:
+            if not DeviceIdentifier._queue:
+                DeviceIdentifier._wakeup.clear()
+                await DeviceIdentifier._wakeup.wait()
+            i2c_address = DeviceIdentifier._queue.pop(0)
+            if i2c_address not in ModuleManager.known_i2c_devices:
+                # Unplugged before its turn; nothing is cached, so it is queued again when it returns
+                continue
+            try:
+                fingerprint = await DeviceIdentifier.identify(ModuleManager.i2c, i2c_address)
+            except Exception as e:
+                print(f"🔍 Identification of 0x{i2c_address:02x} failed: {e}")
+                continue
+
+            chip = fingerprint["chip"] if fingerprint else None
+            module_type = fingerprint["module_type"] if fingerprint else None
+            DeviceIdentifier.cache[DeviceIdentifier._key(i2c_address)] = {
+                "chip": chip,
+                "moduleType": module_type,
+            }
+            DeviceIdentifier._save()
+
+            if module_type is None:
+                print(f"🔍 Device 0x{i2c_address:02x}: {chip or 'unknown'} (no driver)")
+                continue
+            print(f"🎯 Device 0x{i2c_address:02x} identified as {chip}, mapping to {module_type}")
+            ModuleManager.add_i2c_mapping(i2c_address, module_type)
+            if i2c_address in ModuleManager.known_i2c_devices:
+                await ModuleManager.create_module_by_i2c_address(i2c_address)
+
+    @staticmethod
+    def get_status():
+        return {
+            "cache": DeviceIdentifier.cache,
+            "queue": [DeviceIdentifier._key(a) for a in DeviceIdentifier._queue],
+            "probes": DeviceIdentifier.probes,
+            "busUs": DeviceIdentifier.bus_us,
+            "budgetUs": DeviceIdentifier.budget_us,
+            "windowMs": DeviceIdentifier.window_ms,
+        }
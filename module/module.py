@@ -1,11 +1,25 @@
+import json
+import struct
+
 class Module:
     def __init__(self, i2c_instance,i2c_address):
         self.state = None  # Initialize the state to None
         self.i2c_address = i2c_address   # Assign the I2C address
         self.i2c = None  # Will be set by ModuleManager
+        self.uuid = None  # Will be set by ModuleManager when registered
+        self.module_type = type(self).__name__  # Register-map drivers use their description's type
 
     def get_state(self):
-        pass
+        """State as a JSON string, as served over HTTP"""
+        return json.dumps(self.state_dict())
+
+    def state_dict(self):
+        """State as plain data, for encoders other than JSON"""
+        return {}
+
+    def pack_state(self, value=None):
+        """Compact binary state for BLE (struct-packed, little endian)"""
+        return b""
 
     def set_i2c(self, i2c_instance):
         """Set the I2C instance for communication"""
@@ -15,6 +29,14 @@ class Sensor(Module):
     def __init__(self,i2c_instance, i2c_address):
         super().__init__(i2c_instance, i2c_address)  # Call the parent class initializer
 
+    def read_value(self):
+        """Primary reading as a plain number (None if unavailable), used by the sampler"""
+        pass
+
+    def pack_state(self, value=None):
+        """Latest reading as a float32; value comes from the sampler"""
+        return struct.pack("<f", value if value is not None else 0)
+
 
 class Control(Module):
     def __init__(self, i2c_instance, i2c_address):
@@ -22,22 +44,39 @@ class Control(Module):
 
     def set_state(self, state):
         pass
+
+    def normalize_state(self, state):
+        """The value self.state would hold after set_state(state), used to skip repeated writes"""
+        return state
+
+    def pack_state(self, value=None):
+        """Output level as one byte (LED brightness 0-100, relay 0/1)"""
+        return struct.pack("<B", int(self.state or 0))
+
+    def unpack_state(self, data):
+        """Inverse of pack_state, for BLE writes"""
+        return data[0]
     
 from module.controls.led import Led
 from module.sensors.gas import GasSensor
 from module.controls.relay import Relay
 from module.sensors.temperature import TemperatureSensor
+import module.register_map as register_map
     
 class ModuleFactory:
     @staticmethod
-    def create_module(module_type,i2c_instance, i2c_address):
+    def create_module(module_type,i2c_instance, i2c_address, state=None):
+        """state is the output a control starts with (None = off); sensors ignore it"""
         if module_type.lower() == Led.__name__.lower():
-            return Led(i2c_instance, i2c_address)
+            return Led(i2c_instance, i2c_address, state)
         elif module_type.lower() == GasSensor.__name__.lower():
             return GasSensor(i2c_instance, i2c_address)
         elif module_type.lower() == Relay.__name__.lower():
-            return Relay(i2c_instance, i2c_address)
+            return Relay(i2c_instance, i2c_address, state)
         elif module_type.lower() == TemperatureSensor.__name__.lower():
             return TemperatureSensor(i2c_instance, i2c_address)
-        else:
-            raise ValueError("Invalid module type")
\ No newline at end of file
+        
+        description = register_map.get(module_type)
+        if description is not None:
+            return description.create(i2c_instance, i2c_address, state)
+        raise ValueError("Invalid module type")
\ No newline at end of file
@@ -5,7 +5,18 @@ import os
 import uasyncio as asyncio
 from machine import I2C, Pin
 import wifi.wifi_connect as wifi_connect
+from wifi.link_manager import LinkManager
 from module.module import Control, ModuleFactory
+from utils.health import HealthMonitor
+import utils.logger as logger
+import utils.calibration as calibration
+import utils.cbor as cbor
+from utils.power import PowerManager
+from utils.bus import LockedI2C
+from utils.snapshot import Snapshot
+from module.identify import DeviceIdentifier
+import module.register_map as register_map
+from utils.transitions import TransitionEngine
 
 def generate_uuid():
     # Generate a pseudo-random 16-character hexadecimal string
@@ -30,18 +41,42 @@ class ModuleManager:
     known_i2c_devices = set()
     scan_interval = 1.0  # Scan every 1 second
     i2c_initialized = False
+    i2c_config = (5, 4, 100000)  # (scl_pin, sda_pin, freq) of the last initialization
+
+    # Encoding of the central refresh; cbor.CONTENT_TYPE once the central accepts it
+    central_content_type = "application/json"
+
+    # Set when the module list changed since the central last heard of it.
+    # The refresh itself runs in run_central_sync(), never under _lock.
+    central_dirty = False
+    _central_changed = asyncio.Event()
 
     @staticmethod
     def initialize_i2c(scl_pin=5, sda_pin=4, freq=100000):
         """Initialize I2C interface for device detection"""
+        ModuleManager.i2c_config = (scl_pin, sda_pin, freq)
         try:
-            ModuleManager.i2c = I2C(0, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=freq)
+            if ModuleManager.i2c is None:
+                # Shared with core 1: every transaction goes through the bus lock
+                ModuleManager.i2c = LockedI2C(I2C(0, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=freq))
+            else:
+                # Swap the bus object inside the wrapper so modules holding it keep working
+                with ModuleManager.i2c:
+                    ModuleManager.i2c.i2c = I2C(0, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=freq)
             ModuleManager.i2c_initialized = True
             print(f"I2C initialized: SCL={scl_pin}, SDA={sda_pin}, Freq={freq}Hz")
         except Exception as e:
             print(f"Failed to initialize I2C: {e}")
             ModuleManager.i2c_initialized = False
 
+    @staticmethod
+    def reinitialize_i2c():
+        """Re-apply the last I2C configuration, e.g. after a CPU clock change.
+        The rp2 I2C object is reconfigured in place, so modules keep working."""
+        if ModuleManager.i2c_initialized:
+            scl_pin, sda_pin, freq = ModuleManager.i2c_config
+            ModuleManager.initialize_i2c(scl_pin, sda_pin, freq)
+
     @staticmethod
     async def detect_i2c_modules():
         """Continuously scan for I2C devices and manage modules"""
@@ -52,6 +87,11 @@ class ModuleManager:
             print("❌ I2C not initialized, cannot detect modules")
             return
             
+        # Chips identified on earlier boots map straight to their drivers
+        for i2c_address, module_type in DeviceIdentifier.load().items():
+            if i2c_address not in ModuleManager.i2c_module_mapping:
+                ModuleManager.i2c_module_mapping[i2c_address] = module_type
+            
         print("🚀 Starting I2C module detection...")
         
         while True:
@@ -59,22 +99,26 @@ class ModuleManager:
                 # Scan I2C bus
                 current_devices = set(ModuleManager.i2c.scan())
                 
-                # Handle newly connected devices
                 new_devices = current_devices - ModuleManager.known_i2c_devices
+                removed_devices = ModuleManager.known_i2c_devices - current_devices
+                # Update known devices before any handler yields, so the identifier
+                # never sees an address it was just handed as already gone
+                ModuleManager.known_i2c_devices = current_devices
+
+                # Handle newly connected devices
                 if new_devices:
                     for address in new_devices:
                         print(f"🔌 New I2C device detected at address 0x{address:02x}")
                         await ModuleManager._handle_new_i2c_device(address)
                 
                 # Handle disconnected devices
-                removed_devices = ModuleManager.known_i2c_devices - current_devices
                 if removed_devices:
                     for address in removed_devices:
                         print(f"🔌 I2C device disconnected at address 0x{address:02x}")
                         await ModuleManager._handle_removed_i2c_device(address)
                 
-                # Update known devices
-                ModuleManager.known_i2c_devices = current_devices
+                if new_devices or removed_devices:
+                    PowerManager.note_bus_activity()
                 
                 # Debug info (only print if devices changed)
                 if new_devices or removed_devices:
@@ -101,8 +145,12 @@ class ModuleManager:
                 print(f"✅ Creating {module_type} module for I2C address 0x{i2c_address:02x}")
                 await ModuleManager.create_module_by_i2c_address(i2c_address)
             else:
-                print(f"⚠️  Unknown I2C device at 0x{i2c_address:02x} - no module mapping found")
-                await ModuleManager._try_identify_i2c_device(i2c_address)
+                cached = DeviceIdentifier.lookup(i2c_address)
+                if cached is None:
+                    print(f"⚠️  Unknown I2C device at 0x{i2c_address:02x} - queued for identification")
+                    DeviceIdentifier.enqueue(i2c_address)
+                else:
+                    print(f"⚠️  Unmapped I2C device at 0x{i2c_address:02x} ({cached['chip'] or 'unknown'}, cached)")
                 
         except Exception as e:
             print(f"❌ Error handling new I2C device 0x{i2c_address:02x}: {e}")
@@ -116,46 +164,6 @@ class ModuleManager:
         except Exception as e:
             print(f"❌ Error removing I2C device 0x{i2c_address:02x}: {e}")
 
-    @staticmethod
-    async def _try_identify_i2c_device(i2c_address):
-        """Attempt to identify unknown I2C device"""
-        try:
-            # Try to read a few bytes to see if device responds
-            test_data = ModuleManager.i2c.readfrom(i2c_address, 1)
-            print(f"🔍 Device 0x{i2c_address:02x} responded with: {test_data.hex()}")
-            
-            # Check common device patterns
-            await ModuleManager._check_common_device_patterns(i2c_address)
-            
-        except Exception as e:
-            print(f"🔍 Device 0x{i2c_address:02x} identification failed: {e}")
-
-    @staticmethod
-    async def _check_common_device_patterns(i2c_address):
-        """Check for common I2C device patterns to auto-identify"""
-        try:
-            # Common device ID registers to check
-            id_registers = [0x00, 0x0F, 0xFC, 0xFD, 0xFE, 0xFF]
-            
-            for reg in id_registers:
-                try:
-                    # Write register address and read response
-                    ModuleManager.i2c.writeto(i2c_address, bytes([reg]))
-                    response = ModuleManager.i2c.readfrom(i2c_address, 1)
-                    print(f"🔍 Device 0x{i2c_address:02x} register 0x{reg:02x}: 0x{response[0]:02x}")
-                    
-                    # Add device identification logic here
-                    if i2c_address == 0x48 and reg == 0x00:
-                        print(f"🎯 Possibly a temperature sensor (common at 0x48)")
-                    elif i2c_address in [0x20, 0x21, 0x22, 0x23] and reg == 0x00:
-                        print(f"🎯 Possibly an I/O expander or LED controller")
-                        
-                except:
-                    continue  # Register not readable, try next
-                    
-        except Exception as e:
-            print(f"🔍 Pattern check failed for 0x{i2c_address:02x}: {e}")
-
     @staticmethod
     def set_i2c_scan_interval(interval):
         """Set the I2C scan interval in seconds"""
@@ -250,27 +258,26 @@ class ModuleManager:
             return uuid
         
     @staticmethod
-    async def save_modules():
-        """Save active modules to file"""
-        print("Saving modules to file...")  # Debug
+    def save_modules():
+        """Save active modules to file and flag the central as out of date"""
+        logger.debug("Saving modules to file...")
         try:
             registry = ModuleManager._load_module_registry()
             
             # Update active modules list
             active_modules = []
             for uuid, module in ModuleManager.modules.items():
-                print(f"Saving module: UUID={uuid}, Type={type(module).__name__}, I2C=0x{module.i2c_address:02x}")  # Debug
+                logger.debug("Saving module: UUID=%s, Type=%s, I2C=0x%02x", uuid, module.module_type, module.i2c_address)
                 active_modules.append({
                     "uuid": uuid,
-                    "module_type": type(module).__name__,
+                    "module_type": module.module_type,
                     "i2c_address": module.i2c_address
                 })
             
             registry["active_modules"] = active_modules
             ModuleManager._save_module_registry(registry)
-            
-            central_ip = ModuleManager.get_central_ip()
-            await ModuleManager.refresh_modules_of_server(central_ip, 5002, "/rasberry/Peripheral/refreshPeripherals", ModuleManager.modules)
+            Snapshot.mark_dirty()
+            ModuleManager.mark_central_dirty()
         except Exception as e:
             print(f"Error saving modules: {e}")
             
@@ -280,82 +287,130 @@ class ModuleManager:
             return json.load(f).get("central_ip")
 
     @staticmethod
-    async def load_modules():
-        """Load modules from a JSON file."""
+    async def load_modules(refresh_central=True):
+        """Rebuild the module table at boot, from the warm-start snapshot when
+        there is one (controls get their last outputs back), else from the
+        registry. With refresh_central the central is only flagged out of date;
+        run_central_sync() sends the list once it runs, so loading never waits
+        for WiFi."""
         with ModuleManager._lock:
             try:
-                registry = ModuleManager._load_module_registry()
-                active_modules = registry.get("active_modules", [])
+                snapshot = Snapshot.load()
+                if snapshot:
+                    entries = snapshot["modules"]
+                    calibrations = snapshot.get("calibration", {})
+                else:
+                    registry = ModuleManager._load_module_registry()
+                    entries = [
+                        [info["uuid"], info["module_type"], info["i2c_address"], None]
+                        for info in registry.get("active_modules", [])
+                    ]
+                    calibrations = None
                 
-                if not active_modules:
+                if not entries:
                     print("No modules to load from file")
                     return
                 
-                for module_info in active_modules:
-                    uuid = module_info["uuid"]
-                    module_type = module_info["module_type"]
-                    i2c_address = module_info["i2c_address"]
-
+                for uuid, module_type, i2c_address, state in entries:
                     try:
-                        module = ModuleFactory.create_module(module_type, i2c_address)
-                        module.set_i2c(ModuleManager.i2c)
+                        module = ModuleFactory.create_module(module_type, ModuleManager.i2c, i2c_address, state)
                         
+                        module.uuid = uuid
                         ModuleManager.modules[uuid] = module
-                        print(f"Loaded module: UUID={uuid}, Type={module_type}, I2C=0x{i2c_address:02x}")
+                        ModuleManager._restore_calibration(uuid, module, calibrations.get(uuid) if calibrations is not None else None)
+                        # Already live: the first scan only reports real changes
+                        ModuleManager.known_i2c_devices.add(i2c_address)
+                        print(f"Loaded module: UUID={uuid}, Type={module_type}, I2C=0x{i2c_address:02x}, State={state}")
                                             
                     except Exception as e:
                         print(f"Error creating module {module_type} at I2C 0x{i2c_address:02x}: {e}")
                         continue
                     
-                central_ip = ModuleManager.get_central_ip()
-                await ModuleManager.refresh_modules_of_server(central_ip, 5002, "/rasberry/Peripheral/refreshPeripherals", ModuleManager.modules)
+                if refresh_central:
+                    ModuleManager.mark_central_dirty()
             except Exception as e:
                 print(f"Error loading modules: {e}")
                 
+    @staticmethod
+    def mark_central_dirty():
+        """The module list changed; run_central_sync() tells the central"""
+        ModuleManager.central_dirty = True
+        ModuleManager._central_changed.set()
+
+    @staticmethod
+    async def run_central_sync():
+        """Refresh the central whenever the module list changed. Started after
+        bind(), so changes detected while WiFi was still associating go out then;
+        a refresh that finds the link down is left to the link manager."""
+        while True:
+            ModuleManager._central_changed.clear()
+            if ModuleManager.central_dirty and LinkManager.is_up():
+                try:
+                    await ModuleManager.refresh_central()
+                except Exception as e:
+                    print(f"⚠️ Central refresh failed: {e}")
+            await ModuleManager._central_changed.wait()
+
+    @staticmethod
+    async def refresh_central():
+        """Send the current module list to the central server.
+        Does blocking network I/O: never call it while holding _lock."""
+        ModuleManager.central_dirty = False
+        central_ip = ModuleManager.get_central_ip()
+        return await ModuleManager.refresh_modules_of_server(central_ip, 5002, "/rasberry/Peripheral/refreshPeripherals", ModuleManager.modules)
+
+    @staticmethod
+    def central_payload(data):
+        """The module list as sent to the central, before encoding"""
+        ip_address = wifi_connect.get_ip_address() + ":8080"
+        return [
+            {
+                "PeripheralType": module.module_type,
+                "Uuid": uuid,
+                "Url": ip_address
+            }
+            for uuid, module in data.items()
+        ]
+
     @staticmethod     
     async def refresh_modules_of_server(host, port, endpoint, data, retry_count=0, max_retries=3):
         """Sends an HTTP POST request using MicroPython's socket module with retry logic."""
         try:
-            # Convert data to JSON string
-            ip_address = wifi_connect.get_ip_address() + ":8080"
-            json_data = [
-                {
-                    "PeripheralType": type(module).__name__,
-                    "Uuid": uuid,
-                    "Url": ip_address
-                }
-                for uuid, module in data.items()
-            ]
-
-            print(f"Sending POST request to {host}:{port}{endpoint} with data: {json_data}")  # Debug
-
-            json_data = json.dumps(json_data)
-                            
-            # Create a socket connection
-            addr = socket.getaddrinfo(host, port)[0][-1]
-            s = socket.socket()
-            s.connect(addr)
+            peripherals = ModuleManager.central_payload(data)
+
+            logger.debug("Sending POST request to %s:%s%s with data: %s", host, port, endpoint, peripherals)
 
+            content_type = ModuleManager.central_content_type
+            if content_type == cbor.CONTENT_TYPE:
+                body = cbor.dumps(peripherals)
+            else:
+                body = json.dumps(peripherals).encode()
+                            
             # Prepare HTTP headers and body
             request = (
                 f"POST {endpoint} HTTP/1.1\r\n"
                 f"Host: {host}\r\n"
                 "Accept: */*\r\n"
-                "Content-Type: application/json\r\n"
-                f"Content-Length: {len(json_data)}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
                 "Connection: close\r\n"
                 "\r\n"
-                f"{json_data}"
             )
 
-            # Send request
-            s.send(request.encode())
+            with HealthMonitor.blocking("central_refresh"):
+                # Create a socket connection
+                addr = socket.getaddrinfo(host, port)[0][-1]
+                s = socket.socket()
+                s.connect(addr)
+
+                # Send request
+                s.send(request.encode() + body)
 
-            # Read the response
-            response = s.recv(1024).decode()
+                # Read the response
+                response = s.recv(1024).decode()
 
-            # Close the socket
-            s.close()
+                # Close the socket
+                s.close()
             
             # Reset retry count on success
             return True
@@ -368,6 +423,11 @@ class ModuleManager:
                 print(f"Retrying in 2 seconds...")
                 await asyncio.sleep(2)  # Wait before retry
                 return await ModuleManager.refresh_modules_of_server(host, port, endpoint, data, retry_count + 1, max_retries)
+            elif not LinkManager.is_up():
+                # The AP is gone, not the central: the link manager refreshes
+                # again once it has reconnected, so keep credentials and run on
+                print("⚠️ WiFi link is down, central refresh postponed until it is back")
+                return False
             else:
                 # Max retries reached - delete wifi credentials and restart
                 print(f"❌ Max retries ({max_retries}) reached. Deleting wifi_credentials.json and restarting...")
@@ -410,10 +470,12 @@ class ModuleManager:
 
                 # Get or create UUID for this module type and I2C address
                 uuid = ModuleManager._get_or_create_uuid(module_type, i2c_address)
+                module.uuid = uuid
                 ModuleManager.modules[uuid] = module
+                ModuleManager._restore_calibration(uuid, module)
                 
                 print(f"Created module: {module_type} at I2C address 0x{i2c_address:02x} with UUID {uuid}")
-                await ModuleManager.save_modules()
+                ModuleManager.save_modules()
                 
             except Exception as e:
                 print(f"Error creating module for I2C address 0x{i2c_address:02x}: {e}")
@@ -441,14 +503,15 @@ class ModuleManager:
                         print(f"No available I2C address found for module type {module_type}")
                         return None
                 
-                module = ModuleFactory.create_module(module_type, i2c_address)
-                module.set_i2c(ModuleManager.i2c)
+                module = ModuleFactory.create_module(module_type, ModuleManager.i2c, i2c_address)
                 
                 # Get or create UUID for this module type and I2C address
                 uuid = ModuleManager._get_or_create_uuid(module_type, i2c_address)
+                module.uuid = uuid
                 ModuleManager.modules[uuid] = module
+                ModuleManager._restore_calibration(uuid, module)
                 
-                await ModuleManager.save_modules()
+                ModuleManager.save_modules()
                 return module
             except Exception as e:
                 print(f"Error creating module {module_type}: {e}")
@@ -464,7 +527,7 @@ class ModuleManager:
                     module.__del__()
                 except:
                     pass
-                await ModuleManager.save_modules()
+                ModuleManager.save_modules()
                 
     @staticmethod
     async def remove_module_by_i2c_address(i2c_address):
@@ -478,7 +541,7 @@ class ModuleManager:
                     except:
                         pass
                     print(f"Removed module at I2C address 0x{i2c_address:02x}")
-                    await ModuleManager.save_modules()
+                    ModuleManager.save_modules()
                     break
 
     @staticmethod
@@ -502,16 +565,154 @@ class ModuleManager:
                 return module.get_state()
             return {"error": "Module not found"}
 
+    @staticmethod
+    def get_module_state_data(uuid):
+        """State of a module as plain data, for encoders other than JSON."""
+        with ModuleManager._lock:
+            module = ModuleManager.modules.get(uuid)
+            if module:
+                return module.state_dict()
+            return {"error": "Module not found"}
+
+    @staticmethod
+    def get_all_module_states():
+        """State data of every module by UUID, for bulk reads."""
+        with ModuleManager._lock:
+            return {uuid: module.state_dict() for uuid, module in ModuleManager.modules.items()}
+
     @staticmethod
     def set_module_state(uuid, state):
-        """Set the state of a module by UUID."""
+        """Set the state of a module by UUID. A new command replaces any running
+        transition or schedule on that control."""
+        TransitionEngine.cancel(uuid)
+        return ModuleManager.apply_module_state(uuid, state)
+
+    @staticmethod
+    def apply_module_state(uuid, state):
+        """Set the state without touching transitions (used by the command queue)."""
         with ModuleManager._lock:
             module = ModuleManager.modules.get(uuid)
             if module and isinstance(module, Control):
+                PowerManager.note_bus_activity()
                 module.set_state(state)
+                Snapshot.mark_dirty()
                 return {"new_state": state}
             return {"error": "Invalid module or module does not support state changes"}
 
+    @staticmethod
+    def configure_module_sampling(uuid, settings):
+        """Change the oversampling/filter settings of a sensor by UUID."""
+        with ModuleManager._lock:
+            module = ModuleManager.modules.get(uuid)
+            if module and hasattr(module, "configure_sampling"):
+                try:
+                    return module.configure_sampling(
+                        settings.get("samples"),
+                        settings.get("filter"),
+                        settings.get("emaAlpha")
+                    )
+                except ValueError as e:
+                    return {"error": str(e)}
+            return {"error": "Invalid module or module does not support sampling configuration"}
+
+    @staticmethod
+    def configure_module_alert(uuid, settings):
+        """Program hardware threshold alerts on a sensor by UUID."""
+        module = ModuleManager.get_module(uuid)
+        if not module or not hasattr(module, "configure_alert"):
+            return {"error": "Invalid module or module does not support alerts"}
+        try:
+            return module.configure_alert(
+                settings["tos"],
+                settings["thyst"],
+                settings.get("osPin"),
+                settings.get("mode", "comparator"),
+                bool(settings.get("activeHigh", False)),
+                int(settings.get("faultQueue", 1))
+            )
+        except KeyError as e:
+            return {"error": f"Missing field {e}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    @staticmethod
+    def set_module_low_power(uuid, enabled):
+        """Enable or disable shutdown-between-samples on a sensor by UUID."""
+        module = ModuleManager.get_module(uuid)
+        if not module or not hasattr(module, "set_low_power"):
+            return {"error": "Invalid module or module does not support low power mode"}
+        try:
+            return module.set_low_power(enabled)
+        except Exception as e:
+            return {"error": str(e)}
+
+    @staticmethod
+    def _temperature_source(temperature_uuid):
+        """Callable resolving a temperature sensor lazily, since it may appear after the gas sensor"""
+        return lambda: ModuleManager.modules.get(temperature_uuid)
+
+    @staticmethod
+    def _restore_calibration(uuid, module, data=None):
+        """Apply persisted calibration (or the snapshot's copy) to a freshly created module"""
+        if not hasattr(module, "set_calibration"):
+            return
+        data = data or calibration.get(uuid)
+        if not data:
+            return
+        try:
+            module.set_calibration(data["Ro"], data.get("compensationTempC"))
+            temperature_uuid = data.get("temperatureUuid")
+            if temperature_uuid:
+                module.set_temperature_source(ModuleManager._temperature_source(temperature_uuid))
+            print(f"🎚️ Restored calibration for {uuid}: Ro={data['Ro']}")
+        except Exception as e:
+            print(f"Error restoring calibration for {uuid}: {e}")
+
+    @staticmethod
+    async def calibrate_module(uuid, bursts=20, temperature_uuid=None):
+        """Run clean-air calibration on a sensor and persist the result by UUID."""
+        module = ModuleManager.get_module(uuid)
+        if not module or not hasattr(module, "calibrate"):
+            return {"error": "Invalid module or module does not support calibration"}
+
+        stored = calibration.get(uuid) or {}
+        temperature_uuid = temperature_uuid or stored.get("temperatureUuid")
+        if temperature_uuid:
+            module.set_temperature_source(ModuleManager._temperature_source(temperature_uuid))
+
+        try:
+            result = await module.calibrate(bursts)
+        except Exception as e:
+            return {"error": f"Calibration failed: {e}"}
+
+        calibration.save(uuid, {
+            "Ro": result["Ro"],
+            "compensationTempC": result["compensationTempC"],
+            "temperatureUuid": temperature_uuid
+        })
+        Snapshot.mark_dirty()
+        return result
+
+    @staticmethod
+    def get_module_calibration(uuid):
+        """Return the active calibration of a sensor by UUID."""
+        module = ModuleManager.get_module(uuid)
+        if module and hasattr(module, "get_calibration"):
+            return module.get_calibration()
+        return {"error": "Invalid module or module does not support calibration"}
+
+    @staticmethod
+    def load_device_descriptions():
+        """Compile the JSON device descriptions and map their addresses.
+        Built-in mappings win over descriptions claiming the same address."""
+        for description in register_map.load_descriptions().values():
+            for i2c_address in description.addresses:
+                current = ModuleManager.i2c_module_mapping.get(i2c_address)
+                if current is None:
+                    ModuleManager.i2c_module_mapping[i2c_address] = description.type
+                elif current != description.type:
+                    print(f"⚠️ 0x{i2c_address:02x} already mapped to {current}, ignoring {description.type}")
+
     @staticmethod
     def add_i2c_mapping(i2c_address, module_type):
         """Add a new I2C address to module type mapping."""
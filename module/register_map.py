@@ -0,0 +1,263 @@
+# Generic I2C drivers built from JSON device descriptions.
+#
+# Every *.json file in DEVICES_DIR describes one module type; new sensor and
+# control boards need only a description, no firmware change:
+#
+#   {
+#     "type": "HumiditySensor",
+#     "kind": "sensor",                     # "sensor" or "control"
+#     "addresses": ["0x40"],                # Auto-mapped I2C addresses
+#     "init": [["0x01", "0x00"]],           # Raw writes after creation (optional)
+#     "registers": {
+#       "humidity":     {"reg": "0x00", "width": 16, "scale": 0.01},
+#       "temperatureC": {"reg": "0x02", "width": 16, "signed": true, "shift": 4, "scale": 0.0625}
+#     },
+#     "value": "humidity"                   # Register the sampler records
+#   }
+#
+# Register fields: reg (pointer written before the read) or command (bytes
+# written before the read, e.g. ["0x40"], sent once), width 8/16/32, signed,
+# endian "big"/"little", skip (stale leading bytes), shift (right shift of the
+# raw value), scale and offset (value = raw * scale + offset).
+#
+# Controls describe their output instead of a value register:
+#
+#   "command": {"prefix": ["0x50"], "width": 8, "scale": 2.55, "min": 0, "max": 100},
+#   "stateKey": "brightness"
+#
+# set_state(v) clamps v to [min, max] and writes prefix + int(v * scale + offset).
+#
+# Descriptions are compiled once into struct formats and preallocated buffers,
+# so a read is one bus transaction, one unpack_from and one multiply-add.
+
+import json
+import os
+import struct
+from module.module import Sensor, Control
+import utils.battery as battery
+import utils.logger as logger
+
+DEVICES_DIR = "devices"
+
+_KIND_SENSOR = "sensor"
+_KIND_CONTROL = "control"
+
+_FORMATS = {8: "B", 16: "H", 32: "I"}
+
+# type name -> DeviceDescription
+descriptions = {}
+
+
+def _byte(value):
+    """Accept 64 or "0x40" in descriptions"""
+    if isinstance(value, str):
+        value = int(value, 0)
+    if not 0 <= value <= 0xFF:
+        raise ValueError(f"byte out of range: {value}")
+    return value
+
+
+def _struct_format(spec):
+    width = spec.get("width", 8)
+    if width not in _FORMATS:
+        raise ValueError(f"unsupported width {width}")
+    code = _FORMATS[width]
+    if spec.get("signed", False):
+        code = code.lower()
+    return (">" if spec.get("endian", "big") == "big" else "<") + code
+
+
+class _Register:
+    """Compiled register: where to read and how to turn the bytes into a value"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.reg = _byte(spec["reg"]) if "reg" in spec else None
+        self.command = bytes(_byte(b) for b in spec["command"]) if "command" in spec else None
+        if self.reg is None and self.command is None:
+            raise ValueError(f"register {name} needs 'reg' or 'command'")
+        self.format = _struct_format(spec)
+        self.skip = spec.get("skip", 0)
+        self.buffer = bytearray(self.skip + struct.calcsize(self.format))
+        self.shift = spec.get("shift", 0)
+        self.scale = spec.get("scale", 1)
+        self.offset = spec.get("offset", 0)
+
+    def read(self, i2c, i2c_address, command_sent):
+        """Read and decode; command_sent tells whether the command byte is still
+        latched in the device (it is only written once)"""
+        buffer = self.buffer
+        if self.reg is not None:
+            i2c.readfrom_mem_into(i2c_address, self.reg, buffer)
+        else:
+            if not command_sent:
+                i2c.writeto(i2c_address, self.command)
+            i2c.readfrom_into(i2c_address, buffer)
+        raw = struct.unpack_from(self.format, buffer, self.skip)[0]
+        if self.shift:
+            raw >>= self.shift
+        return raw * self.scale + self.offset
+
+
+class _Command:
+    """Compiled control output: prefix bytes followed by the encoded value"""
+
+    def __init__(self, spec):
+        self.prefix = bytes(_byte(b) for b in spec.get("prefix", ()))
+        self.format = _struct_format(spec)
+        self.buffer = bytearray(len(self.prefix) + struct.calcsize(self.format))
+        self.buffer[0:len(self.prefix)] = self.prefix
+        self.scale = spec.get("scale", 1)
+        self.offset = spec.get("offset", 0)
+        self.min = spec.get("min", 0)
+        self.max = spec.get("max", 1)
+
+    def encode(self, value):
+        """Clamp and pack into the preallocated buffer; returns (state, buffer)"""
+        value = max(self.min, min(self.max, value))
+        struct.pack_into(self.format, self.buffer, len(self.prefix), int(value * self.scale + self.offset))
+        return value, self.buffer
+
+
+class DeviceDescription:
+    """A validated, compiled device description"""
+
+    def __init__(self, data):
+        self.type = data["type"]
+        self.kind = data.get("kind", _KIND_SENSOR)
+        if self.kind not in (_KIND_SENSOR, _KIND_CONTROL):
+            raise ValueError(f"unknown kind {self.kind}")
+        self.addresses = [_byte(a) for a in data.get("addresses", ())]
+        self.init = [bytes(_byte(b) for b in write) for write in data.get("init", ())]
+        self.registers = [_Register(name, spec) for name, spec in data.get("registers", {}).items()]
+        self.value = None
+        if self.kind == _KIND_SENSOR:
+            value_name = data.get("value", self.registers[0].name if self.registers else None)
+            for register in self.registers:
+                if register.name == value_name:
+                    self.value = register
+            if self.value is None:
+                raise ValueError("sensor needs a 'value' register")
+            self.command = None
+        else:
+            self.command = _Command(data["command"])
+            self.state_key = data.get("stateKey", "state")
+
+    def create(self, i2c_instance, i2c_address, state=None):
+        if self.kind == _KIND_SENSOR:
+            return RegisterMapSensor(self, i2c_instance, i2c_address)
+        return RegisterMapControl(self, i2c_instance, i2c_address, state)
+
+
+class RegisterMapSensor(Sensor):
+    def __init__(self, description, i2c_instance, i2c_address):
+        super().__init__(i2c_instance, i2c_address)
+        self.description = description
+        self.module_type = description.type
+        self.i2c = i2c_instance
+        self.i2c_address = i2c_address
+        self._command_sent = None   # Last command byte written to the device
+        _write_init(self)
+
+    def _read(self, register):
+        sent = self._command_sent is not None and self._command_sent == register.command
+        try:
+            value = register.read(self.i2c, self.i2c_address, sent)
+        except Exception:
+            self._command_sent = None
+            raise
+        self._command_sent = register.command
+        return value
+
+    def read_value(self):
+        if not self.i2c or self.i2c_address is None:
+            return None
+        with self.i2c:
+            return self._read(self.description.value)
+
+    def read_all(self):
+        """Every register in one bus-lock hold, as {name: value}"""
+        with self.i2c:
+            return {register.name: self._read(register) for register in self.description.registers}
+
+    def state_dict(self):
+        try:
+            if self.i2c and self.i2c_address is not None:
+                values = self.read_all()
+                logger.debug("%s: Read %s from I2C address 0x%02X", self.module_type, values, self.i2c_address)
+            else:
+                logger.warning("⚠️ %s: I2C not available, cannot read value", self.module_type)
+                values = {register.name: 0 for register in self.description.registers}
+            state = {name: round(value, 2) for name, value in values.items()}
+            state["batteryLevel"] = battery.getBatteryPercentage()
+            return state
+        except Exception as e:
+            logger.error("❌ %s: Error reading state: %s", self.module_type, e)
+            return {"error": str(e)}
+
+
+class RegisterMapControl(Control):
+    def __init__(self, description, i2c_instance, i2c_address, initial_state=None):
+        super().__init__(i2c_instance, i2c_address)
+        self.description = description
+        self.module_type = description.type
+        self.i2c = i2c_instance
+        self.i2c_address = i2c_address
+        _write_init(self)
+        self.set_state(initial_state if initial_state is not None else description.command.min)
+
+    def set_state(self, state):
+        try:
+            state, data = self.description.command.encode(float(state))
+            self.state = state
+            if self.i2c and self.i2c_address is not None:
+                self.i2c.writeto(self.i2c_address, data)
+            else:
+                logger.warning("⚠️ %s: I2C not available, cannot set state", self.module_type)
+        except Exception as e:
+            logger.error("❌ %s: Error setting state: %s", self.module_type, e)
+
+    def normalize_state(self, state):
+        command = self.description.command
+        return max(command.min, min(command.max, float(state)))
+
+    def state_dict(self):
+        return {
+            self.description.state_key: self.state,
+            "batteryLevel": battery.getBatteryPercentage()
+        }
+
+
+def _write_init(module):
+    if not module.i2c or module.i2c_address is None:
+        return
+    try:
+        for data in module.description.init:
+            module.i2c.writeto(module.i2c_address, data)
+    except Exception as e:
+        logger.error("❌ %s: Init writes failed: %s", module.module_type, e)
+
+
+def load_descriptions(directory=DEVICES_DIR):
+    """Compile every description in the directory; bad files are reported and skipped.
+    Returns {type name: DeviceDescription}."""
+    try:
+        names = os.listdir(directory)
+    except OSError:  # No devices directory
+        return descriptions
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(f"{directory}/{name}", "r") as f:
+                description = DeviceDescription(json.load(f))
+            descriptions[description.type.lower()] = description
+            print(f"📄 Loaded device description {description.type} from {name}")
+        except Exception as e:
+            print(f"❌ Invalid device description {name}: {e}")
+    return descriptions
+
+
+def get(module_type):
+    """Description for a module type name, or None"""
+    return descriptions.get(module_type.lower())
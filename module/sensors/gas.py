@@ -1,78 +1,287 @@
 from module.module import Sensor
-import json
 import utils.battery as battery
 import math
+import time
+import array
+import uasyncio as asyncio
+import utils.logger as logger
+
+# PCF8591 control byte: channel 0, DAC off
+_CONTROL_BYTE = 0x40
+_VOLTS_PER_COUNT = 3.3 / 255.0
+
+# MQ-5 datasheet: Rs/Ro in clean air is about 6.5
+_CLEAN_AIR_RATIO = 6.5
+
+# Temperature compensation (MQ-5 Rs/Ro vs temperature, normalised to 20°C)
+_REFERENCE_TEMP_C = 20.0
+_TEMP_COEFFICIENT = -0.0035  # Relative change of Rs/Ro per °C
+_TEMP_REFRESH_MS = 30000     # How often the co-located temperature is read
 
 class GasSensor(Sensor):
+    # Burst filter modes
+    FILTER_NONE = "none"      # Use the latest conversion of the burst
+    FILTER_MEAN = "mean"      # Average all conversions of the burst
+    FILTER_MEDIAN = "median"  # Median of the burst (rejects spikes)
+
     def __init__(self, i2c_instance, i2c_address):
         super().__init__(i2c_instance, i2c_address)
         self.i2c = i2c_instance
         self.i2c_address = i2c_address
-        
+
         # MQ-5 sensor parameters for butane (lighter gas) detection
         self.RL = 10.0  # Load resistance in kOhms
-        self.Ro = 6.5   # Pre-calibrated resistance for butane in clean air
+        self.Ro = 6.5   # Resistance in clean air, replaced by calibrate()
         self.a = 3616.1 # Curve fitting parameter a for butane
         self.b = -2.675 # Curve fitting parameter b for butane
 
-    def get_state(self):
-        """Read gas sensor value and return butane PPM as JSON"""
+        # Oversampling: several conversions fetched in one readfrom burst
+        self.samples_per_read = 8
+        self.filter_mode = GasSensor.FILTER_MEDIAN
+        self.ema_alpha = 0.3      # 1.0 disables the EMA
+        self._ema_adc = None      # Filtered ADC value (float)
+        self._last_adc = 0        # Latest single conversion
+        self._burst = bytearray(self.samples_per_read + 1)
+        self._control_written = False
+
+        # Temperature compensation: callable returning a TemperatureSensor (or None)
+        self.temperature_source = None
+        self._compensation_temp = None
+        self._last_temp_ms = None
+
+        # 256-entry ADC -> PPM table, rebuilt only when calibration changes
+        self._lut = array.array("f", bytearray(4 * 256))
+        self.build_lut()
+
+    @staticmethod
+    def _temperature_factor(temperature_c):
+        """Rs/Ro at temperature_c relative to Rs/Ro at the reference temperature"""
+        if temperature_c is None:
+            return 1.0
+        return 1.0 + _TEMP_COEFFICIENT * (temperature_c - _REFERENCE_TEMP_C)
+
+    def build_lut(self):
+        """Precompute PPM for every 8-bit ADC value with the current Ro and temperature"""
+        factor = GasSensor._temperature_factor(self._compensation_temp)
+        for adc_value in range(256):
+            self._lut[adc_value] = self._compute_ppm(adc_value, factor)
+        logger.debug("GasSensor: PPM table rebuilt (Ro=%.3f, factor=%.3f)", self.Ro, factor)
+
+    def set_calibration(self, Ro, temperature_c=None):
+        """Apply a clean-air resistance (and optional compensation temperature)"""
+        Ro = float(Ro)
+        if Ro <= 0:
+            raise ValueError("Ro must be positive")
+        self.Ro = Ro
+        if temperature_c is not None:
+            self._compensation_temp = round(temperature_c)
+        self.build_lut()
+
+    def get_calibration(self):
+        return {
+            "Ro": self.Ro,
+            "compensationTempC": self._compensation_temp,
+            "temperatureCompensation": self.temperature_source is not None
+        }
+
+    def set_temperature_source(self, source):
+        """Enable temperature compensation from a callable returning a TemperatureSensor"""
+        self.temperature_source = source
+        self._last_temp_ms = None
+        if source is None and self._compensation_temp is not None:
+            self._compensation_temp = None
+            self.build_lut()
+
+    def _read_temperature(self):
+        sensor = self.temperature_source() if self.temperature_source else None
+        if sensor is None:
+            return None
+        try:
+            return sensor.read_value()
+        except Exception as e:
+            logger.warning("⚠️ GasSensor: Temperature compensation read failed: %s", e)
+            return None
+
+    def _update_compensation(self):
+        """Rebuild the table when the co-located temperature moves by a whole degree"""
+        now = time.ticks_ms()
+        if self._last_temp_ms is not None and time.ticks_diff(now, self._last_temp_ms) < _TEMP_REFRESH_MS:
+            return
+        self._last_temp_ms = now
+        temperature = self._read_temperature()
+        if temperature is None:
+            return
+        temperature = round(temperature)
+        if temperature != self._compensation_temp:
+            self._compensation_temp = temperature
+            self.build_lut()
+
+    async def calibrate(self, bursts=20, interval_ms=100):
+        """Measure Ro in clean air by averaging Rs over several bursts"""
+        total_rs = 0.0
+        valid = 0
+        for _ in range(bursts):
+            with self.i2c:
+                voltage = self._reduce_burst(self.read_adc_burst()) * _VOLTS_PER_COUNT
+            if voltage > 0.1:
+                total_rs += ((3.3 * self.RL) / voltage) - self.RL
+                valid += 1
+            await asyncio.sleep_ms(interval_ms)
+
+        if valid == 0 or total_rs <= 0:
+            raise ValueError("Sensor output too low to calibrate")
+
+        # Normalise Ro to the reference temperature when compensation is available
+        temperature = self._read_temperature()
+        Ro = (total_rs / valid) / _CLEAN_AIR_RATIO / GasSensor._temperature_factor(temperature)
+        self._ema_adc = None
+        self.set_calibration(Ro, temperature)
+        logger.info("✅ GasSensor: Calibrated Ro=%.3f kOhm at 0x%02X", Ro, self.i2c_address)
+        return self.get_calibration()
+
+    def configure_sampling(self, samples=None, filter_mode=None, ema_alpha=None):
+        """Change burst size, burst filter and EMA smoothing at runtime"""
+        if samples is not None:
+            samples = int(samples)
+            if not 1 <= samples <= 32:
+                raise ValueError("samples must be between 1 and 32")
+            self.samples_per_read = samples
+            self._burst = bytearray(samples + 1)
+        if filter_mode is not None:
+            if filter_mode not in (GasSensor.FILTER_NONE, GasSensor.FILTER_MEAN, GasSensor.FILTER_MEDIAN):
+                raise ValueError("Invalid filter mode")
+            self.filter_mode = filter_mode
+        if ema_alpha is not None:
+            ema_alpha = float(ema_alpha)
+            if not 0.0 < ema_alpha <= 1.0:
+                raise ValueError("ema_alpha must be in (0, 1]")
+            self.ema_alpha = ema_alpha
+        self._ema_adc = None
+        return self.get_sampling()
+
+    def get_sampling(self):
+        return {
+            "samples": self.samples_per_read,
+            "filter": self.filter_mode,
+            "emaAlpha": self.ema_alpha
+        }
+
+    def state_dict(self):
+        """Read gas sensor value and return butane PPM"""
         try:
             if self.i2c and self.i2c_address is not None:
                 # Read data from the gas sensor and convert to PPM
-                ppm_value, voltage = self.read_butane_ppm()
-                print(f"GasSensor: Read {ppm_value:.2f} PPM butane (Voltage: {voltage:.2f}V) from I2C address {self.i2c_address}")
+                raw_ppm, ppm_value, voltage = self.read_filtered_ppm()
+                logger.debug("GasSensor: Read %.2f PPM butane (raw %.2f, Voltage: %.2fV) from I2C address 0x%02X", ppm_value, raw_ppm, voltage, self.i2c_address)
             else:
-                print("⚠️ GasSensor: I2C not available, cannot read value")
+                logger.warning("⚠️ GasSensor: I2C not available, cannot read value")
+                raw_ppm = 0
                 ppm_value = 0
-            
-            return json.dumps({
+
+            return {
                 "gasValue": round(ppm_value, 2),
+                "gasValueRaw": round(raw_ppm, 2),
                 "batteryLevel": battery.getBatteryPercentage()
-            })
+            }
         except Exception as e:
-            print(f"❌ GasSensor: Error reading state: {e}")
-            return json.dumps({"error": str(e)})
+            logger.error("❌ GasSensor: Error reading state: %s", e)
+            return {"error": str(e)}
 
-    def read_butane_ppm(self):
-        """Read MQ-5 sensor and convert to butane PPM"""
+    def read_adc_burst(self):
+        """Fetch samples_per_read conversions in a single I2C read; returns a memoryview"""
+        if not self._control_written:
+            # The PCF8591 keeps its control register, so this is only needed once
+            self.i2c.writeto(self.i2c_address, bytes([_CONTROL_BYTE]))
+            self._control_written = True
         try:
-            # Read raw ADC value
-            control_byte = 0x40  # Canal 0, DAC off
-            self.i2c.writeto(self.i2c_address, bytes([control_byte]))
-            self.i2c.readfrom(self.i2c_address, 1)  # Ignore first byte
-            adc_value = self.i2c.readfrom(self.i2c_address, 1)[0]
-            
-            # Convert ADC to voltage (0-3.3V range)
-            voltage = (adc_value / 255.0) * 3.3
-            
-            # Prevent division by zero
-            if voltage <= 0.1:  # Minimum threshold
-                return 0, voltage
-            
-            # Convert voltage to sensor resistance
-            # Rs = ((Vc * RL) / Vout) - RL
-            Rs = ((3.3 * self.RL) / voltage) - self.RL
-            
-            # Ensure Rs is positive
-            if Rs <= 0:
-                return 0, voltage
-            
-            # Calculate Rs/Ro ratio
-            ratio = Rs / self.Ro
-            
-            # Convert to PPM using logarithmic equation for butane
-            # PPM = a * (Rs/Ro)^b
-            if ratio > 0:
-                ppm = self.a * math.pow(ratio, self.b)
+            self.i2c.readfrom_into(self.i2c_address, self._burst)
+        except Exception:
+            self._control_written = False
+            raise
+        # First byte is the result of the previous conversion, skip it
+        return memoryview(self._burst)[1:]
+
+    def _reduce_burst(self, samples):
+        """Combine one burst into a single ADC value using the configured filter"""
+        if self.filter_mode == GasSensor.FILTER_MEAN:
+            return sum(samples) / len(samples)
+        if self.filter_mode == GasSensor.FILTER_MEDIAN:
+            ordered = sorted(samples)
+            middle = len(ordered) // 2
+            if len(ordered) % 2:
+                return ordered[middle]
+            return (ordered[middle - 1] + ordered[middle]) / 2
+        return samples[-1]
+
+    def read_filtered_ppm(self):
+        """Read one burst and return (raw_ppm, filtered_ppm, filtered_voltage).
+        Bus errors propagate: a dead sensor must not read as clean air."""
+        if self.temperature_source:
+            self._update_compensation()
+
+        # Hold the bus for the whole burst: the buffer and EMA are shared
+        # with the core-1 sampler
+        with self.i2c:
+            samples = self.read_adc_burst()
+            self._last_adc = samples[-1]
+            adc_value = self._reduce_burst(samples)
+
+            if self._ema_adc is None:
+                self._ema_adc = adc_value
             else:
-                ppm = 0
-            
-            # Ensure PPM is within reasonable bounds for lighter gas
-            ppm = max(0, min(ppm, 5000))  # Cap between 0-5000 PPM for butane
-            
-            return ppm, voltage
-            
+                self._ema_adc += self.ema_alpha * (adc_value - self._ema_adc)
+
+        raw_ppm, _ = self.adc_to_ppm(self._last_adc)
+        ppm, voltage = self.adc_to_ppm(self._ema_adc)
+        return raw_ppm, ppm, voltage
+
+    def read_value(self):
+        """Filtered butane PPM as a plain number, for the sampler; None when
+        the read fails, so the sample is skipped instead of recorded as 0"""
+        if not self.i2c or self.i2c_address is None:
+            return None
+        try:
+            _, ppm, _ = self.read_filtered_ppm()
         except Exception as e:
-            print(f"❌ GasSensor: Error calculating butane PPM: {e}")
-            return 0, 0
\ No newline at end of file
+            logger.error("❌ GasSensor: Error calculating butane PPM: %s", e)
+            return None
+        return ppm
+
+    def read_butane_ppm(self):
+        """Read MQ-5 sensor and return filtered butane (PPM, voltage)"""
+        _, ppm, voltage = self.read_filtered_ppm()
+        return ppm, voltage
+
+    def adc_to_ppm(self, adc_value):
+        """Convert an ADC reading to butane (PPM, voltage) with one table lookup"""
+        return self._lut[int(adc_value + 0.5)], adc_value * _VOLTS_PER_COUNT
+
+    def _compute_ppm(self, adc_value, factor=1.0):
+        """Evaluate the MQ-5 curve for one ADC value (used to build the table)"""
+        # Convert ADC to voltage (0-3.3V range)
+        voltage = adc_value * _VOLTS_PER_COUNT
+
+        # Prevent division by zero
+        if voltage <= 0.1:  # Minimum threshold
+            return 0
+
+        # Convert voltage to sensor resistance
+        # Rs = ((Vc * RL) / Vout) - RL
+        Rs = ((3.3 * self.RL) / voltage) - self.RL
+
+        # Ensure Rs is positive
+        if Rs <= 0:
+            return 0
+
+        # Calculate Rs/Ro ratio, corrected to the reference temperature
+        ratio = Rs / (self.Ro * factor)
+
+        # Convert to PPM using logarithmic equation for butane
+        # PPM = a * (Rs/Ro)^b
+        if ratio > 0:
+            ppm = self.a * math.pow(ratio, self.b)
+        else:
+            ppm = 0
+
+        # Ensure PPM is within reasonable bounds for lighter gas
+        return max(0, min(ppm, 5000))  # Cap between 0-5000 PPM for butane
@@ -1,6 +1,25 @@
 from module.module import Sensor
-import json
+import struct
+import micropython
+import uasyncio as asyncio
+from machine import Pin
 import utils.battery as battery
+import utils.logger as logger
+import utils.events as events
+
+# LM75B registers
+TEMP_REGISTER = 0x00
+CONF_REGISTER = 0x01
+THYST_REGISTER = 0x02
+TOS_REGISTER = 0x03
+
+# Configuration register bits
+_CONF_SHUTDOWN = 0x01
+_CONF_OS_INTERRUPT = 0x02   # 0 = comparator, 1 = interrupt mode
+_CONF_OS_ACTIVE_HIGH = 0x04
+_FAULT_QUEUE_BITS = {1: 0x00, 2: 0x08, 4: 0x10, 6: 0x18}
+
+_CONVERSION_MS = 100  # Worst-case LM75B conversion time
 
 class TemperatureSensor(Sensor):
     def __init__(self,i2c_instance,i2c_address):
@@ -8,40 +27,249 @@ class TemperatureSensor(Sensor):
         self.i2c = i2c_instance
         self.i2c_address = i2c_address
 
-    def get_state(self):
+        # Threshold alerts
+        self.alert = None        # {"tos", "thyst", "mode", "osPin", "activeHigh"}
+        self.alert_active = False
+        self._os_pin = None
+        self._on_os_change_ref = self._on_os_change  # Preallocated for micropython.schedule
+
+        # Shutdown between samples
+        self.low_power = False
+        self._shutdown_task = None
+
+        # Bus work requested from contexts that must not touch the bus (core 1,
+        # scheduled callbacks), done by _service() on the asyncio side
+        self._service_flag = asyncio.ThreadSafeFlag()
+        self._service_task = None
+        self._wake_requested = False
+        self._clear_os_requested = False
+        self._alert_changed = False
+
+    def state_dict(self):
         try:
             if self.i2c and self.i2c_address is not None:
                 # Read data from the LM75B temperature sensor
                 temperature_c = self.read_lm75b_temperature()
-                temperature_f = (temperature_c * 9/5) + 32
-                print(f"🌡️ TemperatureSensor: Read {temperature_c:.2f}°C ({temperature_f:.2f}°F) from I2C address 0x{self.i2c_address:02X}")
+                logger.debug("🌡️ TemperatureSensor: Read %.2f°C from I2C address 0x%02X", temperature_c, self.i2c_address)
             else:
-                print("⚠️ TemperatureSensor: I2C not available, cannot read value")
+                logger.warning("⚠️ TemperatureSensor: I2C not available, cannot read value")
                 temperature_c = 0
-                temperature_f = 32
-            
-            return json.dumps({
+
+            return {
                 "temperatureC": round(temperature_c, 2),
+                "alertActive": self.alert_active,
                 "batteryLevel": battery.getBatteryPercentage()
-            })
+            }
         except Exception as e:
-            print(f"❌ TemperatureSensor: Error reading state: {e}")
-            return json.dumps({"error": str(e)})
+            logger.error("❌ TemperatureSensor: Error reading state: %s", e)
+            return {"error": str(e)}
+
+    def pack_state(self, value=None):
+        """float32 temperature followed by the alert flag"""
+        return struct.pack("<fB", value if value is not None else 0, 1 if self.alert_active else 0)
 
     def read_lm75b_temperature(self):
         """Read temperature from LM75B sensor"""
+        temperature = self._read_temperature_register()
+
+        if self.low_power:
+            # The register holds the conversion made during the last wake-up;
+            # start the next one now and go back to sleep once it is done.
+            self._wake_for_conversion()
+
+        return temperature
+
+    def read_value(self):
+        """Temperature in °C as a plain number, for the sampler. Safe to call
+        from core 1: in low-power mode it returns the last conversion and asks
+        the service task to start the next one."""
+        if not self.i2c or self.i2c_address is None:
+            return None
+        temperature = self._read_temperature_register()
+        if self.low_power:
+            self._wake_requested = True
+            self._service_flag.set()
+        return temperature
+
+    def _read_temperature_register(self):
+        with self.i2c:
+            self.i2c.writeto(self.i2c_address, bytes([TEMP_REGISTER]))
+            data = self.i2c.readfrom(self.i2c_address, 2)
 
-        TEMP_REGISTER = 0x00
-        
-        self.i2c.writeto(self.i2c_address, bytes([TEMP_REGISTER]))
-        data = self.i2c.readfrom(self.i2c_address, 2)
-        
         raw_temp = (data[0] << 8) | data[1]
         temp_raw = raw_temp >> 5
-        
+
         if temp_raw & 0x400:
-            temp_raw -= 0x800 
-        
-        temperature = temp_raw * 0.125
-        
-        return temperature
\ No newline at end of file
+            temp_raw -= 0x800
+
+        return temp_raw * 0.125
+
+    def _read_config(self):
+        with self.i2c:
+            self.i2c.writeto(self.i2c_address, bytes([CONF_REGISTER]))
+            return self.i2c.readfrom(self.i2c_address, 1)[0]
+
+    def _write_config(self, value):
+        self.i2c.writeto(self.i2c_address, bytes([CONF_REGISTER, value & 0x1F]))
+
+    def _write_limit(self, register, celsius):
+        """Write TOS/THYST: 9-bit two's complement, 0.5°C per LSB, left aligned"""
+        value = int(round(celsius * 2)) & 0x1FF
+        self.i2c.writeto(self.i2c_address, bytes([register, (value >> 1) & 0xFF, (value & 0x01) << 7]))
+
+    def _read_limit(self, register):
+        with self.i2c:
+            self.i2c.writeto(self.i2c_address, bytes([register]))
+            data = self.i2c.readfrom(self.i2c_address, 2)
+        value = ((data[0] << 8) | data[1]) >> 7
+        if value & 0x100:
+            value -= 0x200
+        return value * 0.5
+
+    def configure_alert(self, tos, thyst, os_pin=None, mode="comparator", active_high=False, fault_queue=1):
+        """Program TOS/THYST and optionally watch the OS output with a Pin IRQ"""
+        tos = float(tos)
+        thyst = float(thyst)
+        if thyst >= tos:
+            raise ValueError("thyst must be below tos")
+        if mode not in ("comparator", "interrupt"):
+            raise ValueError("mode must be 'comparator' or 'interrupt'")
+        if fault_queue not in _FAULT_QUEUE_BITS:
+            raise ValueError("fault_queue must be 1, 2, 4 or 6")
+
+        self._write_limit(TOS_REGISTER, tos)
+        self._write_limit(THYST_REGISTER, thyst)
+
+        config = self._read_config() & _CONF_SHUTDOWN
+        if mode == "interrupt":
+            config |= _CONF_OS_INTERRUPT
+        if active_high:
+            config |= _CONF_OS_ACTIVE_HIGH
+        config |= _FAULT_QUEUE_BITS[fault_queue]
+        self._write_config(config)
+
+        self.disable_alert_pin()
+        if os_pin is not None:
+            pull = Pin.PULL_DOWN if active_high else Pin.PULL_UP
+            self._os_pin = Pin(os_pin, Pin.IN, pull)
+            self._os_pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self._os_irq)
+            self._start_service()
+
+        self.alert = {
+            "tos": self._read_limit(TOS_REGISTER),
+            "thyst": self._read_limit(THYST_REGISTER),
+            "mode": mode,
+            "osPin": os_pin,
+            "activeHigh": active_high,
+            "faultQueue": fault_queue
+        }
+        if self.low_power:
+            logger.warning("⚠️ TemperatureSensor: OS output only updates while the chip is awake")
+        return self.alert
+
+    def disable_alert_pin(self):
+        if self._os_pin is not None:
+            self._os_pin.irq(handler=None)
+            self._os_pin = None
+            self._service_flag.set()  # Lets the service task exit if unused
+
+    def _os_irq(self, pin):
+        # Hard IRQ context: defer I2C access and event publishing to the scheduler
+        try:
+            micropython.schedule(self._on_os_change_ref, pin.value())
+        except RuntimeError:
+            pass  # Schedule queue full, the next edge will catch up
+
+    def _on_os_change(self, level):
+        if not self.alert:
+            return
+        asserted = bool(level) == self.alert["activeHigh"]
+        if self.alert["mode"] == "interrupt":
+            if not asserted:
+                return  # Only the leading edge of each pulse
+            # Pulses alternate: rising above TOS, then falling below THYST
+            active = not self.alert_active
+            # Reading any register clears the OS output. Not from here: this
+            # callback can run between the pointer write and the read of a
+            # temperature read on the same thread.
+            self._clear_os_requested = True
+            self._service_flag.set()
+        else:
+            active = asserted
+        if active == self.alert_active:
+            return
+        self.alert_active = active
+        # Publishing sets an asyncio.Event, which is not safe from a scheduled callback
+        self._alert_changed = True
+        self._service_flag.set()
+
+    def _publish_alert(self):
+        if not self.alert:
+            return
+        events.publish("temperature_alert", {
+            "uuid": self.uuid,
+            "i2cAddress": self.i2c_address,
+            "active": self.alert_active,
+            "tos": self.alert["tos"],
+            "thyst": self.alert["thyst"]
+        })
+
+    def set_low_power(self, enabled):
+        """Keep the LM75B in shutdown between samples"""
+        self.low_power = bool(enabled)
+        config = self._read_config()
+        if self.low_power:
+            self._write_config(config | _CONF_SHUTDOWN)
+            self._start_service()
+        else:
+            self._write_config(config & ~_CONF_SHUTDOWN)
+            self._service_flag.set()
+        return {"lowPower": self.low_power}
+
+    def _start_service(self):
+        if self._service_task is None:
+            self._service_task = asyncio.create_task(self._service())
+
+    async def _service(self):
+        """Bus work and alert events requested by read_value() and the OS
+        callback, done on core 0 while low power or the OS pin is in use"""
+        try:
+            while self.low_power or self._os_pin is not None:
+                await self._service_flag.wait()
+                if self._alert_changed:
+                    self._alert_changed = False
+                    self._publish_alert()
+                if self._clear_os_requested:
+                    self._clear_os_requested = False
+                    try:
+                        self._read_config()
+                    except Exception as e:
+                        logger.warning("⚠️ TemperatureSensor: Could not clear OS output: %s", e)
+                if self._wake_requested:
+                    self._wake_requested = False
+                    if self.low_power:
+                        try:
+                            self._wake_for_conversion()
+                        except Exception as e:
+                            logger.error("❌ TemperatureSensor: Error waking for conversion: %s", e)
+        finally:
+            self._service_task = None
+
+    def _wake_for_conversion(self):
+        if self._shutdown_task is not None:
+            return  # A conversion is already running
+        self._write_config(self._read_config() & ~_CONF_SHUTDOWN)
+        self._shutdown_task = asyncio.create_task(self._shutdown_after_conversion())
+
+    async def _shutdown_after_conversion(self):
+        try:
+            await asyncio.sleep_ms(_CONVERSION_MS)
+            if self.low_power:
+                self._write_config(self._read_config() | _CONF_SHUTDOWN)
+        except Exception as e:
+            logger.error("❌ TemperatureSensor: Error entering shutdown: %s", e)
+        finally:
+            self._shutdown_task = None
+
+    def __del__(self):
+        self.disable_alert_pin()
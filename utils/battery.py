@@ -1,27 +1,136 @@
 import machine
+import time
+import uasyncio as asyncio
+from micropython import const
+
+# GPIO26 is ADC0 on the Pico
+_ADC_CHANNEL = const(0)
+_SAMPLES_PER_READING = const(16)  # Raw reads averaged per background sample
+_TREND_HISTORY = const(12)        # Filtered voltages kept to compute the trend
+
+# Voltage divider: gpio_voltage = battery_voltage * (2.2 / (1 + 2.2))
+_DIVIDER_RATIO = 3.2 / 2.2
+
+# Typical single-cell LiPo resting discharge curve (volts, percent), high to low.
+# The PCM cuts off around 3.0V, so anything below the last point is empty.
+DISCHARGE_CURVE = (
+    (4.20, 100), (4.15, 95), (4.11, 90), (4.08, 85), (4.02, 80),
+    (3.98, 75), (3.95, 70), (3.91, 65), (3.87, 60), (3.85, 55),
+    (3.84, 50), (3.82, 45), (3.80, 40), (3.79, 35), (3.77, 30),
+    (3.75, 25), (3.73, 20), (3.71, 15), (3.69, 10), (3.61, 5),
+    (3.27, 0),
+)
+
+sample_interval_s = 30   # Background sampling period
+filter_alpha = 0.2       # EMA weight of each new averaged sample
+
+_adc = None
+_voltage = None          # Filtered battery voltage
+_percentage = None       # Cached percentage from the discharge curve
+_history = []            # [(ticks_ms, voltage)], oldest first
+_last_sample_ms = None
+_running = False
+
+
+def voltage_to_percentage(battery_voltage):
+    """Map a battery voltage to charge percentage with the piecewise discharge curve"""
+    if battery_voltage >= DISCHARGE_CURVE[0][0]:
+        return 100
+    for i in range(1, len(DISCHARGE_CURVE)):
+        low_v, low_pct = DISCHARGE_CURVE[i]
+        if battery_voltage >= low_v:
+            high_v, high_pct = DISCHARGE_CURVE[i - 1]
+            fraction = (battery_voltage - low_v) / (high_v - low_v)
+            return int(low_pct + fraction * (high_pct - low_pct))
+    return 0
+
+
+def _read_voltage():
+    """Average several raw ADC reads and convert to battery voltage"""
+    global _adc
+    if _adc is None:
+        _adc = machine.ADC(_ADC_CHANNEL)
+    total = 0
+    for _ in range(_SAMPLES_PER_READING):
+        total += _adc.read_u16()
+    gpio_voltage = (total / _SAMPLES_PER_READING / 65535) * 3.3
+    return gpio_voltage * _DIVIDER_RATIO
+
+
+def sample():
+    """Take one averaged reading, update the filter, percentage and trend history"""
+    global _voltage, _percentage, _last_sample_ms
+    reading = _read_voltage()
+    if _voltage is None:
+        _voltage = reading
+    else:
+        _voltage += filter_alpha * (reading - _voltage)
+    _percentage = voltage_to_percentage(_voltage)
+
+    _last_sample_ms = time.ticks_ms()
+    _history.append((_last_sample_ms, _voltage))
+    if len(_history) > _TREND_HISTORY:
+        _history.pop(0)
+    return _voltage
+
+
+def get_trend_mv_per_hour():
+    """Slope of the filtered voltage over the kept history, in mV per hour"""
+    if len(_history) < 2:
+        return 0
+    start_ms, start_v = _history[0]
+    end_ms, end_v = _history[-1]
+    elapsed_ms = time.ticks_diff(end_ms, start_ms)
+    if elapsed_ms <= 0:
+        return 0
+    return int((end_v - start_v) * 1000 * 3600000 / elapsed_ms)
+
+
+async def run(interval_s=None):
+    """Background sampler; module state reads only return the cached value"""
+    global _running, sample_interval_s
+    if _running:
+        return
+    _running = True
+    if interval_s is not None:
+        sample_interval_s = interval_s
+    print(f"🔋 Battery monitor started (every {sample_interval_s}s)")
+    while True:
+        try:
+            sample()
+        except Exception as e:
+            print(f"❌ Battery sample failed: {e}")
+        await asyncio.sleep(sample_interval_s)
+
 
 def getBatteryPercentage():
-    # GPIO26 is ADC0 on the Pico
-    adc = machine.ADC(0)
-    
-    # Read raw ADC value (0-65535 for 16-bit ADC)
-    raw_reading = adc.read_u16()
-    
-    # Convert to voltage at GPIO26 (3.3V reference)
-    gpio_voltage = (raw_reading / 65535) * 3.3
-    
-    # Calculate actual battery voltage using voltage divider
-    # gpio_voltage = battery_voltage * (2.2 / (1 + 2.2))
-    battery_voltage = gpio_voltage * (3.2 / 2.2)
-    
-    # Define Li-Po battery voltage range with PCM protection
-    min_voltage = 3.0  # PCM cutoff voltage (0% usable charge)
-    max_voltage = 4.2  # Full charge voltage (100% charge)
-    
-    # Calculate percentage using linear interpolation
-    percentage = ((battery_voltage - min_voltage) / (max_voltage - min_voltage)) * 100
-    
-    # Clamp between 0 and 100
-    percentage = max(0, min(100, percentage))
-    
-    return int(percentage)
\ No newline at end of file
+    """Return the cached battery percentage (sampled once if the monitor has not run yet)"""
+    if _percentage is None:
+        sample()
+    return _percentage
+
+
+def getBatteryVoltage():
+    if _voltage is None:
+        sample()
+    return _voltage
+
+
+def get_status():
+    """Return percentage, voltage and trend as a dict"""
+    percentage = getBatteryPercentage()
+    trend = get_trend_mv_per_hour()
+    if trend > 20:
+        direction = "charging"
+    elif trend < -20:
+        direction = "discharging"
+    else:
+        direction = "stable"
+    return {
+        "percentage": percentage,
+        "voltage": round(_voltage, 3),
+        "trendMvPerHour": trend,
+        "trend": direction,
+        "sampleIntervalS": sample_interval_s,
+        "lastSampleMs": _last_sample_ms,
+    }
@@ -0,0 +1,83 @@
+import time
+from utils.health import HealthMonitor
+
+
+class _Phase:
+    """Context manager timing one synchronous boot phase"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        BootTimeline.begin(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        BootTimeline.end(self.name, None if exc is None else str(exc))
+        return False
+
+
+class BootTimeline:
+    """Start/end times of the boot phases, relative to power-on"""
+
+    phases = {}        # name -> {"startMs", "endMs", "durationMs", "ok", "error"}
+    _order = []
+    complete_ms = None
+
+    @staticmethod
+    def begin(name):
+        BootTimeline.phases[name] = {
+            "startMs": HealthMonitor.uptime_ms(),
+            "endMs": None,
+            "durationMs": None,
+            "ok": None,
+            "error": None,
+        }
+        if name not in BootTimeline._order:
+            BootTimeline._order.append(name)
+
+    @staticmethod
+    def end(name, error=None):
+        phase = BootTimeline.phases.get(name)
+        if phase is None:
+            return
+        phase["endMs"] = HealthMonitor.uptime_ms()
+        phase["durationMs"] = phase["endMs"] - phase["startMs"]
+        phase["ok"] = error is None
+        phase["error"] = error
+        print(f"⏱️ Boot phase {name}: {phase['durationMs']}ms{'' if error is None else ' (failed: ' + error + ')'}")
+
+    @staticmethod
+    def phase(name):
+        """Time a synchronous step: `with BootTimeline.phase("i2c"): ...`"""
+        return _Phase(name)
+
+    @staticmethod
+    async def run(name, coroutine):
+        """Time an async step; exceptions are recorded and re-raised"""
+        BootTimeline.begin(name)
+        try:
+            result = await coroutine
+        except Exception as e:
+            BootTimeline.end(name, str(e))
+            raise
+        BootTimeline.end(name)
+        return result
+
+    @staticmethod
+    def mark_complete():
+        BootTimeline.complete_ms = HealthMonitor.uptime_ms()
+
+    @staticmethod
+    def get_report():
+        phases = []
+        for name in BootTimeline._order:
+            phase = {"name": name}
+            phase.update(BootTimeline.phases[name])
+            phases.append(phase)
+        return {
+            "phases": phases,
+            "completeMs": BootTimeline.complete_ms,
+            "firstResponseMs": HealthMonitor.first_response_ms,
+            "uptimeMs": HealthMonitor.uptime_ms(),
+        }
@@ -0,0 +1,60 @@
+from _thread import allocate_lock, get_ident
+
+
+class LockedI2C:
+    """I2C wrapper that serialises bus access between core 0 and core 1.
+
+    Every transaction takes the bus lock. Multi-step sequences (set a register
+    pointer, then read) hold it for the whole sequence with `with i2c:`; the
+    lock is re-entrant for the owning thread, so the inner calls don't block."""
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self._lock = allocate_lock()
+        self._owner = None
+        self._depth = 0
+
+    def __enter__(self):
+        me = get_ident()
+        if self._owner == me:
+            self._depth += 1
+            return self
+        self._lock.acquire()
+        self._owner = me
+        self._depth = 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            self._lock.release()
+        return False
+
+    def scan(self):
+        with self:
+            return self.i2c.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        with self:
+            return self.i2c.writeto(addr, buf, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        with self:
+            return self.i2c.readfrom(addr, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        with self:
+            return self.i2c.readfrom_into(addr, buf, stop)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        with self:
+            return self.i2c.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        with self:
+            return self.i2c.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        with self:
+            return self.i2c.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
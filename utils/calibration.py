@@ -0,0 +1,31 @@
+import json
+
+CALIBRATION_FILE = "calibration.json"  # Per-UUID sensor calibration
+
+
+def load_all():
+    """Load every stored calibration, keyed by module UUID"""
+    try:
+        with open(CALIBRATION_FILE, "r") as f:
+            return json.load(f)
+    except OSError:  # File doesn't exist in MicroPython
+        return {}
+    except Exception as e:
+        print(f"Error loading calibration: {e}")
+        return {}
+
+
+def get(uuid):
+    """Return the stored calibration for a module, or None"""
+    return load_all().get(uuid)
+
+
+def save(uuid, data):
+    """Store the calibration for a module"""
+    calibrations = load_all()
+    calibrations[uuid] = data
+    try:
+        with open(CALIBRATION_FILE, "w") as f:
+            json.dump(calibrations, f)
+    except Exception as e:
+        print(f"Error saving calibration: {e}")
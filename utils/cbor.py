@@ -0,0 +1,198 @@
+import struct
+
+# Minimal CBOR (RFC 8949) codec with the json module's dumps/loads interface.
+# Covers what the firmware exchanges: None, bool, int, float, str, bytes, list,
+# tuple and dict. Floats are sent as float32 when that is exact (always, on
+# single-precision builds), else float64. Indefinite-length items and tags are
+# not supported.
+
+CONTENT_TYPE = "application/cbor"
+
+_MAJOR_UINT = 0
+_MAJOR_NEGINT = 1
+_MAJOR_BYTES = 2
+_MAJOR_TEXT = 3
+_MAJOR_ARRAY = 4
+_MAJOR_MAP = 5
+_MAJOR_SIMPLE = 7
+
+_MAX_DEPTH = 16  # Nested arrays/maps; deeper input is rejected before the C stack runs out
+
+
+def _head(out, major, value):
+    major <<= 5
+    if value < 24:
+        out.append(major | value)
+    elif value < 0x100:
+        out.append(major | 24)
+        out.append(value)
+    elif value < 0x10000:
+        out.append(major | 25)
+        out.extend(struct.pack(">H", value))
+    elif value < 0x100000000:
+        out.append(major | 26)
+        out.extend(struct.pack(">I", value))
+    else:
+        out.append(major | 27)
+        out.extend(struct.pack(">Q", value))
+
+
+def _encode(out, obj):
+    if obj is None:
+        out.append(0xF6)
+    elif obj is True:
+        out.append(0xF5)
+    elif obj is False:
+        out.append(0xF4)
+    elif isinstance(obj, int):
+        if obj >= 0:
+            _head(out, _MAJOR_UINT, obj)
+        else:
+            _head(out, _MAJOR_NEGINT, -1 - obj)
+    elif isinstance(obj, float):
+        single = struct.pack(">f", obj)
+        if struct.unpack(">f", single)[0] == obj:
+            out.append(0xFA)
+            out.extend(single)
+        else:
+            out.append(0xFB)
+            out.extend(struct.pack(">d", obj))
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _head(out, _MAJOR_TEXT, len(data))
+        out.extend(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        _head(out, _MAJOR_BYTES, len(obj))
+        out.extend(obj)
+    elif isinstance(obj, (list, tuple)):
+        _head(out, _MAJOR_ARRAY, len(obj))
+        for item in obj:
+            _encode(out, item)
+    elif isinstance(obj, dict):
+        _head(out, _MAJOR_MAP, len(obj))
+        for key, value in obj.items():
+            _encode(out, key)
+            _encode(out, value)
+    else:
+        raise TypeError(f"can't CBOR-encode {type(obj)}")
+
+
+def dumps(obj):
+    """Encode obj; returns a bytearray"""
+    out = bytearray()
+    _encode(out, obj)
+    return out
+
+
+def _half_to_float(half):
+    exponent = (half >> 10) & 0x1F
+    mantissa = half & 0x3FF
+    if exponent == 0:
+        value = mantissa * 2.0 ** -24
+    elif exponent == 0x1F:
+        value = float("inf") if mantissa == 0 else float("nan")
+    else:
+        value = (1024 + mantissa) * 2.0 ** (exponent - 25)
+    return -value if half & 0x8000 else value
+
+
+def _decode(data, pos, depth=0):
+    """Returns (value, next position)"""
+    initial = data[pos]
+    major = initial >> 5
+    info = initial & 0x1F
+    pos += 1
+
+    if major == _MAJOR_SIMPLE:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22 or info == 23:
+            return None, pos
+        if info == 25:
+            return _half_to_float(struct.unpack_from(">H", data, pos)[0]), pos + 2
+        if info == 26:
+            return struct.unpack_from(">f", data, pos)[0], pos + 4
+        if info == 27:
+            return struct.unpack_from(">d", data, pos)[0], pos + 8
+        raise ValueError("unsupported CBOR simple value")
+
+    if info < 24:
+        value = info
+    elif info == 24:
+        value = data[pos]
+        pos += 1
+    elif info == 25:
+        value = struct.unpack_from(">H", data, pos)[0]
+        pos += 2
+    elif info == 26:
+        value = struct.unpack_from(">I", data, pos)[0]
+        pos += 4
+    elif info == 27:
+        value = struct.unpack_from(">Q", data, pos)[0]
+        pos += 8
+    else:
+        raise ValueError("indefinite-length CBOR is not supported")
+
+    if major == _MAJOR_UINT:
+        return value, pos
+    if major == _MAJOR_NEGINT:
+        return -1 - value, pos
+    if major == _MAJOR_BYTES:
+        return bytes(data[pos:pos + value]), pos + value
+    if major == _MAJOR_TEXT:
+        return bytes(data[pos:pos + value]).decode(), pos + value
+    if major == _MAJOR_ARRAY or major == _MAJOR_MAP:
+        if depth >= _MAX_DEPTH:
+            raise ValueError("CBOR nested too deeply")
+        depth += 1
+    if major == _MAJOR_ARRAY:
+        items = []
+        for _ in range(value):
+            item, pos = _decode(data, pos, depth)
+            items.append(item)
+        return items, pos
+    if major == _MAJOR_MAP:
+        result = {}
+        for _ in range(value):
+            key, pos = _decode(data, pos, depth)
+            result[key], pos = _decode(data, pos, depth)
+        return result, pos
+    raise ValueError("unsupported CBOR tag")
+
+
+def loads(data):
+    """Decode one CBOR item; raises ValueError on malformed input"""
+    try:
+        value, pos = _decode(data, 0)
+    except IndexError:  # struct.unpack_from raises ValueError itself
+        raise ValueError("truncated CBOR")
+    except TypeError:  # An array or map used as a map key
+        raise ValueError("unhashable CBOR map key")
+    if pos != len(data):
+        raise ValueError("trailing bytes after CBOR item")
+    return value
+
+
+def compare(payload, iterations=20):
+    """Benchmark: bytes and mean encode/decode time (us) of payload as JSON and as CBOR"""
+    import json
+    import time
+
+    result = {}
+    for name, encode, decode in (("json", json.dumps, json.loads), ("cbor", dumps, loads)):
+        start = time.ticks_us()
+        for _ in range(iterations):
+            encoded = encode(payload)
+        encode_us = time.ticks_diff(time.ticks_us(), start) // iterations
+        start = time.ticks_us()
+        for _ in range(iterations):
+            decode(encoded)
+        decode_us = time.ticks_diff(time.ticks_us(), start) // iterations
+        result[name] = {
+            "bytes": len(encoded.encode() if isinstance(encoded, str) else encoded),
+            "encodeUs": encode_us,
+            "decodeUs": decode_us,
+        }
+    return result
@@ -0,0 +1,158 @@
+import time
+import uasyncio as asyncio
+from utils.transitions import TransitionEngine
+
+# Minimum time between two hardware writes, per module type (ms).
+# Relays get a long one to spare their contacts.
+DEFAULT_MIN_INTERVAL_MS = {
+    "Relay": 500,
+    "Led": 20,
+}
+
+
+class _Channel:
+    """Command state of one control"""
+
+    def __init__(self, min_interval_ms):
+        self.seq = 0               # Last sequence number handed out
+        self.applied_seq = 0       # Last sequence number written (or skipped)
+        self.pending = None        # (seq, state) waiting for the worker
+        self.min_interval_ms = min_interval_ms
+        self.last_write_ms = None
+        self.coalesced = 0         # Commands replaced before being written
+        self.skipped = 0           # Commands equal to the current state
+        self.writes = 0
+
+
+class CommandQueue:
+    """Per-control command pipeline between clients and the bus.
+
+    submit() answers at once with a sequence number. Only the newest pending
+    state of a control is kept, a control is written at most once per
+    min_interval_ms, and a command that matches the current state is not
+    written at all. The worker applies commands in run()."""
+
+    _channels = {}           # uuid -> _Channel
+    _wakeup = asyncio.ThreadSafeFlag()
+    running = False
+
+    @staticmethod
+    def _channel(uuid, module):
+        channel = CommandQueue._channels.get(uuid)
+        if channel is None:
+            channel = _Channel(DEFAULT_MIN_INTERVAL_MS.get(module.module_type, 0))
+            CommandQueue._channels[uuid] = channel
+        return channel
+
+    @staticmethod
+    def submit(uuid, state, replace_transition=True):
+        """Queue a new state for a control; returns the acknowledgement.
+        Schedule steps pass replace_transition=False so they don't cancel
+        their own schedule."""
+        from module.module_manager import ModuleManager
+        from module.module import Control
+
+        module = ModuleManager.get_module(uuid)
+        if not isinstance(module, Control):
+            return {"error": "Invalid module or module does not support state changes"}
+        try:
+            # Rejected here, before it costs a sequence number
+            state = module.normalize_state(state)
+        except (ValueError, TypeError):
+            return {"error": "Invalid state"}
+        if replace_transition:
+            # A new command replaces a running fade or schedule
+            TransitionEngine.cancel(uuid)
+        channel = CommandQueue._channel(uuid, module)
+        if channel.pending is not None:
+            channel.coalesced += 1
+        channel.seq += 1
+        channel.pending = (channel.seq, state)
+        CommandQueue._wakeup.set()
+        return {"new_state": state, "seq": channel.seq, "queued": True}
+
+    @staticmethod
+    def discard(uuid):
+        """Drop the pending command of a control (a fade or schedule took over)"""
+        channel = CommandQueue._channels.get(uuid)
+        if channel is not None and channel.pending is not None:
+            channel.applied_seq = channel.pending[0]
+            channel.pending = None
+
+    @staticmethod
+    def set_min_interval(uuid, min_interval_ms):
+        from module.module_manager import ModuleManager
+
+        module = ModuleManager.get_module(uuid)
+        if module is None:
+            raise ValueError("Invalid module")
+        min_interval_ms = int(min_interval_ms)
+        if not 0 <= min_interval_ms <= 60000:
+            raise ValueError("minIntervalMs must be 0-60000")
+        CommandQueue._channel(uuid, module).min_interval_ms = min_interval_ms
+        return CommandQueue.get_status(uuid)
+
+    @staticmethod
+    def _apply(uuid, channel):
+        from module.module_manager import ModuleManager
+
+        seq, state = channel.pending
+        channel.pending = None
+        try:
+            module = ModuleManager.get_module(uuid)
+            if module is None:
+                return
+            if state == module.state:
+                channel.skipped += 1
+            else:
+                ModuleManager.apply_module_state(uuid, state)
+                channel.last_write_ms = time.ticks_ms()
+                channel.writes += 1
+        finally:
+            # A failed write is still done with, appliedSeq must not stall
+            channel.applied_seq = seq
+
+    @staticmethod
+    async def run():
+        """Write pending commands as their controls' intervals allow"""
+        if CommandQueue.running:
+            return
+        CommandQueue.running = True
+        while True:
+            wait_ms = None
+            now = time.ticks_ms()
+            for uuid, channel in list(CommandQueue._channels.items()):
+                if channel.pending is None:
+                    continue
+                if channel.last_write_ms is not None:
+                    remaining = channel.min_interval_ms - time.ticks_diff(now, channel.last_write_ms)
+                    if remaining > 0:
+                        wait_ms = remaining if wait_ms is None else min(wait_ms, remaining)
+                        continue
+                try:
+                    CommandQueue._apply(uuid, channel)
+                except Exception as e:
+                    print(f"❌ Command for {uuid} failed: {e}")
+
+            if wait_ms is None:
+                await CommandQueue._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for_ms(CommandQueue._wakeup.wait(), wait_ms)
+                except asyncio.TimeoutError:
+                    pass
+
+    @staticmethod
+    def get_status(uuid):
+        channel = CommandQueue._channels.get(uuid)
+        if channel is None:
+            return {"seq": 0, "appliedSeq": 0, "pending": None}
+        return {
+            "seq": channel.seq,
+            "appliedSeq": channel.applied_seq,
+            "pending": channel.pending[1] if channel.pending is not None else None,
+            "minIntervalMs": channel.min_interval_ms,
+            "coalesced": channel.coalesced,
+            "skipped": channel.skipped,
+            "writes": channel.writes,
+        }
@@ -0,0 +1,252 @@
+import time
+import _thread
+import uasyncio as asyncio
+from array import array
+from micropython import const
+
+_JOB_SLOTS = const(32)
+_RESULT_SLOTS = const(32)
+
+# Workload names used by the firmware
+WORKLOAD_DAC = "dac"                # Thread backend of the waveform generator
+WORKLOAD_SAMPLE = "sample"          # Sensor reads for the sampler
+WORKLOAD_DOWNSAMPLE = "downsample"  # History downsampling for the sampler
+
+
+class Core1Scheduler:
+    """Work loop for the second core.
+
+    Workloads are registered once as (function, handler) pairs. Core 0 queues
+    jobs as (workload id, int argument) in a lock-protected ring; core 1 runs
+    function(arg) and puts (workload id, arg, value) in a result ring, then sets
+    a ThreadSafeFlag. The uasyncio side drains the results and calls
+    handler(arg, value). Both rings are preallocated arrays, so queueing a job
+    or handing back a result does not allocate.
+
+    Which workloads actually run on core 1 is chosen per deployment with
+    start(workloads); the others run inline on core 0 through dispatch().
+    The DAC thread backend is a streaming workload: while it runs it owns
+    core 1 and queued work falls back to core 0."""
+
+    _names = []        # Workload name by id
+    _functions = []    # function(arg) -> number or None, may run on core 1
+    _handlers = []     # handler(arg, value), always runs on core 0
+    _offload = []      # True if the workload is enabled on core 1
+    _completed = []    # Jobs finished on core 1, per workload
+    _failed = []       # Jobs that raised or returned None, per workload
+    enabled = ()
+
+    _lock = _thread.allocate_lock()
+    _job_work = array("b", [0] * _JOB_SLOTS)
+    _job_arg = array("i", [0] * _JOB_SLOTS)
+    _job_head = 0
+    _job_count = 0
+    _result_work = array("b", [0] * _RESULT_SLOTS)
+    _result_arg = array("i", [0] * _RESULT_SLOTS)
+    _result_value = array("f", [0] * _RESULT_SLOTS)
+    _result_head = 0
+    _result_count = 0
+    _dropped_jobs = 0
+    _dropped_results = 0
+
+    _flag = asyncio.ThreadSafeFlag()
+    _stream = None     # Long-running function (DAC loop) that owns core 1
+    running = False
+    _thread_alive = False
+    _started_ms = 0
+    _busy_us = 0
+
+    @staticmethod
+    def register(name, function, handler):
+        """Register a workload; returns its id for submit()/dispatch()"""
+        if name in Core1Scheduler._names:
+            return Core1Scheduler._names.index(name)
+        Core1Scheduler._names.append(name)
+        Core1Scheduler._functions.append(function)
+        Core1Scheduler._handlers.append(handler)
+        Core1Scheduler._offload.append(name in Core1Scheduler.enabled)
+        Core1Scheduler._completed.append(0)
+        Core1Scheduler._failed.append(0)
+        return len(Core1Scheduler._names) - 1
+
+    @staticmethod
+    def offloads(work):
+        """True if jobs of this workload currently go to core 1"""
+        return (Core1Scheduler.running and Core1Scheduler._stream is None
+                and Core1Scheduler._offload[work])
+
+    @staticmethod
+    def submit(work, arg):
+        """Queue a job for core 1; False if the ring is full"""
+        lock = Core1Scheduler._lock
+        lock.acquire()
+        count = Core1Scheduler._job_count
+        if count == _JOB_SLOTS:
+            Core1Scheduler._dropped_jobs += 1
+            lock.release()
+            return False
+        index = (Core1Scheduler._job_head + count) % _JOB_SLOTS
+        Core1Scheduler._job_work[index] = work
+        Core1Scheduler._job_arg[index] = arg
+        Core1Scheduler._job_count = count + 1
+        lock.release()
+        return True
+
+    @staticmethod
+    def dispatch(work, arg):
+        """Run a job on core 1 if its workload is offloaded, otherwise inline"""
+        if Core1Scheduler.offloads(work) and Core1Scheduler.submit(work, arg):
+            return
+        value = Core1Scheduler._functions[work](arg)
+        if value is not None:
+            Core1Scheduler._handlers[work](arg, value)
+
+    @staticmethod
+    def _take_job():
+        """Pop the next job as (work, arg); work is -1 if the ring is empty"""
+        lock = Core1Scheduler._lock
+        lock.acquire()
+        if Core1Scheduler._job_count == 0:
+            lock.release()
+            return -1, 0
+        index = Core1Scheduler._job_head
+        work = Core1Scheduler._job_work[index]
+        arg = Core1Scheduler._job_arg[index]
+        Core1Scheduler._job_head = (index + 1) % _JOB_SLOTS
+        Core1Scheduler._job_count -= 1
+        lock.release()
+        return work, arg
+
+    @staticmethod
+    def _put_result(work, arg, value):
+        lock = Core1Scheduler._lock
+        lock.acquire()
+        count = Core1Scheduler._result_count
+        if count == _RESULT_SLOTS:
+            Core1Scheduler._dropped_results += 1
+            lock.release()
+            return
+        index = (Core1Scheduler._result_head + count) % _RESULT_SLOTS
+        Core1Scheduler._result_work[index] = work
+        Core1Scheduler._result_arg[index] = arg
+        Core1Scheduler._result_value[index] = value
+        Core1Scheduler._result_count = count + 1
+        lock.release()
+
+    @staticmethod
+    def _loop():
+        """Core 1: run the streaming workload if there is one, else drain jobs"""
+        Core1Scheduler._thread_alive = True
+        while Core1Scheduler.running:
+            stream = Core1Scheduler._stream
+            if stream is not None:
+                try:
+                    stream()
+                except Exception as e:
+                    print(f"❌ Core 1 stream error: {e}")
+                Core1Scheduler._stream = None
+                if not any(Core1Scheduler._offload):
+                    break  # Core 1 was only lent to the stream
+                continue
+
+            work, arg = Core1Scheduler._take_job()
+            if work < 0:
+                time.sleep_ms(1)
+                continue
+
+            start = time.ticks_us()
+            try:
+                value = Core1Scheduler._functions[work](arg)
+            except Exception:
+                value = None
+            Core1Scheduler._busy_us += time.ticks_diff(time.ticks_us(), start)
+            if value is None:
+                Core1Scheduler._failed[work] += 1
+                continue
+            Core1Scheduler._completed[work] += 1
+            Core1Scheduler._put_result(work, arg, value)
+            Core1Scheduler._flag.set()
+        Core1Scheduler.running = False
+        Core1Scheduler._thread_alive = False
+
+    @staticmethod
+    def _start_thread():
+        if Core1Scheduler._thread_alive:
+            return
+        Core1Scheduler.running = True
+        Core1Scheduler._thread_alive = True
+        Core1Scheduler._started_ms = time.ticks_ms()
+        Core1Scheduler._busy_us = 0
+        _thread.start_new_thread(Core1Scheduler._loop, ())
+
+    @staticmethod
+    def start(workloads):
+        """Choose the workloads that run on core 1 and start the work loop"""
+        Core1Scheduler.enabled = tuple(workloads)
+        for work, name in enumerate(Core1Scheduler._names):
+            Core1Scheduler._offload[work] = name in Core1Scheduler.enabled
+        if any(name != WORKLOAD_DAC for name in Core1Scheduler.enabled):
+            Core1Scheduler._start_thread()
+        print(f"🧵 Core 1 workloads: {', '.join(Core1Scheduler.enabled) or 'none'}")
+
+    @staticmethod
+    def start_stream(function):
+        """Give core 1 to a long-running function until it returns (DAC thread backend)"""
+        if Core1Scheduler._stream is not None:
+            raise ValueError("core 1 is already streaming")
+        Core1Scheduler._stream = function
+        Core1Scheduler._start_thread()
+
+    @staticmethod
+    def stop():
+        """Stop the work loop after the current job or stream"""
+        Core1Scheduler.running = False
+
+    @staticmethod
+    def _drain():
+        while True:
+            lock = Core1Scheduler._lock
+            lock.acquire()
+            if Core1Scheduler._result_count == 0:
+                lock.release()
+                return
+            index = Core1Scheduler._result_head
+            work = Core1Scheduler._result_work[index]
+            arg = Core1Scheduler._result_arg[index]
+            value = Core1Scheduler._result_value[index]
+            Core1Scheduler._result_head = (index + 1) % _RESULT_SLOTS
+            Core1Scheduler._result_count -= 1
+            lock.release()
+            try:
+                Core1Scheduler._handlers[work](arg, value)
+            except Exception as e:
+                print(f"❌ Core 1 result handler error ({Core1Scheduler._names[work]}): {e}")
+
+    @staticmethod
+    async def run():
+        """uasyncio side: hand core 1 results to their handlers"""
+        while True:
+            await Core1Scheduler._flag.wait()
+            Core1Scheduler._drain()
+
+    @staticmethod
+    def get_status():
+        uptime_ms = time.ticks_diff(time.ticks_ms(), Core1Scheduler._started_ms)
+        workloads = {}
+        for work, name in enumerate(Core1Scheduler._names):
+            workloads[name] = {
+                "onCore1": Core1Scheduler._offload[work],
+                "completed": Core1Scheduler._completed[work],
+                "failed": Core1Scheduler._failed[work],
+            }
+        return {
+            "running": Core1Scheduler._thread_alive,
+            "enabled": list(Core1Scheduler.enabled),
+            "streaming": Core1Scheduler._stream is not None,
+            "queuedJobs": Core1Scheduler._job_count,
+            "pendingResults": Core1Scheduler._result_count,
+            "droppedJobs": Core1Scheduler._dropped_jobs,
+            "droppedResults": Core1Scheduler._dropped_results,
+            "busyPercent": round(Core1Scheduler._busy_us / (uptime_ms * 10), 1) if Core1Scheduler._thread_alive and uptime_ms > 0 else 0,
+            "workloads": workloads,
+        }
@@ -0,0 +1,585 @@
+from machine import Pin, Timer, mem32
+import machine
+import micropython
+import time
+import uasyncio as asyncio
+from array import array
+from utils.core1 import Core1Scheduler
+from utils.power import PowerManager
+from utils.waveform import (
+    PIN_BASE, BITS, PIN_MASK, MAX_VALUE, SHAPES,
+    natural_samples, shape_values, build_table,
+)
+
+# RP2040 SIO registers: single-cycle GPIO writes for all DAC bits at once
+SIO_BASE = 0xD0000000
+GPIO_OUT_SET = SIO_BASE + 0x014
+GPIO_OUT_CLR = SIO_BASE + 0x018
+GPIO_OUT_XOR = SIO_BASE + 0x01C
+
+# RP2040 DMA and PIO0 registers used by the PIO backend
+DMA_BASE = 0x50000000
+DMA_CHANNEL_STRIDE = 0x40
+DMA_TRANS_COUNT = 0x08           # Alias 0, non-triggering (sets the reload value)
+DMA_AL3_READ_ADDR_TRIG = 0x3C
+DMA_CHAN_ABORT = DMA_BASE + 0x444
+PIO0_BASE = 0x50200000
+PIO0_TXF0 = PIO0_BASE + 0x010
+PIO0_SM0_CLKDIV = PIO0_BASE + 0x0C8
+PIO_SM_STRIDE = 0x18
+DREQ_PIO0_TX0 = 0
+DREQ_UNPACED = 0x3F
+
+BACKEND_THREAD = "thread"
+BACKEND_TIMER = "timer"
+BACKEND_PIO = "pio"
+
+# Shortest sample period each backend can sustain
+MIN_STEP_US = {
+    BACKEND_THREAD: 5,
+    BACKEND_TIMER: 20,
+    BACKEND_PIO: 1,
+}
+
+_PIO_CYCLES_PER_SAMPLE = 32  # out(pins, 7) [31]
+_PERIOD_LOG_SIZE = 16        # Period start times kept for the jitter self-test
+_SWAP_MARGIN_US = 100        # Time a live PIO table swap needs before the period boundary
+_MEASURE_CHUNK_US = 20000    # Longest busy-poll of the PIO self-test between yields
+
+pins = []
+
+def _claim_pins():
+    """Set up GPIO pins 6-12 as SIO outputs (also takes them back from PIO)"""
+    pins.clear()
+    for i in range(PIN_BASE, PIN_BASE + BITS):
+        pins.append(Pin(i, Pin.OUT))
+
+_claim_pins()
+
+
+class _PioOutput:
+    """Streams a sample table to GPIO 6-12 through a PIO state machine fed by
+    three chained DMA channels; the CPU is not involved once it is running.
+
+    The data channel copies one period into the TX FIFO (paced by the PIO DREQ)
+    and chains to the clock channel, which copies the pending divider into the
+    state machine's CLKDIV, then to the control channel, which writes the table
+    address back into the data channel's READ_ADDR_TRIG register, restarting
+    the next period. Table, length and rate thus all change at a boundary."""
+
+    def __init__(self, words, sample_rate, sm_id=0):
+        import rp2
+        import uctypes
+
+        @rp2.asm_pio(
+            out_init=(rp2.PIO.OUT_LOW,) * BITS,
+            out_shiftdir=rp2.PIO.SHIFT_RIGHT,
+            autopull=True,
+            pull_thresh=BITS,
+        )
+        def dac_program():
+            out(pins, 7)    [31]
+
+        self._addressof = uctypes.addressof
+        self.sm_id = sm_id
+        self.words = words
+        self._previous_words = None  # Kept alive until the swap takes effect
+        self._address = array("I", [self._addressof(words)])
+        self._clkdiv = array("I", [0])  # CLKDIV value the clock channel applies
+
+        self.sm = rp2.StateMachine(sm_id, dac_program, freq=2000, out_base=Pin(PIN_BASE))
+        self.set_sample_rate(sample_rate)
+
+        self.data = rp2.DMA()
+        self.clock = rp2.DMA()
+        self.control = rp2.DMA()
+        self._data_base = DMA_BASE + self.data.channel * DMA_CHANNEL_STRIDE
+        self._data_trans_count = self._data_base + DMA_TRANS_COUNT
+
+        self._start_channels(words)
+        self.sm.active(1)
+
+    def _start_channels(self, words):
+        """Configure the clock and control channels and start the data channel on words"""
+        self.clock.config(
+            read=self._clkdiv,
+            write=PIO0_SM0_CLKDIV + PIO_SM_STRIDE * self.sm_id,
+            count=1,
+            ctrl=self.clock.pack_ctrl(
+                size=2, inc_read=False, inc_write=False,
+                treq_sel=DREQ_UNPACED, chain_to=self.control.channel
+            ),
+        )
+        self.control.config(
+            read=self._address,
+            write=self._data_base + DMA_AL3_READ_ADDR_TRIG,
+            count=1,
+            ctrl=self.control.pack_ctrl(
+                size=2, inc_read=False, inc_write=False,
+                treq_sel=DREQ_UNPACED, chain_to=self.control.channel
+            ),
+        )
+        self.data.config(
+            read=words,
+            write=PIO0_TXF0 + 4 * self.sm_id,
+            count=len(words),
+            ctrl=self.data.pack_ctrl(
+                size=2, inc_read=True, inc_write=False,
+                treq_sel=DREQ_PIO0_TX0 + self.sm_id, chain_to=self.clock.channel
+            ),
+            trigger=True,
+        )
+
+    def set_sample_rate(self, sample_rate, at_boundary=False):
+        """Program the state machine clock divider (16.8 fixed point), live or,
+        with at_boundary, from the next period on. The divider is relative to
+        the system clock: call again after machine.freq() changes."""
+        self.sample_rate = sample_rate
+        divider = int(round(machine.freq() * 256 / (sample_rate * _PIO_CYCLES_PER_SAMPLE)))
+        divider = max(256, min(divider, 0xFFFFFF))
+        self._clkdiv[0] = divider << 8
+        if not at_boundary:
+            mem32[PIO0_SM0_CLKDIV + PIO_SM_STRIDE * self.sm_id] = divider << 8
+        self.divider = divider
+
+    def achieved_sample_rate(self):
+        return machine.freq() * 256 / (self.divider * _PIO_CYCLES_PER_SAMPLE)
+
+    def swap(self, words, sample_rate):
+        """Install a new table. The DMA picks it up at the next period boundary;
+        periods too short to stay clear of the boundary restart on the new table."""
+        step_us = 1000000 / self.sample_rate
+        period_us = len(self.words) * step_us
+        if period_us >= 2 * _SWAP_MARGIN_US and self._wait_clear_of_boundary(step_us, period_us):
+            # The reload must not fall between these writes: it would pair the
+            # new count with the old address (or the reverse) and overrun a table
+            state = machine.disable_irq()
+            mem32[self._data_trans_count] = len(words)
+            self._address[0] = self._addressof(words)
+            self.set_sample_rate(sample_rate, at_boundary=True)
+            machine.enable_irq(state)
+            self._previous_words = self.words
+        else:
+            self.set_sample_rate(sample_rate)
+            self._restart(words)
+        self.words = words
+
+    def _wait_clear_of_boundary(self, step_us, period_us):
+        """Wait until at least _SWAP_MARGIN_US of the current period remain;
+        False if that did not happen within one period"""
+        margin = _SWAP_MARGIN_US / step_us  # In samples
+        deadline = time.ticks_add(time.ticks_us(), int(period_us) + _SWAP_MARGIN_US)
+        while self.data.count < margin:
+            if time.ticks_diff(deadline, time.ticks_us()) <= 0:
+                return False
+        return True
+
+    def _restart(self, words):
+        """Stop the channels and start over on words (a short glitch in the output)"""
+        self.control.active(0)
+        self.clock.active(0)
+        self.data.active(0)
+        mem32[DMA_CHAN_ABORT] = (1 << self.data.channel) | (1 << self.clock.channel) | (1 << self.control.channel)
+        while mem32[DMA_CHAN_ABORT]:
+            pass
+        self._address[0] = self._addressof(words)
+        self._previous_words = None
+        self._start_channels(words)
+
+    @micropython.native
+    def measure(self, window_us):
+        """Busy-poll the data channel's remaining count against ticks_us for
+        window_us. Returns (samples transferred, elapsed us, longest gap
+        between polls in us, periods, their total us, shortest, longest).
+        Reloads are only all seen while the gap stays below one period."""
+        address = self._data_trans_count
+        length = len(self.words)
+        previous = mem32[address]
+        start = time.ticks_us()
+        last = start
+        last_reload = -1
+        samples = 0
+        max_gap = 0
+        periods = 0
+        period_sum = 0
+        shortest = 0
+        longest = 0
+        while True:
+            count = mem32[address]
+            now = time.ticks_us()
+            if count > previous:
+                # Reloaded: the rest of the old period plus progress into the new one
+                samples += previous + length - count
+                if last_reload >= 0:
+                    period = time.ticks_diff(now, last_reload)
+                    if periods == 0 or period < shortest:
+                        shortest = period
+                    if period > longest:
+                        longest = period
+                    period_sum += period
+                    periods += 1
+                last_reload = now
+            else:
+                samples += previous - count
+            previous = count
+            gap = time.ticks_diff(now, last)
+            if gap > max_gap:
+                max_gap = gap
+            last = now
+            if time.ticks_diff(now, start) >= window_us:
+                return samples, time.ticks_diff(now, start), max_gap, periods, period_sum, shortest, longest
+
+    def stop(self):
+        self.sm.active(0)
+        self.control.active(0)
+        self.clock.active(0)
+        self.data.active(0)
+        self.control.close()
+        self.clock.close()
+        self.data.close()
+        _claim_pins()
+
+
+class WaveformGenerator:
+    """Runtime-configurable DAC waveform output on GPIO 6-12"""
+
+    # Requested configuration
+    shape = "triangle"
+    frequency = 446.0   # Hz; 224 samples at 10µs, the original sawtooth
+    lower = 15
+    upper = 127
+    table = None        # Uploaded arbitrary table (0-127 values)
+
+    # Active table
+    samples = 0
+    step_us = 10
+    masks = None
+    deltas = None
+
+    # (masks, deltas, step_us) installed by the output loop at the next period boundary
+    _pending = None
+
+    backend = None
+    running = False
+    _thread_alive = False
+    _timer = None
+    _timer_index = 0
+    _pio = None
+
+    # Period start times (ticks_us) written by the thread/timer loops for the self-test
+    _period_log = array("i", [0] * _PERIOD_LOG_SIZE)
+    _period_count = 0
+
+    @staticmethod
+    def plan(shape, frequency, lower, upper, table=None, backend=BACKEND_THREAD):
+        """Pick samples per period and step time for a target frequency.
+        Returns (values, step_us)."""
+        if shape not in SHAPES:
+            raise ValueError("Invalid shape")
+        if frequency <= 0:
+            raise ValueError("frequency must be positive")
+        if not (0 <= lower <= MAX_VALUE and 0 <= upper <= MAX_VALUE and lower <= upper):
+            raise ValueError("limits must satisfy 0 <= lower <= upper <= 127")
+
+        min_step = MIN_STEP_US[backend]
+        max_samples = int(1000000 / (frequency * min_step))
+        if max_samples < 2:
+            raise ValueError(f"frequency too high for the {backend} backend")
+        samples = min(natural_samples(shape, lower, upper, table), max_samples)
+        if backend == BACKEND_PIO:
+            # The PIO clock divider is fractional, no need to round the step
+            if frequency * samples < machine.freq() / (0xFFFF * _PIO_CYCLES_PER_SAMPLE):
+                raise ValueError("frequency too low for the pio backend")
+            step_us = 1000000 / (frequency * samples)
+        else:
+            step_us = max(min_step, int(round(1000000 / (frequency * samples))))
+        return shape_values(shape, lower, upper, samples, table), step_us
+
+    @staticmethod
+    def configure(shape=None, frequency=None, lower=None, upper=None, table=None):
+        """Change the waveform; a running output switches at the next period boundary"""
+        shape = shape or WaveformGenerator.shape
+        frequency = float(frequency or WaveformGenerator.frequency)
+        lower = WaveformGenerator.lower if lower is None else int(lower)
+        upper = WaveformGenerator.upper if upper is None else int(upper)
+        if shape == "arbitrary":
+            table = table or WaveformGenerator.table
+            if not table or len(table) > 256:
+                raise ValueError("arbitrary shape needs a table of 1-256 values")
+        backend = WaveformGenerator.backend or BACKEND_THREAD
+
+        values, step_us = WaveformGenerator.plan(shape, frequency, lower, upper, table, backend)
+        masks, deltas = build_table(values)
+
+        WaveformGenerator.shape = shape
+        WaveformGenerator.frequency = frequency
+        WaveformGenerator.lower = lower
+        WaveformGenerator.upper = upper
+        WaveformGenerator.table = table if shape == "arbitrary" else None
+        WaveformGenerator.samples = len(values)
+
+        if not WaveformGenerator.running:
+            WaveformGenerator.masks = masks
+            WaveformGenerator.deltas = deltas
+            WaveformGenerator.step_us = step_us
+        elif backend == BACKEND_PIO:
+            # DMA reloads the table at the next period boundary by itself
+            WaveformGenerator._pio.swap(WaveformGenerator._pio_words(masks), 1000000 / step_us)
+            WaveformGenerator.masks = masks
+            WaveformGenerator.deltas = deltas
+            WaveformGenerator.step_us = step_us
+        elif backend == BACKEND_TIMER and step_us != WaveformGenerator.step_us:
+            # The timer period cannot change inside its own callback: restart it
+            WaveformGenerator.stop()
+            WaveformGenerator.masks = masks
+            WaveformGenerator.deltas = deltas
+            WaveformGenerator.step_us = step_us
+            WaveformGenerator.start(BACKEND_TIMER)
+        else:
+            WaveformGenerator._pending = (masks, deltas, step_us)
+        return WaveformGenerator.get_status()
+
+    @staticmethod
+    def _pio_words(masks):
+        """PIO shifts the DAC value straight onto the pins: one 32-bit word per sample"""
+        return array("I", [mask >> PIN_BASE for mask in masks])
+
+    @staticmethod
+    def _log_period():
+        """Record the start of a period (called once per period, no allocation)"""
+        count = WaveformGenerator._period_count
+        WaveformGenerator._period_log[count % _PERIOD_LOG_SIZE] = time.ticks_us()
+        WaveformGenerator._period_count = count + 1
+
+    @staticmethod
+    def _prime_output():
+        """Drive the pins to the last sample of the table so XOR deltas start in sync"""
+        masks = WaveformGenerator.masks
+        mem32[GPIO_OUT_CLR] = PIN_MASK
+        mem32[GPIO_OUT_SET] = masks[len(masks) - 1]
+
+    @staticmethod
+    def _take_pending(masks):
+        """Install the pending table; returns the delta that moves the output from
+        the last sample of the current table to the first sample of the new one"""
+        new_masks, new_deltas, step_us = WaveformGenerator._pending
+        WaveformGenerator._pending = None
+        WaveformGenerator.masks = new_masks
+        WaveformGenerator.deltas = new_deltas
+        WaveformGenerator.step_us = step_us
+        return new_deltas[0] ^ new_masks[len(new_masks) - 1] ^ masks[len(masks) - 1]
+
+    @staticmethod
+    @micropython.native
+    def _thread_loop():
+        """Busy-wait output loop for core 1: one GPIO_OUT_XOR write per sample"""
+        WaveformGenerator._thread_alive = True
+        masks = WaveformGenerator.masks
+        deltas = WaveformGenerator.deltas
+        step_us = WaveformGenerator.step_us
+        count = len(deltas)
+        i = 0
+        next_us = time.ticks_us()
+        while True:
+            if i == 0:
+                WaveformGenerator._log_period()
+                if WaveformGenerator._pending is not None:
+                    delta = WaveformGenerator._take_pending(masks)
+                    masks = WaveformGenerator.masks
+                    deltas = WaveformGenerator.deltas
+                    step_us = WaveformGenerator.step_us
+                    count = len(deltas)
+                else:
+                    delta = deltas[0]
+            else:
+                delta = deltas[i]
+
+            # Checked while waiting too, so stop() returns within one sample
+            # even when a period lasts seconds
+            while time.ticks_diff(next_us, time.ticks_us()) > 0:
+                if not WaveformGenerator.running:
+                    break
+            if not WaveformGenerator.running:
+                break
+            mem32[GPIO_OUT_XOR] = delta
+            next_us = time.ticks_add(next_us, step_us)
+
+            i += 1
+            if i == count:
+                i = 0
+        mem32[GPIO_OUT_CLR] = PIN_MASK
+        WaveformGenerator._thread_alive = False
+
+    @staticmethod
+    def _timer_callback(timer):
+        """Timer backend: one sample per tick, table swaps at the period boundary"""
+        i = WaveformGenerator._timer_index
+        if i == 0:
+            WaveformGenerator._log_period()
+        if i == 0 and WaveformGenerator._pending is not None:
+            delta = WaveformGenerator._take_pending(WaveformGenerator.masks)
+        else:
+            delta = WaveformGenerator.deltas[i]
+        mem32[GPIO_OUT_XOR] = delta
+        i += 1
+        if i >= len(WaveformGenerator.deltas):
+            i = 0
+        WaveformGenerator._timer_index = i
+
+    @staticmethod
+    def start(backend=BACKEND_THREAD):
+        """Start streaming the active table with the selected backend"""
+        if WaveformGenerator.running:
+            return WaveformGenerator.get_status()
+        if backend not in MIN_STEP_US:
+            raise ValueError("Invalid backend")
+        if WaveformGenerator._thread_alive:
+            raise ValueError("previous output thread has not exited yet")
+
+        if backend != WaveformGenerator.backend or WaveformGenerator.masks is None:
+            # Step limits differ per backend, so re-plan the table for it
+            WaveformGenerator.backend = backend
+            WaveformGenerator._pending = None
+            WaveformGenerator.running = False
+            WaveformGenerator.configure()
+
+        WaveformGenerator.running = True
+        WaveformGenerator._period_count = 0
+
+        if backend == BACKEND_PIO:
+            WaveformGenerator._pio = _PioOutput(
+                WaveformGenerator._pio_words(WaveformGenerator.masks),
+                1000000 / WaveformGenerator.step_us
+            )
+        elif backend == BACKEND_THREAD:
+            WaveformGenerator._prime_output()
+            # Core 1 runs one thread only: the scheduler lends it to the output loop
+            Core1Scheduler.start_stream(WaveformGenerator._thread_loop)
+        else:
+            WaveformGenerator._prime_output()
+            WaveformGenerator._timer_index = 0
+            WaveformGenerator._timer = Timer()
+            WaveformGenerator._timer.init(
+                freq=1000000 // WaveformGenerator.step_us,
+                mode=Timer.PERIODIC,
+                callback=WaveformGenerator._timer_callback
+            )
+        print(f"〰️ Waveform {WaveformGenerator.shape} started ({backend}, {WaveformGenerator.get_achieved_frequency():.1f}Hz)")
+        return WaveformGenerator.get_status()
+
+    @staticmethod
+    def stop():
+        """Stop output and drive the pins low; the thread exits within one sample"""
+        WaveformGenerator.running = False
+        if WaveformGenerator._pio is not None:
+            WaveformGenerator._pio.stop()
+            WaveformGenerator._pio = None
+            mem32[GPIO_OUT_CLR] = PIN_MASK
+        elif WaveformGenerator._timer is not None:
+            WaveformGenerator._timer.deinit()
+            WaveformGenerator._timer = None
+            mem32[GPIO_OUT_CLR] = PIN_MASK
+        else:
+            # The thread clears the pins itself when it exits
+            deadline = time.ticks_add(time.ticks_ms(), 100)
+            while WaveformGenerator._thread_alive and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+                time.sleep_ms(1)
+        if WaveformGenerator._pending is not None and not WaveformGenerator._thread_alive:
+            WaveformGenerator._take_pending(WaveformGenerator.masks)
+        print("〰️ Waveform stopped")
+        return WaveformGenerator.get_status()
+
+    @staticmethod
+    def _on_power_mode(mode, settings):
+        """Power modes may change the system clock, which the PIO divider is derived from"""
+        if WaveformGenerator._pio is not None:
+            WaveformGenerator._pio.set_sample_rate(WaveformGenerator._pio.sample_rate)
+
+    @staticmethod
+    def get_achieved_frequency():
+        """Frequency the backend is programmed for (the self-test measures the real one)"""
+        count = len(WaveformGenerator.deltas) if WaveformGenerator.deltas else 0
+        if not count:
+            return 0
+        if WaveformGenerator._pio is not None:
+            return WaveformGenerator._pio.achieved_sample_rate() / count
+        return 1000000 / (WaveformGenerator.step_us * count)
+
+    @staticmethod
+    async def self_test(duration_ms=500):
+        """Report achieved versus requested frequency and period jitter"""
+        if not WaveformGenerator.running:
+            raise ValueError("waveform is not running")
+        requested = WaveformGenerator.frequency
+        result = {
+            "backend": WaveformGenerator.backend,
+            "requestedHz": requested,
+            "programmedHz": round(WaveformGenerator.get_achieved_frequency(), 3),
+        }
+
+        if WaveformGenerator.backend == BACKEND_PIO:
+            # Measure DMA progress, in chunks so the event loop keeps running
+            pio = WaveformGenerator._pio
+            samples = elapsed_us = max_gap = periods = period_sum = longest = 0
+            shortest = None
+            deadline = time.ticks_add(time.ticks_ms(), duration_ms)
+            while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+                chunk = pio.measure(_MEASURE_CHUNK_US)
+                samples += chunk[0]
+                elapsed_us += chunk[1]
+                max_gap = max(max_gap, chunk[2])
+                if chunk[3]:
+                    periods += chunk[3]
+                    period_sum += chunk[4]
+                    shortest = chunk[5] if shortest is None else min(shortest, chunk[5])
+                    longest = max(longest, chunk[6])
+                await asyncio.sleep_ms(0)
+            period_us = len(pio.words) * 1000000 / pio.achieved_sample_rate()
+            if max_gap * 2 >= period_us:
+                raise ValueError("period too short to measure by polling the DMA, lower the frequency")
+            result["streaming"] = samples > 0
+            achieved = samples * 1000000 / (elapsed_us * len(pio.words))
+            result["achievedHz"] = round(achieved, 3)
+            if periods:
+                mean_us = period_sum / periods
+                result["jitterUs"] = round(max(longest - mean_us, mean_us - shortest), 1)
+            else:
+                result["jitterUs"] = None
+            result["periodsMeasured"] = periods
+            result["resolutionUs"] = max_gap  # Polling granularity, included in the jitter
+        else:
+            start_count = WaveformGenerator._period_count
+            await asyncio.sleep_ms(duration_ms)
+            end_count = WaveformGenerator._period_count
+            logged = min(end_count - start_count, _PERIOD_LOG_SIZE)
+            if logged < 3:
+                raise ValueError("too few periods in the test window, increase duration_ms")
+            log = WaveformGenerator._period_log
+            starts = [log[(end_count - logged + k) % _PERIOD_LOG_SIZE] for k in range(logged)]
+            periods = [time.ticks_diff(starts[k + 1], starts[k]) for k in range(logged - 1)]
+            mean_us = sum(periods) / len(periods)
+            achieved = 1000000 / mean_us
+            result["achievedHz"] = round(achieved, 3)
+            result["jitterUs"] = max(abs(period - mean_us) for period in periods)
+            result["periodsMeasured"] = len(periods)
+
+        result["errorPct"] = round((achieved - requested) * 100 / requested, 3)
+        return result
+
+    @staticmethod
+    def get_status():
+        return {
+            "running": WaveformGenerator.running,
+            "backend": WaveformGenerator.backend,
+            "shape": WaveformGenerator.shape,
+            "frequency": WaveformGenerator.frequency,
+            "achievedFrequency": round(WaveformGenerator.get_achieved_frequency(), 2),
+            "lower": WaveformGenerator.lower,
+            "upper": WaveformGenerator.upper,
+            "samples": WaveformGenerator.samples,
+            "stepUs": WaveformGenerator.step_us,
+            "pending": WaveformGenerator._pending is not None,
+        }
+
+
+PowerManager.on_mode_change(WaveformGenerator._on_power_mode)
@@ -0,0 +1,65 @@
+import time
+import uasyncio as asyncio
+from micropython import const
+
+_RECENT_SIZE = const(32)  # Events kept for GET /events
+
+_subscribers = []
+_recent = []
+_sequence = 0
+_new_event = asyncio.Event()
+
+
+def subscribe(callback):
+    """Register callback(topic, data) for every published event"""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def publish(topic, data):
+    """Publish an event to subscribers and waiting HTTP clients.
+    Only from uasyncio code on core 0: it sets an asyncio.Event, which is not
+    safe from IRQs, micropython.schedule callbacks or core 1. Those should set
+    a ThreadSafeFlag and publish from the task waiting on it."""
+    global _sequence
+    _sequence += 1
+    event = {"seq": _sequence, "t": time.ticks_ms(), "topic": topic, "data": data}
+    _recent.append(event)
+    if len(_recent) > _RECENT_SIZE:
+        _recent.pop(0)
+
+    for callback in _subscribers:
+        try:
+            callback(topic, data)
+        except Exception as e:
+            print(f"❌ Event subscriber error: {e}")
+
+    _new_event.set()
+    return event
+
+
+def get_recent(since=0):
+    """Return buffered events with a sequence number greater than since"""
+    return [event for event in _recent if event["seq"] > since]
+
+
+def last_sequence():
+    return _sequence
+
+
+async def wait_for_events(since=0, timeout_ms=0):
+    """Long-poll helper: wait up to timeout_ms for events newer than since"""
+    events = get_recent(since)
+    if events or timeout_ms <= 0:
+        return events
+    _new_event.clear()
+    try:
+        await asyncio.wait_for_ms(_new_event.wait(), timeout_ms)
+    except asyncio.TimeoutError:
+        pass
+    return get_recent(since)
@@ -0,0 +1,197 @@
+import gc
+import time
+import uasyncio as asyncio
+from micropython import const
+
+_MAX_OFFENDERS = const(5)       # Worst blocking sections kept
+_HEAP_HISTORY_SIZE = const(30)  # Heap samples kept (ring buffer)
+_FRAG_SEARCH_STEPS = const(10)  # Binary search steps for largest free block
+
+
+class _BlockingSection:
+    """Context manager that times a known blocking call and records it as an offender"""
+
+    def __init__(self, label):
+        self.label = label
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.ticks_ms()
+        HealthMonitor.current_label = self.label
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.ticks_diff(time.ticks_ms(), self.start)
+        HealthMonitor.current_label = None
+        HealthMonitor.record_offender(self.label, duration)
+        return False
+
+
+class HealthMonitor:
+    """Background monitor for event-loop lag and heap usage"""
+
+    # Scheduler lag
+    tick_ms = 100                  # Expected interval between monitor ticks
+    ticks = 0
+    last_lag_ms = 0
+    max_lag_ms = 0
+    total_lag_ms = 0
+    lag_warn_ms = 250              # Lag above this is recorded as an offender
+    current_label = None           # Label of the blocking section currently running
+
+    # Worst offenders: list of [label, duration_ms, uptime_ms], sorted worst first
+    offenders = []
+
+    # Heap history ring buffer: [uptime_s, mem_free, mem_alloc, fragmentation_pct]
+    heap_interval_ms = 5000
+    heap_history = []
+    _heap_index = 0
+    _last_heap_ms = 0
+
+    # Optional hardware watchdog fed only while the loop is healthy
+    watchdog = None
+    watchdog_lag_limit_ms = 1000
+
+    boot_ms = time.ticks_ms()
+    first_response_ms = None       # Boot to the first HTTP response sent
+    running = False
+
+    @staticmethod
+    def blocking(label):
+        """Wrap a known blocking call: `with HealthMonitor.blocking("wifi_scan"): ...`"""
+        return _BlockingSection(label)
+
+    @staticmethod
+    def uptime_ms():
+        return time.ticks_diff(time.ticks_ms(), HealthMonitor.boot_ms)
+
+    @staticmethod
+    def note_response():
+        """Call after an HTTP response is sent; records boot-to-first-response once"""
+        if HealthMonitor.first_response_ms is None:
+            HealthMonitor.first_response_ms = HealthMonitor.uptime_ms()
+            print(f"⏱️ First HTTP response {HealthMonitor.first_response_ms}ms after boot")
+
+    @staticmethod
+    def record_offender(label, duration_ms):
+        """Keep the worst blocking sections seen so far"""
+        offenders = HealthMonitor.offenders
+        if len(offenders) >= _MAX_OFFENDERS and duration_ms <= offenders[-1][1]:
+            return
+        offenders.append([label, duration_ms, HealthMonitor.uptime_ms()])
+        offenders.sort(key=lambda item: item[1], reverse=True)
+        del offenders[_MAX_OFFENDERS:]
+
+    @staticmethod
+    def enable_watchdog(timeout_ms=8000, lag_limit_ms=1000):
+        """Start the hardware watchdog; it is only fed while loop lag stays below lag_limit_ms"""
+        try:
+            from machine import WDT
+            HealthMonitor.watchdog = WDT(timeout=timeout_ms)
+            HealthMonitor.watchdog_lag_limit_ms = lag_limit_ms
+            print(f"🐶 Watchdog enabled: timeout={timeout_ms}ms, lag limit={lag_limit_ms}ms")
+        except Exception as e:
+            print(f"⚠️ Could not enable watchdog: {e}")
+            HealthMonitor.watchdog = None
+
+    @staticmethod
+    def _largest_free_block(mem_free):
+        """Estimate the largest allocatable block with a bounded binary search"""
+        low = 0
+        high = mem_free
+        for _ in range(_FRAG_SEARCH_STEPS):
+            if high - low <= 16:
+                break
+            size = (low + high) // 2
+            try:
+                block = bytearray(size)
+                del block
+                low = size
+            except MemoryError:
+                high = size
+        return low
+
+    @staticmethod
+    def sample_heap():
+        """Record one heap sample into the history ring buffer"""
+        gc.collect()
+        mem_free = gc.mem_free()
+        mem_alloc = gc.mem_alloc()
+        largest = HealthMonitor._largest_free_block(mem_free)
+        fragmentation = 0
+        if mem_free > 0:
+            fragmentation = 100 - (largest * 100) // mem_free
+
+        sample = [HealthMonitor.uptime_ms() // 1000, mem_free, mem_alloc, fragmentation]
+        history = HealthMonitor.heap_history
+        if len(history) < _HEAP_HISTORY_SIZE:
+            history.append(sample)
+        else:
+            history[HealthMonitor._heap_index] = sample
+        HealthMonitor._heap_index = (HealthMonitor._heap_index + 1) % _HEAP_HISTORY_SIZE
+        return sample
+
+    @staticmethod
+    async def run(tick_ms=100):
+        """Measure how late each tick is scheduled and sample the heap periodically"""
+        if HealthMonitor.running:
+            return
+        HealthMonitor.running = True
+        HealthMonitor.tick_ms = tick_ms
+        print(f"🩺 Health monitor started (tick={tick_ms}ms)")
+
+        HealthMonitor.sample_heap()
+        HealthMonitor._last_heap_ms = time.ticks_ms()
+
+        while True:
+            expected = time.ticks_add(time.ticks_ms(), tick_ms)
+            await asyncio.sleep_ms(tick_ms)
+            now = time.ticks_ms()
+            lag = max(0, time.ticks_diff(now, expected))
+
+            HealthMonitor.ticks += 1
+            HealthMonitor.last_lag_ms = lag
+            HealthMonitor.total_lag_ms += lag
+            if lag > HealthMonitor.max_lag_ms:
+                HealthMonitor.max_lag_ms = lag
+            if lag > HealthMonitor.lag_warn_ms:
+                HealthMonitor.record_offender(HealthMonitor.current_label or "event_loop", lag)
+
+            if HealthMonitor.watchdog and lag < HealthMonitor.watchdog_lag_limit_ms:
+                HealthMonitor.watchdog.feed()
+
+            if time.ticks_diff(now, HealthMonitor._last_heap_ms) >= HealthMonitor.heap_interval_ms:
+                HealthMonitor._last_heap_ms = now
+                HealthMonitor.sample_heap()
+
+    @staticmethod
+    def get_report():
+        """Return the current health snapshot as a dict"""
+        ticks = HealthMonitor.ticks
+        history = HealthMonitor.heap_history
+        # Return heap history oldest first
+        if len(history) == _HEAP_HISTORY_SIZE:
+            index = HealthMonitor._heap_index
+            history = history[index:] + history[:index]
+
+        return {
+            "uptimeMs": HealthMonitor.uptime_ms(),
+            "firstResponseMs": HealthMonitor.first_response_ms,
+            "loop": {
+                "tickMs": HealthMonitor.tick_ms,
+                "ticks": ticks,
+                "lastLagMs": HealthMonitor.last_lag_ms,
+                "maxLagMs": HealthMonitor.max_lag_ms,
+                "avgLagMs": (HealthMonitor.total_lag_ms // ticks) if ticks else 0,
+            },
+            "heap": {
+                "free": gc.mem_free(),
+                "alloc": gc.mem_alloc(),
+                "history": history,
+            },
+            "offenders": [
+                {"label": label, "durationMs": duration, "atMs": at}
+                for label, duration, at in HealthMonitor.offenders
+            ],
+            "watchdog": HealthMonitor.watchdog is not None,
+        }
@@ -0,0 +1,97 @@
+import time
+from micropython import const
+
+# Log levels
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+_RING_SIZE = const(64)  # Entries kept in RAM for GET /debug/logs
+
+# Messages below `level` are dropped before any formatting happens.
+# Messages at or above `echo_level` are also printed to the REPL.
+level = INFO
+echo_level = INFO
+
+_ring = [None] * _RING_SIZE
+_index = 0
+_count = 0
+
+
+def set_level(new_level):
+    """Set the capture level from an int or a name like "debug" """
+    global level
+    if isinstance(new_level, str):
+        for value, name in LEVEL_NAMES.items():
+            if name == new_level.upper():
+                new_level = value
+                break
+        else:
+            raise ValueError("Invalid log level")
+    elif type(new_level) is not int or new_level not in LEVEL_NAMES:
+        raise ValueError("Invalid log level")  # Also rejects floats and bools
+    level = new_level
+
+
+def set_echo_level(new_level):
+    """Set the minimum level printed to the REPL"""
+    global echo_level
+    echo_level = new_level
+
+
+def _log(msg_level, msg, args):
+    global _index, _count
+    # Lazy formatting: only done once we know the message is kept
+    if args:
+        try:
+            msg = msg % args
+        except Exception:
+            msg = f"{msg} {args}"
+    _ring[_index] = (time.ticks_ms(), msg_level, msg)
+    _index = (_index + 1) % _RING_SIZE
+    if _count < _RING_SIZE:
+        _count += 1
+    if msg_level >= echo_level:
+        print(msg)
+
+
+def debug(msg, *args):
+    if level <= DEBUG:
+        _log(DEBUG, msg, args)
+
+
+def info(msg, *args):
+    if level <= INFO:
+        _log(INFO, msg, args)
+
+
+def warning(msg, *args):
+    if level <= WARNING:
+        _log(WARNING, msg, args)
+
+
+def error(msg, *args):
+    if level <= ERROR:
+        _log(ERROR, msg, args)
+
+
+def get_entries(min_level=DEBUG):
+    """Return buffered log entries, oldest first"""
+    start = (_index - _count) % _RING_SIZE
+    entries = []
+    for i in range(_count):
+        ticks, msg_level, msg = _ring[(start + i) % _RING_SIZE]
+        if msg_level >= min_level:
+            entries.append({"t": ticks, "level": LEVEL_NAMES[msg_level], "msg": msg})
+    return entries
+
+
+def clear():
+    global _index, _count
+    for i in range(_RING_SIZE):
+        _ring[i] = None
+    _index = 0
+    _count = 0
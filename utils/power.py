@@ -0,0 +1,202 @@
+import time
+import machine
+import uasyncio as asyncio
+import utils.battery as battery
+
+try:
+    from network import WLAN as _WLAN
+except ImportError:
+    _WLAN = None
+
+# CYW43 power-management values: network.WLAN.PM_* where the firmware has
+# them, else the raw values those constants stand for
+_WIFI_PM_NONE = getattr(_WLAN, "PM_NONE", 0xa11140)
+_WIFI_PM_PERFORMANCE = getattr(_WLAN, "PM_PERFORMANCE", 0xa11142)
+_WIFI_PM_POWERSAVE = getattr(_WLAN, "PM_POWERSAVE", 0xa11c82)
+
+MODE_PERFORMANCE = "performance"
+MODE_BALANCED = "balanced"
+MODE_SAVER = "saver"
+MODE_AUTO = "auto"
+
+# Settings applied for each mode
+MODES = {
+    MODE_PERFORMANCE: {
+        "scanInterval": 0.5,       # I2C scan period (s)
+        "batteryInterval": 30,     # Battery sample period (s)
+        "wifiPm": _WIFI_PM_NONE,
+        "cpuFreq": 125000000,
+    },
+    MODE_BALANCED: {
+        "scanInterval": 2.0,
+        "batteryInterval": 60,
+        "wifiPm": _WIFI_PM_PERFORMANCE,
+        "cpuFreq": 125000000,
+    },
+    MODE_SAVER: {
+        "scanInterval": 5.0,
+        "batteryInterval": 120,
+        "wifiPm": _WIFI_PM_POWERSAVE,
+        "cpuFreq": 64000000,
+    },
+}
+
+# From fastest to slowest
+_MODE_ORDER = (MODE_PERFORMANCE, MODE_BALANCED, MODE_SAVER)
+
+
+class PowerManager:
+    """Chooses a power mode from request rate, bus activity and battery level"""
+
+    mode = MODE_PERFORMANCE
+    requested_mode = MODE_AUTO   # "auto" or a forced mode
+    evaluate_interval_s = 10
+
+    # Policy thresholds
+    active_requests_per_min = 6  # At or above this the device counts as busy
+    idle_after_s = 60            # No requests/bus activity for this long = idle
+    low_battery_pct = 25         # Below this, never use performance mode
+    min_dwell_s = 20             # Minimum time between automatic mode changes
+    adjust_cpu_freq = True
+
+    # Activity tracking
+    _request_times = []          # ticks_ms of recent requests (last minute)
+    _last_activity_ms = time.ticks_ms()
+    _last_change_ms = time.ticks_ms()
+    _mode_change_callbacks = []
+    running = False
+
+    @staticmethod
+    def note_request():
+        """Call once per handled HTTP request"""
+        now = time.ticks_ms()
+        PowerManager._last_activity_ms = now
+        PowerManager._request_times.append(now)
+        if len(PowerManager._request_times) > 120:
+            PowerManager._request_times.pop(0)
+        if PowerManager.mode == MODE_SAVER and PowerManager.requested_mode == MODE_AUTO:
+            # Wake up immediately instead of waiting for the next evaluation
+            PowerManager._set_mode(MODE_BALANCED)
+
+    @staticmethod
+    def note_bus_activity():
+        """Call when devices appear/disappear or controls are written"""
+        PowerManager._last_activity_ms = time.ticks_ms()
+
+    @staticmethod
+    def on_mode_change(callback):
+        """Register callback(mode, settings) called after every mode change"""
+        PowerManager._mode_change_callbacks.append(callback)
+
+    @staticmethod
+    def requests_per_minute():
+        now = time.ticks_ms()
+        times = PowerManager._request_times
+        while times and time.ticks_diff(now, times[0]) > 60000:
+            times.pop(0)
+        return len(times)
+
+    @staticmethod
+    def choose_mode():
+        """Apply the policy and return the mode the device should be in"""
+        if PowerManager.requested_mode != MODE_AUTO:
+            return PowerManager.requested_mode
+
+        idle_s = time.ticks_diff(time.ticks_ms(), PowerManager._last_activity_ms) // 1000
+        busy = PowerManager.requests_per_minute() >= PowerManager.active_requests_per_min
+        low_battery = battery.getBatteryPercentage() < PowerManager.low_battery_pct
+
+        if busy and not low_battery:
+            return MODE_PERFORMANCE
+        if idle_s >= PowerManager.idle_after_s:
+            return MODE_SAVER
+        return MODE_BALANCED
+
+    @staticmethod
+    def set_requested_mode(mode):
+        """Force a mode, or "auto" to let the policy decide"""
+        if mode != MODE_AUTO and mode not in MODES:
+            raise ValueError("Invalid power mode")
+        PowerManager.requested_mode = mode
+        PowerManager._set_mode(PowerManager.choose_mode())
+        return PowerManager.get_status()
+
+    @staticmethod
+    def _set_mode(mode):
+        if mode == PowerManager.mode:
+            return
+        print(f"🔋 Power mode: {PowerManager.mode} -> {mode}")
+        PowerManager.mode = mode
+        PowerManager._last_change_ms = time.ticks_ms()
+        PowerManager._apply(MODES[mode])
+
+    @staticmethod
+    def apply_wifi_pm(wlan=None):
+        """Set the current mode's WiFi power management; connecting must call
+        this again, since (re)association does not keep it"""
+        try:
+            if wlan is None:
+                import network
+                wlan = network.WLAN(network.STA_IF)
+            if wlan.active():
+                wlan.config(pm=MODES[PowerManager.mode]["wifiPm"])
+        except Exception as e:
+            print(f"⚠️ Could not set WiFi power mode: {e}")
+
+    @staticmethod
+    def _apply(settings):
+        from module.module_manager import ModuleManager
+
+        ModuleManager.set_i2c_scan_interval(settings["scanInterval"])
+        battery.sample_interval_s = settings["batteryInterval"]
+
+        PowerManager.apply_wifi_pm()
+
+        if PowerManager.adjust_cpu_freq and machine.freq() != settings["cpuFreq"]:
+            try:
+                machine.freq(settings["cpuFreq"])
+                # Peripheral clocks follow the system clock: re-derive the I2C baud rate
+                ModuleManager.reinitialize_i2c()
+            except Exception as e:
+                print(f"⚠️ Could not set CPU frequency: {e}")
+
+        for callback in PowerManager._mode_change_callbacks:
+            try:
+                callback(PowerManager.mode, settings)
+            except Exception as e:
+                print(f"❌ Power mode callback error: {e}")
+
+    @staticmethod
+    async def run(interval_s=None):
+        """Periodically re-evaluate the policy"""
+        if PowerManager.running:
+            return
+        PowerManager.running = True
+        if interval_s is not None:
+            PowerManager.evaluate_interval_s = interval_s
+        PowerManager._apply(MODES[PowerManager.mode])
+        print(f"🔋 Power manager started in {PowerManager.mode} mode")
+
+        while True:
+            await asyncio.sleep(PowerManager.evaluate_interval_s)
+            try:
+                mode = PowerManager.choose_mode()
+                dwell_s = time.ticks_diff(time.ticks_ms(), PowerManager._last_change_ms) // 1000
+                # Speed-ups apply at once; slow-downs wait for the dwell time
+                speeding_up = _MODE_ORDER.index(mode) < _MODE_ORDER.index(PowerManager.mode)
+                if speeding_up or dwell_s >= PowerManager.min_dwell_s:
+                    PowerManager._set_mode(mode)
+            except Exception as e:
+                print(f"❌ Power policy error: {e}")
+
+    @staticmethod
+    def get_status():
+        return {
+            "mode": PowerManager.mode,
+            "requestedMode": PowerManager.requested_mode,
+            "settings": MODES[PowerManager.mode],
+            "requestsPerMinute": PowerManager.requests_per_minute(),
+            "idleS": time.ticks_diff(time.ticks_ms(), PowerManager._last_activity_ms) // 1000,
+            "batteryLevel": battery.getBatteryPercentage(),
+            "cpuFreq": machine.freq(),
+        }
@@ -0,0 +1,242 @@
+import json
+import time
+import uasyncio as asyncio
+from utils.sampler import Sampler
+from utils.commands import CommandQueue
+import utils.events as events
+
+RULES_FILE = "rules.json"  # Uploaded rule definitions
+
+# Rule definition (as uploaded):
+#
+#   {"id": "gas-vent",
+#    "when": {"all": [{"uuid": "<gas uuid>", "op": ">", "value": 300, "hysteresis": 20, "forMs": 2000}]},
+#    "then": [{"uuid": "<relay uuid>", "state": 1}],
+#    "else": [{"uuid": "<relay uuid>", "state": 0}]}
+#
+# "when" holds "all" or "any" of its conditions. A condition with op ">" turns
+# on at value > threshold and off below threshold - hysteresis ("<" mirrors
+# it), and only counts once it has held for forMs. "then" runs when the rule
+# becomes true, the optional "else" when it becomes false again.
+
+_OPS = (">", "<")
+
+
+class RuleEngine:
+    """Local automation evaluated on every sampler reading.
+
+    Uploaded rules are compiled into flat parallel tables: one row per
+    condition, one per rule, and an index from sensor UUID to its condition
+    rows. A sample only touches the rows of its own sensor and the rules using
+    them. Actions are queued and applied by run(), outside the listener."""
+
+    definitions = []
+
+    # Condition table
+    _cond_uuid = []
+    _cond_above = []      # True for ">", False for "<"
+    _cond_on = []         # Threshold that sets the condition
+    _cond_off = []        # Threshold that clears it (hysteresis)
+    _cond_for_ms = []
+    _cond_level = bytearray()
+    _cond_since = []      # ticks_ms the level went up
+    _cond_active = bytearray()
+    _cond_rule = []       # Condition -> rule row
+    _by_uuid = {}         # Sensor UUID -> condition rows
+
+    # Rule table
+    _rule_id = []
+    _rule_all = []
+    _rule_conds = []
+    _rule_then = []       # [(uuid, state), ...]
+    _rule_else = []
+    _rule_active = bytearray()
+    _rule_fired = []
+
+    _pending = []         # Actions waiting for run()
+    _wakeup = asyncio.ThreadSafeFlag()
+    running = False
+
+    @staticmethod
+    def compile(definitions):
+        """Validate definitions and build the tables; raises ValueError.
+        Nothing is replaced unless every rule compiles."""
+        cond_uuid, cond_above, cond_on, cond_off, cond_for_ms, cond_rule = [], [], [], [], [], []
+        rule_id, rule_all, rule_conds, rule_then, rule_else = [], [], [], [], []
+        by_uuid = {}
+
+        if not isinstance(definitions, list):
+            raise ValueError("rules must be a list")
+        for rule in definitions:
+            rule_index = len(rule_id)
+            rule_name = rule.get("id", str(rule_index))
+            when = rule.get("when", {})
+            if "all" in when:
+                conditions, match_all = when["all"], True
+            elif "any" in when:
+                conditions, match_all = when["any"], False
+            else:
+                raise ValueError(f"rule {rule_name}: 'when' needs 'all' or 'any'")
+            if not conditions:
+                raise ValueError(f"rule {rule_name}: no conditions")
+
+            rows = []
+            for condition in conditions:
+                op = condition.get("op", ">")
+                if op not in _OPS or "uuid" not in condition or "value" not in condition:
+                    raise ValueError(f"rule {rule_name}: invalid condition {condition}")
+                threshold = float(condition["value"])
+                hysteresis = abs(float(condition.get("hysteresis", 0)))
+                row = len(cond_uuid)
+                cond_uuid.append(condition["uuid"])
+                cond_above.append(op == ">")
+                cond_on.append(threshold)
+                cond_off.append(threshold - hysteresis if op == ">" else threshold + hysteresis)
+                cond_for_ms.append(int(condition.get("forMs", 0)))
+                cond_rule.append(rule_index)
+                by_uuid.setdefault(condition["uuid"], []).append(row)
+                rows.append(row)
+
+            def actions(key):
+                return tuple((action["uuid"], action["state"]) for action in rule.get(key, ()))
+            try:
+                then_actions, else_actions = actions("then"), actions("else")
+            except (KeyError, TypeError):
+                raise ValueError(f"rule {rule_name}: actions need 'uuid' and 'state'")
+            if not then_actions and not else_actions:
+                raise ValueError(f"rule {rule_name}: no actions")
+
+            rule_id.append(rule_name)
+            rule_all.append(match_all)
+            rule_conds.append(tuple(rows))
+            rule_then.append(then_actions)
+            rule_else.append(else_actions)
+
+        RuleEngine.definitions = definitions
+        RuleEngine._cond_uuid = cond_uuid
+        RuleEngine._cond_above = cond_above
+        RuleEngine._cond_on = cond_on
+        RuleEngine._cond_off = cond_off
+        RuleEngine._cond_for_ms = cond_for_ms
+        RuleEngine._cond_level = bytearray(len(cond_uuid))
+        RuleEngine._cond_since = [0] * len(cond_uuid)
+        RuleEngine._cond_active = bytearray(len(cond_uuid))
+        RuleEngine._cond_rule = cond_rule
+        RuleEngine._by_uuid = {uuid: tuple(rows) for uuid, rows in by_uuid.items()}
+        RuleEngine._rule_id = rule_id
+        RuleEngine._rule_all = rule_all
+        RuleEngine._rule_conds = rule_conds
+        RuleEngine._rule_then = rule_then
+        RuleEngine._rule_else = rule_else
+        RuleEngine._rule_active = bytearray(len(rule_id))
+        RuleEngine._rule_fired = [None] * len(rule_id)
+        return len(rule_id)
+
+    @staticmethod
+    def load():
+        """Compile the persisted rules at boot"""
+        try:
+            with open(RULES_FILE, "r") as f:
+                definitions = json.load(f)
+        except OSError:  # File doesn't exist in MicroPython
+            return 0
+        try:
+            return RuleEngine.compile(definitions)
+        except Exception as e:
+            print(f"❌ Stored rules rejected: {e}")
+            return 0
+
+    @staticmethod
+    def upload(definitions):
+        """Compile, then persist; invalid rules raise ValueError and keep the old set"""
+        count = RuleEngine.compile(definitions)
+        try:
+            with open(RULES_FILE, "w") as f:
+                json.dump(definitions, f)
+        except Exception as e:
+            print(f"Error saving rules: {e}")
+        print(f"📐 {count} rules loaded")
+        return count
+
+    @staticmethod
+    def _on_sample(uuid, value):
+        """Sampler listener: update this sensor's conditions and their rules"""
+        rows = RuleEngine._by_uuid.get(uuid)
+        if rows is None or value is None:
+            return
+        now = time.ticks_ms()
+        level = RuleEngine._cond_level
+        active = RuleEngine._cond_active
+        changed = False
+        for row in rows:
+            if level[row]:
+                up = value > RuleEngine._cond_off[row] if RuleEngine._cond_above[row] else value < RuleEngine._cond_off[row]
+            else:
+                up = value > RuleEngine._cond_on[row] if RuleEngine._cond_above[row] else value < RuleEngine._cond_on[row]
+            if up and not level[row]:
+                RuleEngine._cond_since[row] = now
+            level[row] = up
+            state = up and time.ticks_diff(now, RuleEngine._cond_since[row]) >= RuleEngine._cond_for_ms[row]
+            if state != active[row]:
+                active[row] = state
+                changed = True
+        if not changed:
+            return
+        evaluated = None
+        for row in rows:
+            rule = RuleEngine._cond_rule[row]
+            if rule != evaluated:  # Rows of one rule are adjacent
+                RuleEngine._evaluate(rule)
+                evaluated = rule
+
+    @staticmethod
+    def _evaluate(rule):
+        active = RuleEngine._cond_active
+        if RuleEngine._rule_all[rule]:
+            state = all(active[row] for row in RuleEngine._rule_conds[rule])
+        else:
+            state = any(active[row] for row in RuleEngine._rule_conds[rule])
+        if state == RuleEngine._rule_active[rule]:
+            return
+        RuleEngine._rule_active[rule] = state
+        RuleEngine._rule_fired[rule] = time.ticks_ms()
+        actions = RuleEngine._rule_then[rule] if state else RuleEngine._rule_else[rule]
+        if actions:
+            RuleEngine._pending.extend(actions)
+            RuleEngine._wakeup.set()
+        events.publish("rule", {"id": RuleEngine._rule_id[rule], "active": bool(state)})
+
+    @staticmethod
+    async def run():
+        """Hand queued rule actions to the controls' command queues"""
+        if RuleEngine.running:
+            return
+        RuleEngine.running = True
+        RuleEngine.load()
+        Sampler.add_listener(RuleEngine._on_sample)
+        while True:
+            await RuleEngine._wakeup.wait()
+            actions = RuleEngine._pending
+            RuleEngine._pending = []
+            for uuid, state in actions:
+                try:
+                    result = CommandQueue.submit(uuid, state)
+                    if "error" in result:
+                        print(f"❌ Rule action on {uuid} failed: {result['error']}")
+                except Exception as e:
+                    print(f"❌ Rule action on {uuid} failed: {e}")
+
+    @staticmethod
+    def get_status():
+        now = time.ticks_ms()
+        return {
+            "rules": [
+                {
+                    "id": RuleEngine._rule_id[rule],
+                    "active": bool(RuleEngine._rule_active[rule]),
+                    "sinceMs": time.ticks_diff(now, RuleEngine._rule_fired[rule]) if RuleEngine._rule_fired[rule] is not None else None,
+                }
+                for rule in range(len(RuleEngine._rule_id))
+            ],
+            "definitions": RuleEngine.definitions,
+        }
@@ -0,0 +1,162 @@
+import time
+import uasyncio as asyncio
+from array import array
+from micropython import const
+from utils.core1 import Core1Scheduler, WORKLOAD_SAMPLE, WORKLOAD_DOWNSAMPLE
+
+_HISTORY_SIZE = const(60)      # Raw samples kept per sensor
+_DOWNSAMPLE_FACTOR = const(10) # Raw samples averaged into one trend point
+_TREND_SIZE = const(60)        # Trend points kept per sensor
+
+
+class _History:
+    """Fixed-size rings of raw samples and downsampled trend points"""
+
+    def __init__(self):
+        self.raw = array("f", [0] * _HISTORY_SIZE)
+        self.raw_count = 0
+        self.trend = array("f", [0] * _TREND_SIZE)
+        self.trend_count = 0
+
+    def add(self, value):
+        """Store a sample; True when enough samples arrived for a trend point"""
+        self.raw[self.raw_count % _HISTORY_SIZE] = value
+        self.raw_count += 1
+        return self.raw_count % _DOWNSAMPLE_FACTOR == 0
+
+    def mean_of_last(self, count):
+        total = 0.0
+        end = self.raw_count
+        for i in range(end - count, end):
+            total += self.raw[i % _HISTORY_SIZE]
+        return total / count
+
+    def add_trend(self, value):
+        self.trend[self.trend_count % _TREND_SIZE] = value
+        self.trend_count += 1
+
+    @staticmethod
+    def _ordered(ring, count, size):
+        start = max(0, count - size)
+        return [round(ring[i % size], 3) for i in range(start, count)]
+
+    def to_dict(self):
+        return {
+            "raw": _History._ordered(self.raw, self.raw_count, _HISTORY_SIZE),
+            "trend": _History._ordered(self.trend, self.trend_count, _TREND_SIZE),
+            "downsampleFactor": _DOWNSAMPLE_FACTOR,
+        }
+
+
+class Sampler:
+    """Periodically reads every sensor's read_value() into a history.
+
+    Sensors are addressed by slot index so jobs fit the scheduler's int argument.
+    Reads and downsampling go through Core1Scheduler, so they run on core 1
+    when those workloads are enabled for the deployment."""
+
+    interval_ms = 1000
+    running = False
+
+    _slot_uuids = []     # Slot -> module UUID
+    _slot_modules = []   # Slot -> module (None once removed)
+    _histories = []      # Slot -> _History
+    _slot_by_uuid = {}
+    latest = {}          # UUID -> (ticks_ms, value)
+    _listeners = []
+
+    @staticmethod
+    def add_listener(callback):
+        """Register callback(uuid, value) called on core 0 for every new sample"""
+        Sampler._listeners.append(callback)
+
+    @staticmethod
+    def _slot_for(uuid, module):
+        slot = Sampler._slot_by_uuid.get(uuid)
+        if slot is None:
+            slot = len(Sampler._slot_uuids)
+            Sampler._slot_uuids.append(uuid)
+            Sampler._slot_modules.append(module)
+            Sampler._histories.append(_History())
+            Sampler._slot_by_uuid[uuid] = slot
+        else:
+            Sampler._slot_modules[slot] = module
+        return slot
+
+    @staticmethod
+    def _read(slot):
+        """Workload: one sensor read (core 1 or inline)"""
+        module = Sampler._slot_modules[slot]
+        if module is None:
+            return None
+        try:
+            return module.read_value()
+        except Exception:
+            return None  # Skipped like a missing reading, not recorded as 0
+
+    @staticmethod
+    def _on_sample(slot, value):
+        """Core 0: store the sample and queue downsampling when due"""
+        uuid = Sampler._slot_uuids[slot]
+        Sampler.latest[uuid] = (time.ticks_ms(), value)
+        if Sampler._histories[slot].add(value):
+            Core1Scheduler.dispatch(_DOWNSAMPLE, slot)
+        for callback in Sampler._listeners:
+            try:
+                callback(uuid, value)
+            except Exception as e:
+                print(f"❌ Sampler listener error: {e}")
+
+    @staticmethod
+    def _downsample(slot):
+        """Workload: mean of the last _DOWNSAMPLE_FACTOR raw samples"""
+        return Sampler._histories[slot].mean_of_last(_DOWNSAMPLE_FACTOR)
+
+    @staticmethod
+    def _on_downsample(slot, value):
+        Sampler._histories[slot].add_trend(value)
+
+    @staticmethod
+    async def run(interval_ms=None):
+        """Sample all sensors every interval_ms"""
+        from module.module_manager import ModuleManager
+
+        if Sampler.running:
+            return
+        Sampler.running = True
+        if interval_ms is not None:
+            Sampler.interval_ms = interval_ms
+        print(f"📈 Sampler started ({Sampler.interval_ms}ms)")
+
+        while True:
+            try:
+                present = set()
+                for uuid, module in list(ModuleManager.modules.items()):
+                    if not hasattr(module, "read_value"):
+                        continue
+                    present.add(uuid)
+                    Core1Scheduler.dispatch(_SAMPLE, Sampler._slot_for(uuid, module))
+                for slot, uuid in enumerate(Sampler._slot_uuids):
+                    if uuid not in present:
+                        Sampler._slot_modules[slot] = None
+            except Exception as e:
+                print(f"❌ Sampler error: {e}")
+            await asyncio.sleep_ms(Sampler.interval_ms)
+
+    @staticmethod
+    def get_latest(uuid):
+        """(ticks_ms, value) of the newest sample, or None"""
+        return Sampler.latest.get(uuid)
+
+    @staticmethod
+    def get_history(uuid):
+        slot = Sampler._slot_by_uuid.get(uuid)
+        if slot is None:
+            return None
+        history = Sampler._histories[slot].to_dict()
+        history["intervalMs"] = Sampler.interval_ms
+        return history
+
+
+_SAMPLE = Core1Scheduler.register(WORKLOAD_SAMPLE, Sampler._read, Sampler._on_sample)
+_DOWNSAMPLE = Core1Scheduler.register(WORKLOAD_DOWNSAMPLE, Sampler._downsample, Sampler._on_downsample)
@@ -1,98 +1,45 @@
-from machine import Pin, Timer
-import time
+from utils.dac import WaveformGenerator, BACKEND_THREAD, BACKEND_TIMER, BACKEND_PIO
 
-# Set up GPIO pins 6-12 as outputs
-pins = []
-for i in range(6, 13):
-    pins.append(Pin(i, Pin.OUT))
-
-# Configurable limits
+# Configurable limits (defaults for the boot-time sawtooth)
 LOWER_LIMIT = 15   # Minimum value (0-127)
 UPPER_LIMIT = 127  # Maximum value (0-127)
+STEP_DELAY_US = 10 # Delay between samples
 
-# Global variables for timer-based sawtooth
-timer_value = LOWER_LIMIT
-timer_direction = 1
-timer_active = True
-
-def sawtooth_thread():
-    """Thread-based sawtooth function"""
-    value = LOWER_LIMIT
-    direction = 1  # 1 for rising, -1 for falling
-
-    while True:
-        # Convert value to 7-bit binary and set pins
-        for bit in range(7):
-            pins[bit].value((value >> bit) & 1)
-
-        # Update value for next step
-        value += direction
-
-        # Change direction at limits
-        if value >= UPPER_LIMIT:
-            direction = -1
-        elif value <= LOWER_LIMIT:
-            direction = 1
+def _configure_sawtooth():
+    """Original ramp: one DAC step per sample, STEP_DELAY_US apart"""
+    samples = max(2, 2 * (UPPER_LIMIT - LOWER_LIMIT))
+    frequency = 1000000 / (STEP_DELAY_US * samples)
+    WaveformGenerator.configure("triangle", frequency, LOWER_LIMIT, UPPER_LIMIT)
 
-        time.sleep_us(10)  # 10μs delay - adjust as needed
-
-def sawtooth_timer_callback(timer):
-    """Timer callback function for sawtooth generation"""
-    global timer_value, timer_direction, timer_active
-    
-    if not timer_active:
-        return
-    
-    try:
-        # Convert value to 7-bit binary and set pins
-        for bit in range(7):
-            pins[bit].value((timer_value >> bit) & 1)
-        
-        # Update value for next step
-        timer_value += timer_direction
-        
-        # Change direction at limits
-        if timer_value >= UPPER_LIMIT:
-            timer_direction = -1
-        elif timer_value <= LOWER_LIMIT:
-            timer_direction = 1
-    except:
-        # Handle any exceptions silently in timer callback
-        pass
+def init_sawtooth(backend=BACKEND_PIO):
+    """Initialize sawtooth generator on the given backend ("pio", "thread" or "timer")"""
+    _configure_sawtooth()
+    WaveformGenerator.start(backend)
+    print(f"Sawtooth generator started using {backend}")
 
 def init_sawtooth_thread():
     """Initialize sawtooth generator using threading"""
-    import _thread
-    _thread.start_new_thread(sawtooth_thread, ())
+    _configure_sawtooth()
+    WaveformGenerator.start(BACKEND_THREAD)
     print("Sawtooth generator started using thread")
 
 def init_sawtooth_timer():
     """Initialize sawtooth generator using timer"""
-    global timer_active, timer_value, timer_direction
-    timer_active = True
-    timer_value = LOWER_LIMIT
-    timer_direction = 1
-    
-    # Create timer with 100kHz frequency (10μs period)
-    timer = Timer()
-    timer.init(freq=100000, mode=Timer.PERIODIC, callback=sawtooth_timer_callback)
+    _configure_sawtooth()
+    WaveformGenerator.start(BACKEND_TIMER)
     print("Sawtooth generator started using timer")
-    return timer
+    return WaveformGenerator._timer
 
-def stop_sawtooth_timer(timer):
+def stop_sawtooth_timer(timer=None):
     """Stop the timer-based sawtooth generator"""
-    global timer_active
-    timer_active = False
-    time.sleep_ms(1)  # Give timer callback time to exit
-    timer.deinit()
-    
-    # Set all pins to 0 when stopping
-    for pin in pins:
-        pin.value(0)
+    WaveformGenerator.stop()
     print("Timer-based sawtooth generator stopped")
 
 # Usage examples:
 """
+# For PIO/DMA sawtooth (no CPU time once started):
+init_sawtooth("pio")
+
 # For thread-based sawtooth:
 init_sawtooth_thread()
 
@@ -100,4 +47,10 @@ init_sawtooth_thread()
 timer = init_sawtooth_timer()
 # ... do other work ...
 stop_sawtooth_timer(timer)
-"""
\ No newline at end of file
+
+# Any other shape, retuned live (also exposed over HTTP at /waveform):
+WaveformGenerator.configure("sine", frequency=200, lower=0, upper=127)
+
+# Check the emitted sequence on the host:
+#   python -m utils.waveform
+"""
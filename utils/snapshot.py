@@ -0,0 +1,81 @@
+import json
+import os
+import time
+import uasyncio as asyncio
+import utils.calibration as calibration
+
+SNAPSHOT_FILE = "snapshot.json"  # Warm-start state: module table, control outputs, calibration
+_VERSION = 1
+
+
+class Snapshot:
+    """Compact copy of the runtime state, rewritten shortly after it changes.
+
+    Layout: {"v": 1, "modules": [[uuid, type, i2c_address, state], ...],
+    "calibration": {uuid: {...}}}. state is the last output of a control
+    and null for sensors."""
+
+    debounce_ms = 2000       # Coalesce bursts of changes into one flash write
+    writes = 0
+    last_write_ms = None
+    _dirty = asyncio.Event()
+    running = False
+
+    @staticmethod
+    def mark_dirty():
+        """Call whenever the module table, a control output or a calibration changes"""
+        Snapshot._dirty.set()
+
+    @staticmethod
+    def build(modules):
+        return {
+            "v": _VERSION,
+            "modules": [
+                [uuid, module.module_type, module.i2c_address,
+                 module.state if hasattr(module, "set_state") else None]
+                for uuid, module in modules.items()
+            ],
+            "calibration": calibration.load_all(),
+        }
+
+    @staticmethod
+    def write(modules):
+        """Write atomically: a reset mid-write leaves the previous snapshot intact"""
+        temp_file = SNAPSHOT_FILE + ".tmp"
+        try:
+            with open(temp_file, "w") as f:
+                json.dump(Snapshot.build(modules), f)
+            os.rename(temp_file, SNAPSHOT_FILE)
+            Snapshot.writes += 1
+            Snapshot.last_write_ms = time.ticks_ms()
+        except Exception as e:
+            print(f"Error writing snapshot: {e}")
+
+    @staticmethod
+    def load():
+        """Return the stored snapshot, or None if missing or from another version"""
+        try:
+            with open(SNAPSHOT_FILE, "r") as f:
+                data = json.load(f)
+        except OSError:  # File doesn't exist in MicroPython
+            return None
+        except Exception as e:
+            print(f"Error loading snapshot: {e}")
+            return None
+        if data.get("v") != _VERSION:
+            return None
+        return data
+
+    @staticmethod
+    async def run():
+        """Write the snapshot once changes settle"""
+        from module.module_manager import ModuleManager
+
+        if Snapshot.running:
+            return
+        Snapshot.running = True
+        while True:
+            await Snapshot._dirty.wait()
+            await asyncio.sleep_ms(Snapshot.debounce_ms)
+            Snapshot._dirty.clear()
+            Snapshot.write(ModuleManager.modules)
@@ -0,0 +1,236 @@
+import time
+import array
+import uasyncio as asyncio
+from utils.power import PowerManager
+from utils.snapshot import Snapshot
+
+# Easing curves: progress 0..1 -> eased progress 0..1
+EASINGS = {
+    "linear": lambda t: t,
+    "ease-in": lambda t: t * t,
+    "ease-out": lambda t: t * (2 - t),
+    "ease-in-out": lambda t: t * t * (3 - 2 * t),
+}
+
+KIND_TRANSITION = "transition"
+KIND_SCHEDULE = "schedule"
+
+
+class TransitionEngine:
+    """Fades and timed schedules for controls, run on the device.
+
+    A fade is precomputed into the frames where the 8-bit PWM value actually
+    changes (at most 256, whatever the duration), then played back against absolute deadlines at a fixed frame rate,
+    so timing does not drift and no frame repeats an I2C write. Each control has
+    at most one running fade or schedule; a new command for it cancels the old."""
+
+    frame_ms = 20                # 50 frames per second
+    max_duration_ms = 3600000
+    max_steps = 32               # Per schedule
+
+    _tasks = {}                  # uuid -> running task
+    _info = {}                   # uuid -> status of the running command
+    _generation = {}             # uuid -> counter, tells a task whether it is still current
+
+    @staticmethod
+    async def precompute(start, target, duration_ms, easing="linear"):
+        """Frames of a fade as (frame numbers, pwm values, levels), keeping
+        only the frames where the PWM value changes, plus the last frame.
+
+        Walks the PWM steps rather than the frames: the easing curves are
+        monotonic, so the frame each step is reached at is found by binary
+        search. Yields to the event loop every few steps."""
+        from module.controls.led import Led
+
+        curve = EASINGS.get(easing)
+        if curve is None:
+            raise ValueError(f"Unknown easing {easing}")
+        frames = max(1, duration_ms // TransitionEngine.frame_ms)
+
+        def level_at(frame):
+            if frame == frames:
+                return target  # Exact, whatever the float rounding of the curve
+            return start + (target - start) * curve(frame / frames)
+
+        frame_numbers = array.array("I")
+        pwm_values = bytearray()
+        levels = array.array("f")
+        last = Led.to_pwm(start)
+        end = Led.to_pwm(target)
+        rising = end > last
+        frame = 0
+        while last != end:
+            # First frame whose PWM value has moved on from last
+            low, high = frame + 1, frames
+            while low < high:
+                middle = (low + high) // 2
+                pwm = Led.to_pwm(level_at(middle))
+                if pwm > last if rising else pwm < last:
+                    high = middle
+                else:
+                    low = middle + 1
+            frame = low
+            level = level_at(frame)
+            last = Led.to_pwm(level)
+            frame_numbers.append(frame)
+            pwm_values.append(last)
+            levels.append(level)
+            if len(pwm_values) % 32 == 0:
+                await asyncio.sleep_ms(0)
+        if frame != frames:
+            frame_numbers.append(frames)
+            pwm_values.append(end)
+            levels.append(target)
+        return frame_numbers, pwm_values, levels
+
+    @staticmethod
+    def cancel(uuid):
+        """Stop the fade or schedule running on a control; True if there was one"""
+        task = TransitionEngine._tasks.pop(uuid, None)
+        TransitionEngine._info.pop(uuid, None)
+        TransitionEngine._generation[uuid] = TransitionEngine._generation.get(uuid, 0) + 1
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    @staticmethod
+    def _start(uuid, kind, info, coroutine_fn):
+        from utils.commands import CommandQueue
+
+        TransitionEngine.cancel(uuid)
+        CommandQueue.discard(uuid)  # A queued state must not land on top of the new fade
+        generation = TransitionEngine._generation[uuid]
+        info["kind"] = kind
+        info["startedMs"] = time.ticks_ms()
+        TransitionEngine._info[uuid] = info
+
+        async def runner():
+            try:
+                await coroutine_fn()
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"❌ {kind} on {uuid} failed: {e}")
+            finally:
+                if TransitionEngine._generation.get(uuid) == generation:
+                    TransitionEngine._tasks.pop(uuid, None)
+                    TransitionEngine._info.pop(uuid, None)
+
+        TransitionEngine._tasks[uuid] = asyncio.create_task(runner())
+
+    @staticmethod
+    def _get_module(uuid, fade=False):
+        from module.module_manager import ModuleManager
+        from module.module import Control
+
+        module = ModuleManager.get_module(uuid)
+        if not isinstance(module, Control):
+            raise ValueError("Invalid module or module does not support state changes")
+        if fade and not hasattr(module, "write_pwm"):
+            raise ValueError("Module does not support transitions")
+        return module
+
+    @staticmethod
+    async def _fade(uuid, module, target, duration_ms, easing):
+        from module.module_manager import ModuleManager
+
+        frame_numbers, pwm_values, levels = await TransitionEngine.precompute(
+            module.state or 0, target, duration_ms, easing)
+        PowerManager.note_bus_activity()
+        frame_ms = TransitionEngine.frame_ms
+        start = time.ticks_ms()
+        for i in range(len(pwm_values)):
+            # Sleep to the frame's absolute deadline: late frames don't push back later ones
+            delay = time.ticks_diff(time.ticks_add(start, frame_numbers[i] * frame_ms), time.ticks_ms())
+            if delay > 0:
+                await asyncio.sleep_ms(delay)
+            if ModuleManager.modules.get(uuid) is not module:
+                return  # Unplugged mid-fade
+            module.write_pwm(pwm_values[i])
+            module.state = levels[i]
+        module.state = target
+        Snapshot.mark_dirty()
+
+    @staticmethod
+    def transition(uuid, target, duration_ms, easing="linear"):
+        """Fade a control to target (0-100) over duration_ms"""
+        module = TransitionEngine._get_module(uuid, fade=True)
+        target = max(0, min(100, float(target)))
+        duration_ms = int(duration_ms)
+        if not 0 <= duration_ms <= TransitionEngine.max_duration_ms:
+            raise ValueError("Invalid duration")
+        if easing not in EASINGS:
+            raise ValueError(f"Unknown easing {easing}")
+
+        async def fade():
+            await TransitionEngine._fade(uuid, module, target, duration_ms, easing)
+
+        TransitionEngine._start(uuid, KIND_TRANSITION, {
+            "from": module.state, "target": target, "durationMs": duration_ms, "easing": easing,
+        }, fade)
+        return {"target": target, "durationMs": duration_ms, "easing": easing}
+
+    @staticmethod
+    def schedule(uuid, steps, repeat=1):
+        """Run steps in sequence: each waits delayMs after the previous one, then
+        sets state (fading over durationMs when given). repeat=0 loops forever.
+        Plain state steps go through the command queue, so the control's
+        minimum write interval and repeated-state skipping apply to them too."""
+        from utils.commands import CommandQueue
+
+        module = TransitionEngine._get_module(uuid)
+        if not steps or len(steps) > TransitionEngine.max_steps:
+            raise ValueError(f"A schedule needs 1 to {TransitionEngine.max_steps} steps")
+        compiled = []
+        for step in steps:
+            if "state" not in step:
+                raise ValueError("Every step needs a 'state'")
+            delay_ms = int(step.get("delayMs", 0))
+            duration_ms = int(step.get("durationMs", 0))
+            easing = step.get("easing", "linear")
+            if not 0 <= delay_ms <= TransitionEngine.max_duration_ms or not 0 <= duration_ms <= TransitionEngine.max_duration_ms:
+                raise ValueError("Invalid step timing")
+            if duration_ms and not hasattr(module, "write_pwm"):
+                raise ValueError("Module does not support transitions")
+            if easing not in EASINGS:
+                raise ValueError(f"Unknown easing {easing}")
+            compiled.append((delay_ms, step["state"], duration_ms, easing))
+        repeat = int(repeat)
+        if repeat < 0:
+            raise ValueError("Invalid repeat count")
+        if repeat == 0 and not any(delay_ms or duration_ms for delay_ms, _, duration_ms, _ in compiled):
+            raise ValueError("A schedule that loops forever needs a delayMs or durationMs")
+        info = {"steps": len(compiled), "repeat": repeat, "pass": 0, "step": 0}
+
+        async def run_schedule():
+            passes = 0
+            while repeat == 0 or passes < repeat:
+                passes += 1
+                info["pass"] = passes
+                for index, (delay_ms, state, duration_ms, easing) in enumerate(compiled):
+                    info["step"] = index
+                    if delay_ms:
+                        await asyncio.sleep_ms(delay_ms)
+                    if duration_ms:
+                        CommandQueue.discard(uuid)  # A queued step must not land on the fade
+                        await TransitionEngine._fade(uuid, module, max(0, min(100, float(state))), duration_ms, easing)
+                    else:
+                        result = CommandQueue.submit(uuid, state, replace_transition=False)
+                        if "error" in result:
+                            raise ValueError(result["error"])
+                        await asyncio.sleep_ms(0)  # Steps without a delay must still yield
+
+        TransitionEngine._start(uuid, KIND_SCHEDULE, info, run_schedule)
+        return {"steps": len(compiled), "repeat": repeat}
+
+    @staticmethod
+    def get_status(uuid):
+        info = TransitionEngine._info.get(uuid)
+        if info is None:
+            return {"running": False}
+        status = {"running": True, "elapsedMs": time.ticks_diff(time.ticks_ms(), info["startedMs"])}
+        for key, value in info.items():
+            if key != "startedMs":
+                status[key] = value
+        return status
@@ -0,0 +1,149 @@
+# Waveform sample tables for the 7-bit R-2R DAC on GPIO 6-12.
+#
+# Pure Python on purpose: no machine imports, so the same table builders and
+# the GPIO model below run on the host to check what the device will emit:
+#
+#     python -m utils.waveform
+
+import math
+from array import array
+
+PIN_BASE = 6                       # GPIO of the DAC LSB
+BITS = 7                           # DAC resolution
+MAX_VALUE = (1 << BITS) - 1        # 127
+PIN_MASK = MAX_VALUE << PIN_BASE   # GPIO 6-12
+MAX_TABLE_SIZE = 256               # Samples per period
+
+SHAPES = ("triangle", "sawtooth", "sine", "square", "arbitrary")
+
+
+def _clamp(value):
+    return max(0, min(MAX_VALUE, int(value)))
+
+
+def natural_samples(shape, lower, upper, table=None):
+    """Samples per period that reproduce the shape without losing DAC steps"""
+    span = abs(_clamp(upper) - _clamp(lower))
+    if shape == "triangle":
+        return max(2, 2 * span)
+    if shape == "sawtooth":
+        return max(2, span + 1)
+    if shape == "square":
+        return 2
+    if shape == "arbitrary":
+        return len(table) if table else 1
+    return MAX_TABLE_SIZE
+
+
+def shape_values(shape, lower, upper, samples, table=None, duty=0.5):
+    """One period of `shape` between lower and upper, with `samples` steps.
+    Arbitrary tables hold 0-127 values that are scaled into lower..upper and
+    resampled to `samples` steps."""
+    lower = _clamp(lower)
+    upper = _clamp(upper)
+    span = upper - lower
+    samples = max(1, min(MAX_TABLE_SIZE, int(samples)))
+    values = []
+    for i in range(samples):
+        phase = i / samples
+        if shape == "triangle":
+            level = 2 * phase if phase < 0.5 else 2 - 2 * phase
+        elif shape == "sawtooth":
+            level = i / (samples - 1) if samples > 1 else 0
+        elif shape == "sine":
+            level = 0.5 - 0.5 * math.cos(2 * math.pi * phase)
+        elif shape == "square":
+            level = 1 if phase < duty else 0
+        elif shape == "arbitrary":
+            if not table:
+                raise ValueError("arbitrary shape needs a table")
+            level = _clamp(table[i * len(table) // samples]) / MAX_VALUE
+        else:
+            raise ValueError("Invalid shape")
+        values.append(lower + int(round(span * level)))
+    return values
+
+
+def sawtooth_values(lower, upper):
+    """One period of the sawtooth/triangle ramp: lower..upper and back down.
+    Matches the original step-by-step generator: value changes by one per step
+    and turns around at the limits, so the period is 2 * (upper - lower) steps."""
+    lower = max(0, min(MAX_VALUE, int(lower)))
+    upper = max(0, min(MAX_VALUE, int(upper)))
+    if upper <= lower:
+        return [lower]
+    rising = list(range(lower, upper + 1))
+    falling = list(range(upper - 1, lower, -1))
+    return rising + falling
+
+
+def values_to_masks(values):
+    """Convert DAC values to absolute GPIO output masks"""
+    return array("I", [(int(v) & MAX_VALUE) << PIN_BASE for v in values])
+
+
+def masks_to_deltas(masks):
+    """XOR deltas so each step is a single write to the SIO GPIO_OUT_XOR register.
+    delta[i] turns the output of step i-1 into the output of step i (cyclically),
+    so all seven bits change in the same bus write."""
+    count = len(masks)
+    return array("I", [masks[i] ^ masks[i - 1] for i in range(count)])
+
+
+def build_table(values):
+    """Return (masks, deltas) for a period of DAC values"""
+    masks = values_to_masks(values)
+    return masks, masks_to_deltas(masks)
+
+
+def simulate(deltas, start_mask, steps, other_pins=0):
+    """Model the GPIO output register while the engine writes deltas[i] to
+    GPIO_OUT_XOR. Returns the DAC value seen after every write and checks that
+    pins outside the DAC are never touched."""
+    register = (start_mask & PIN_MASK) | (other_pins & ~PIN_MASK)
+    emitted = []
+    count = len(deltas)
+    for step in range(steps):
+        register ^= deltas[step % count]
+        if register & ~PIN_MASK != other_pins & ~PIN_MASK:
+            raise AssertionError("write touched a pin outside the DAC")
+        emitted.append((register & PIN_MASK) >> PIN_BASE)
+    return emitted
+
+
+def check_table(values, masks, deltas, periods=2):
+    """True if replaying the deltas reproduces `values` for several periods.
+    The engine primes the output with masks[-1], then XORs deltas from index 0."""
+    steps = len(values) * periods
+    emitted = simulate(deltas, masks[-1], steps, other_pins=~PIN_MASK & 0xFFFFFFFF)
+    expected = [values[i % len(values)] for i in range(steps)]
+    return emitted == expected
+
+
+def check_swap(old_masks, new_masks, swap_delta):
+    """True if swap_delta takes the output from the last sample of the old
+    table straight to the first sample of the new one (period-boundary swap)"""
+    return old_masks[-1] ^ swap_delta == new_masks[0]
+
+
+if __name__ == "__main__":
+    for lower, upper in ((15, 127), (0, 127), (40, 41), (64, 64)):
+        values = sawtooth_values(lower, upper)
+        masks, deltas = build_table(values)
+        ok = check_table(values, masks, deltas)
+        legacy = values == shape_values("triangle", lower, upper, natural_samples("triangle", lower, upper)) or upper <= lower
+        print(f"sawtooth {lower}-{upper}: {len(values)} steps, {'OK' if ok and legacy else 'MISMATCH'}")
+
+    previous = None
+    for shape in SHAPES:
+        table = [0, 127, 64, 32] if shape == "arbitrary" else None
+        samples = min(64, natural_samples(shape, 10, 120, table))
+        values = shape_values(shape, 10, 120, samples, table)
+        masks, deltas = build_table(values)
+        ok = check_table(values, masks, deltas)
+        if previous is not None:
+            # Same formula the generator uses when it swaps tables
+            swap_delta = deltas[0] ^ masks[-1] ^ previous[-1]
+            ok = ok and check_swap(previous, masks, swap_delta)
+        previous = masks
+        print(f"{shape}: {len(values)} steps, {'OK' if ok else 'MISMATCH'}")
@@ -0,0 +1,168 @@
+import gc
+import time
+
+REASON_BUSY = "busy"          # Too many requests in flight
+REASON_MEMORY = "memory"      # Free heap below the floor
+REASON_RATE = "rate"          # Client out of tokens
+REASON_PARKED = "parked"      # Too many long-polls waiting
+
+
+class Admission:
+    """Decides whether the HTTP server takes on another request.
+
+    A request is admitted only while fewer than max_concurrent are in flight,
+    the heap has min_free_heap bytes left (after one collection if needed) and
+    its client still has a token. Each client IP has a token bucket of `burst`
+    tokens refilled at `rate_per_s`. Rejected requests get a short 503/429
+    with Retry-After instead of a full handler run, so overload slows the
+    device down instead of exhausting the heap. Parked long-polls give up
+    their slot but not their socket: at most max_parked wait at once, and
+    each one keeps parked_heap bytes out of the heap budget."""
+
+    max_concurrent = 3
+    min_free_heap = 24 * 1024
+    burst = 10
+    rate_per_s = 4
+    max_clients = 16             # Token buckets kept at once
+    max_parked = 4               # Long-polls waiting for events at once
+    parked_heap = 2 * 1024       # Heap held by one parked connection (socket and buffers)
+    read_timeout_ms = 5000       # Whole request (head and body)
+    write_timeout_ms = 5000      # Whole response
+
+    active = 0
+    peak = 0
+    parked = 0
+    admitted = 0
+    rejected = {REASON_BUSY: 0, REASON_MEMORY: 0, REASON_RATE: 0, REASON_PARKED: 0}
+    timeouts = 0
+    memory_errors = 0
+    _buckets = {}                # ip -> [tokens, last refill ticks_ms]
+
+    @staticmethod
+    def _take_token(ip):
+        """Spend one token of the client's bucket; returns 0 or seconds until the next token"""
+        now = time.ticks_ms()
+        bucket = Admission._buckets.get(ip)
+        if bucket is None:
+            if len(Admission._buckets) >= Admission.max_clients:
+                Admission._evict(now)
+            bucket = [Admission.burst, now]
+            Admission._buckets[ip] = bucket
+        else:
+            elapsed = time.ticks_diff(now, bucket[1])
+            bucket[0] = min(Admission.burst, bucket[0] + elapsed * Admission.rate_per_s / 1000)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return int((1 - bucket[0]) / Admission.rate_per_s) + 1
+        bucket[0] -= 1
+        return 0
+
+    @staticmethod
+    def _evict(now):
+        """Drop the client that has been quiet the longest"""
+        oldest, oldest_age = None, -1
+        for ip, bucket in Admission._buckets.items():
+            age = time.ticks_diff(now, bucket[1])
+            if age > oldest_age:
+                oldest, oldest_age = ip, age
+        Admission._buckets.pop(oldest, None)
+
+    @staticmethod
+    def _heap_ok():
+        floor = Admission.min_free_heap + Admission.parked * Admission.parked_heap
+        if gc.mem_free() >= floor:
+            return True
+        gc.collect()
+        return gc.mem_free() >= floor
+
+    @staticmethod
+    def admit(ip):
+        """Returns None if the request may proceed (call release() when done),
+        else (status, reason, retry_after_s)"""
+        if Admission.active >= Admission.max_concurrent:
+            Admission.rejected[REASON_BUSY] += 1
+            return 503, REASON_BUSY, 1
+        if not Admission._heap_ok():
+            Admission.rejected[REASON_MEMORY] += 1
+            return 503, REASON_MEMORY, 2
+        retry_after = Admission._take_token(ip)
+        if retry_after:
+            Admission.rejected[REASON_RATE] += 1
+            return 429, REASON_RATE, retry_after
+        Admission.active += 1
+        Admission.admitted += 1
+        if Admission.active > Admission.peak:
+            Admission.peak = Admission.active
+        return None
+
+    @staticmethod
+    def release():
+        Admission.active -= 1
+
+    @staticmethod
+    def park():
+        """A long-poll waiting for events frees its slot meanwhile. Returns None
+        if it may wait (call resume() when done), else (status, reason, retry_after_s)"""
+        if Admission.parked >= Admission.max_parked:
+            Admission.rejected[REASON_PARKED] += 1
+            return 503, REASON_PARKED, 5
+        Admission.parked += 1
+        Admission.active -= 1
+        return None
+
+    @staticmethod
+    def resume():
+        Admission.parked -= 1
+        Admission.active += 1
+
+    @staticmethod
+    def note_timeout():
+        Admission.timeouts += 1
+
+    @staticmethod
+    def note_memory_error():
+        Admission.memory_errors += 1
+        gc.collect()
+
+    @staticmethod
+    def configure(settings):
+        """Update limits from a dict with any of the keys reported by get_status()"""
+        fields = {
+            "maxConcurrent": "max_concurrent",
+            "minFreeHeap": "min_free_heap",
+            "burst": "burst",
+            "ratePerS": "rate_per_s",
+            "readTimeoutMs": "read_timeout_ms",
+            "writeTimeoutMs": "write_timeout_ms",
+            "maxParked": "max_parked",
+            "parkedHeap": "parked_heap",
+        }
+        for key, value in settings.items():
+            if key not in fields:
+                raise ValueError(f"Unknown setting {key}")
+            if not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"{key} must be positive")
+        for key, value in settings.items():
+            setattr(Admission, fields[key], value)
+        return Admission.get_status()
+
+    @staticmethod
+    def get_status():
+        return {
+            "maxConcurrent": Admission.max_concurrent,
+            "minFreeHeap": Admission.min_free_heap,
+            "burst": Admission.burst,
+            "ratePerS": Admission.rate_per_s,
+            "readTimeoutMs": Admission.read_timeout_ms,
+            "writeTimeoutMs": Admission.write_timeout_ms,
+            "maxParked": Admission.max_parked,
+            "parkedHeap": Admission.parked_heap,
+            "active": Admission.active,
+            "peak": Admission.peak,
+            "parked": Admission.parked,
+            "admitted": Admission.admitted,
+            "rejected": Admission.rejected,
+            "timeouts": Admission.timeouts,
+            "memoryErrors": Admission.memory_errors,
+            "clients": len(Admission._buckets),
+        }
@@ -1,12 +1,112 @@
 import uasyncio as asyncio
 import usocket as socket
 import json
+import utils.cbor as cbor
+from wifi.link_manager import LinkManager
 from module.module_manager import ModuleManager
+from module.identify import DeviceIdentifier
+from utils.health import HealthMonitor
+from utils.boot import BootTimeline
+import utils.logger as logger
+import utils.events as events
+import utils.battery as battery
+from utils.power import PowerManager
+from utils.dac import WaveformGenerator
+from utils.core1 import Core1Scheduler
+from utils.sampler import Sampler
+from utils.rules import RuleEngine
+from utils.transitions import TransitionEngine
+from utils.commands import CommandQueue
+from wifi.admission import Admission, REASON_MEMORY
+
+HEADERS_OK = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+HEADERS_OK_CBOR = "HTTP/1.1 200 OK\r\nContent-Type: application/cbor\r\n\r\n"
+HEADERS_BAD_REQUEST = "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n"
+HEADERS_NOT_FOUND = "HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n\r\n"
+HEADERS_REJECTED = "HTTP/1.1 {} {}\r\nRetry-After: {}\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n"
+
+_STATUS_TEXT = {429: "Too Many Requests", 503: "Service Unavailable"}
+
+MAX_BODY_SIZE = 8192  # Largest request body accepted (waveform tables, uploads)
+
+def query_params(path):
+    """Parse the query string of a request path into a dict"""
+    query = path.split("?")[1] if "?" in path else ""
+    return dict(param.split("=") for param in query.split("&") if "=" in param)
+
+def header_value(head, name):
+    """Value of a request header (name in lower case), or None"""
+    for line in head.split("\r\n")[1:]:
+        if line[:len(name) + 1].lower() == name + ":":
+            return line[len(name) + 1:].strip()
+    return None
+
+def encode_response(data, use_cbor):
+    """JSON by default, CBOR for clients that asked for it with Accept"""
+    if use_cbor:
+        return HEADERS_OK_CBOR, cbor.dumps(data)
+    return HEADERS_OK, json.dumps(data)
+
+async def read_request(reader):
+    """Read the request head and, if Content-Length says so, the rest of the body"""
+    data = await reader.read(1024)
+    header_end = data.find(b"\r\n\r\n")
+    if header_end == -1:
+        return data
+
+    headers = data[:header_end].lower()
+    index = headers.find(b"content-length:")
+    if index != -1:
+        line_end = headers.find(b"\r\n", index)
+        if line_end == -1:
+            line_end = len(headers)
+        length = min(int(headers[index + 15:line_end]), MAX_BODY_SIZE)
+        missing = length - (len(data) - header_end - 4)
+        while missing > 0:
+            chunk = await reader.read(missing)
+            if not chunk:
+                break
+            data += chunk
+            missing -= len(chunk)
+    return data
+
+async def reject(writer, status, reason, retry_after_s):
+    """Short 429/503 answer with Retry-After; costs no request parsing"""
+    try:
+        response = HEADERS_REJECTED.format(status, _STATUS_TEXT[status], retry_after_s) + '{"error": "' + reason + '"}'
+        writer.write(response.encode())
+        await asyncio.wait_for_ms(writer.drain(), Admission.write_timeout_ms)
+    except Exception:
+        pass
+    await writer.aclose()
 
 async def handle_client(reader, writer):
+    """Admission control in front of the request handler"""
+    try:
+        ip = writer.get_extra_info("peername")[0]
+    except Exception:
+        ip = None
+    rejection = Admission.admit(ip)
+    if rejection is not None:
+        await reject(writer, *rejection)
+        return
     try:
-        request = await reader.read(1024)
-        request = request.decode()
+        await handle_request(reader, writer)
+    finally:
+        Admission.release()
+
+async def handle_request(reader, writer):
+    try:
+        raw = await asyncio.wait_for_ms(read_request(reader), Admission.read_timeout_ms)
+        head_end = raw.find(b"\r\n\r\n")
+        head = raw[:head_end].decode() if head_end != -1 else raw.decode()
+        cbor_body = None
+        if head_end != -1 and header_value(head, "content-type") == cbor.CONTENT_TYPE:
+            # A CBOR body is binary: only the head is text
+            request = head + "\r\n\r\n"
+            cbor_body = raw[head_end + 4:]
+        else:
+            request = raw.decode()
         
         if not request:
             await writer.aclose()
@@ -14,6 +114,9 @@ async def handle_client(reader, writer):
         
         request_line = request.split("\r\n")[0]
         method, path, _ = request_line.split()
+        accept = header_value(head, "accept")
+        use_cbor = accept is not None and cbor.CONTENT_TYPE in accept
+        PowerManager.note_request()
 
         response_headers = ""
         response_body = ""
@@ -21,63 +124,507 @@ async def handle_client(reader, writer):
         # Endpoint: GET /test
         if method == "GET" and path == "/test":
             response_body = json.dumps({"message": "Hello, World!"})
-            response_headers = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+            response_headers = HEADERS_OK
 
         # Endpoint: GET /modules
         elif method == "GET" and path == "/modules":
-            json_data = {uuid: type(module).__name__ for uuid, module in ModuleManager.modules.items()}
+            json_data = {uuid: module.module_type for uuid, module in ModuleManager.modules.items()}
             response_body = json.dumps(json_data)
-            response_headers = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /modules/state  (every module's state in one response)
+        elif method == "GET" and path == "/modules/state":
+            response_headers, response_body = encode_response(ModuleManager.get_all_module_states(), use_cbor)
+
+        # Endpoint: GET /battery
+        elif method == "GET" and path == "/battery":
+            response_body = json.dumps(battery.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /debug/power
+        elif method == "GET" and path == "/debug/power":
+            response_body = json.dumps(PowerManager.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: POST /debug/power  body: {"mode": "auto" | "performance" | "balanced" | "saver"}
+        elif method == "POST" and path == "/debug/power":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                data = json.loads(body)
+                response_body = json.dumps(PowerManager.set_requested_mode(data.get("mode", "auto")))
+                response_headers = HEADERS_OK
+            except ValueError:
+                response_body = json.dumps({"error": "Invalid power mode"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /debug/health
+        elif method == "GET" and path == "/debug/health":
+            report = HealthMonitor.get_report()
+            report["link"] = LinkManager.get_status()
+            response_body = json.dumps(report)
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /debug/http  (admission limits and counters)
+        elif method == "GET" and path == "/debug/http":
+            response_body = json.dumps(Admission.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: POST /debug/http  body: {"maxConcurrent": 4, "minFreeHeap": 20000, "ratePerS": 2, ...}
+        elif method == "POST" and path == "/debug/http":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                response_body = json.dumps(Admission.configure(json.loads(body)))
+                response_headers = HEADERS_OK
+            except (ValueError, AttributeError) as e:
+                response_body = json.dumps({"error": str(e)})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /debug/wire?n=<iterations>  (JSON vs CBOR size and encode/decode time)
+        elif method == "GET" and path.startswith("/debug/wire"):
+            try:
+                iterations = max(1, min(int(query_params(path).get("n", 20)), 200))
+                sample_uuid = next(iter(Sampler.latest), None)
+                history = Sampler.get_history(sample_uuid) if sample_uuid else None
+                report = {
+                    "iterations": iterations,
+                    "central": ModuleManager.central_content_type,
+                    "state": cbor.compare(ModuleManager.get_all_module_states(), iterations),
+                    "refresh": cbor.compare(ModuleManager.central_payload(ModuleManager.modules), iterations),
+                }
+                if history is not None:
+                    report["history"] = cbor.compare(history, iterations)
+                response_body = json.dumps(report)
+                response_headers = HEADERS_OK
+            except ValueError:
+                response_body = json.dumps({"error": "Invalid 'n' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /debug/wire  body: {"central": "cbor" | "json"}  (encoding of the central refresh)
+        elif method == "POST" and path == "/debug/wire":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                encoding = json.loads(body).get("central")
+                if encoding not in ("json", "cbor"):
+                    raise ValueError
+                ModuleManager.central_content_type = cbor.CONTENT_TYPE if encoding == "cbor" else "application/json"
+                response_body = json.dumps({"central": ModuleManager.central_content_type})
+                response_headers = HEADERS_OK
+            except (ValueError, AttributeError):
+                response_body = json.dumps({"error": "central must be 'json' or 'cbor'"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /debug/boot
+        elif method == "GET" and path == "/debug/boot":
+            response_body = json.dumps(BootTimeline.get_report())
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /debug/link
+        elif method == "GET" and path == "/debug/link":
+            response_body = json.dumps(LinkManager.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /debug/core1
+        elif method == "GET" and path == "/debug/core1":
+            response_body = json.dumps(Core1Scheduler.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /debug/i2c
+        elif method == "GET" and path == "/debug/i2c":
+            response_body = json.dumps({
+                "devices": [f"0x{a:02x}" for a in sorted(ModuleManager.get_current_i2c_devices())],
+                "identify": DeviceIdentifier.get_status()
+            })
+            response_headers = HEADERS_OK
+
+        # Endpoint: POST /debug/i2c/forget  body: {"address": 72} (omit to forget all)
+        elif method == "POST" and path == "/debug/i2c/forget":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                data = json.loads(body) if body.strip() else {}
+                address = data.get("address")
+                DeviceIdentifier.forget(address)
+                if address is not None and address in ModuleManager.get_current_i2c_devices():
+                    DeviceIdentifier.enqueue(address)
+                response_body = json.dumps({"forgotten": address if address is not None else "all"})
+                response_headers = HEADERS_OK
+            except (ValueError, AttributeError, TypeError):
+                response_body = json.dumps({"error": "Invalid address"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /debug/logs?level=<level>
+        elif method == "GET" and path.startswith("/debug/logs"):
+            params = query_params(path)
+            min_level = logger.DEBUG
+            for value, name in logger.LEVEL_NAMES.items():
+                if name == params.get("level", "").upper():
+                    min_level = value
+            response_body = json.dumps({
+                "level": logger.LEVEL_NAMES.get(logger.level),
+                "entries": logger.get_entries(min_level)
+            })
+            response_headers = HEADERS_OK
+
+        # Endpoint: POST /debug/logs  body: {"level": "debug"}
+        elif method == "POST" and path == "/debug/logs":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                data = json.loads(body)
+                logger.set_level(data.get("level", "info"))
+                response_body = json.dumps({"level": logger.LEVEL_NAMES.get(logger.level)})
+                response_headers = HEADERS_OK
+            except (ValueError, AttributeError):
+                response_body = json.dumps({"error": "Invalid log level"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /rules
+        elif method == "GET" and path == "/rules":
+            response_body = json.dumps(RuleEngine.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: POST /rules  body: [rule, ...] (replaces the whole set)
+        elif method == "POST" and path == "/rules":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                count = RuleEngine.upload(json.loads(body))
+                response_body = json.dumps({"rules": count})
+                response_headers = HEADERS_OK
+            except (ValueError, AttributeError, TypeError) as e:
+                response_body = json.dumps({"error": f"Invalid rules: {e}"})
+                response_headers = HEADERS_BAD_REQUEST
 
         # Endpoint: GET /module/state?uuid=<uuid>
         elif method == "GET" and path.startswith("/module/state"):
-            query = path.split("?")[1] if "?" in path else ""
-            params = dict(param.split("=") for param in query.split("&") if "=" in param)
+            params = query_params(path)
             uuid = params.get("uuid")
             
             if not uuid:
                 response_body = json.dumps({"error": "Missing 'uuid' parameter"})
-                response_headers = "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n"
+                response_headers = HEADERS_BAD_REQUEST
             else:
-                response_body = json.dumps(ModuleManager.get_module_state(uuid))
-                response_headers = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+                if use_cbor:
+                    response_headers, response_body = encode_response(ModuleManager.get_module_state_data(uuid), True)
+                else:
+                    # JSON clients get the module's JSON string, as before
+                    response_body = json.dumps(ModuleManager.get_module_state(uuid))
+                    response_headers = HEADERS_OK
 
         # Endpoint: POST /module/state?uuid=<uuid>
         elif method == "POST" and path.startswith("/module/state"):
-            query = path.split("?")[1] if "?" in path else ""
-            params = dict(param.split("=") for param in query.split("&") if "=" in param)
+            params = query_params(path)
             uuid = params.get("uuid")
             
             if not uuid:
                 response_body = json.dumps({"error": "Missing 'uuid' parameter"})
-                response_headers = "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n"
+                response_headers = HEADERS_BAD_REQUEST
             else:
                 body = request.split("\r\n\r\n", 1)[-1]
                 try:
-                    data = json.loads(body)
-                    if "state" not in data:
+                    data = cbor.loads(cbor_body) if cbor_body is not None else json.loads(body)
+                    if not isinstance(data, dict):
+                        response_body = json.dumps({"error": "Body must be an object"})
+                        response_headers = HEADERS_BAD_REQUEST
+                    elif "state" not in data:
                         response_body = json.dumps({"error": "Missing 'state' field"})
-                        response_headers = "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n"
+                        response_headers = HEADERS_BAD_REQUEST
                     else:
-                        response_body = json.dumps(ModuleManager.set_module_state(uuid, data["state"]))
-                        response_headers = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
-                except json.JSONDecodeError:
+                        result = CommandQueue.submit(uuid, data["state"])
+                        response_body = json.dumps(result)
+                        response_headers = HEADERS_BAD_REQUEST if "error" in result else HEADERS_OK
+                except (ValueError, TypeError, RuntimeError):
+                    response_body = json.dumps({"error": "Invalid body"})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /module/commands?uuid=<uuid>  (sequence numbers and queue counters)
+        elif method == "GET" and path.startswith("/module/commands"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                response_body = json.dumps(CommandQueue.get_status(uuid))
+                response_headers = HEADERS_OK
+
+        # Endpoint: POST /module/commands?uuid=<uuid>  body: {"minIntervalMs": 1000}
+        elif method == "POST" and path.startswith("/module/commands"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    data = json.loads(body)
+                    response_body = json.dumps(CommandQueue.set_min_interval(uuid, data["minIntervalMs"]))
+                    response_headers = HEADERS_OK
+                except KeyError:
+                    response_body = json.dumps({"error": "Missing 'minIntervalMs' field"})
+                    response_headers = HEADERS_BAD_REQUEST
+                except (ValueError, TypeError) as e:
+                    response_body = json.dumps({"error": str(e)})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /module/transition?uuid=<uuid>  (running fade or schedule)
+        elif method == "GET" and path.startswith("/module/transition"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                response_body = json.dumps(TransitionEngine.get_status(uuid))
+                response_headers = HEADERS_OK
+
+        # Endpoint: POST /module/transition?uuid=<uuid>  body: {"target": 80, "durationMs": 1500, "easing": "ease-in-out"}
+        elif method == "POST" and path.startswith("/module/transition"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    data = json.loads(body)
+                    result = TransitionEngine.transition(uuid, data["target"], data.get("durationMs", 1000), data.get("easing", "linear"))
+                    response_body = json.dumps(result)
+                    response_headers = HEADERS_OK
+                except KeyError:
+                    response_body = json.dumps({"error": "Missing 'target' field"})
+                    response_headers = HEADERS_BAD_REQUEST
+                except (ValueError, TypeError) as e:
+                    response_body = json.dumps({"error": str(e)})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /module/schedule?uuid=<uuid>
+        #   body: {"steps": [{"delayMs": 0, "state": 100, "durationMs": 500}, {"delayMs": 60000, "state": 0}], "repeat": 1}
+        elif method == "POST" and path.startswith("/module/schedule"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    data = json.loads(body)
+                    result = TransitionEngine.schedule(uuid, data.get("steps"), data.get("repeat", 1))
+                    response_body = json.dumps(result)
+                    response_headers = HEADERS_OK
+                except (ValueError, TypeError, AttributeError) as e:
+                    response_body = json.dumps({"error": str(e)})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /module/cancel?uuid=<uuid>  (stops a running fade or schedule)
+        elif method == "POST" and path.startswith("/module/cancel"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                response_body = json.dumps({"cancelled": TransitionEngine.cancel(uuid)})
+                response_headers = HEADERS_OK
+
+        # Endpoint: POST /module/sampling?uuid=<uuid>  body: {"samples": 8, "filter": "median", "emaAlpha": 0.3}
+        elif method == "POST" and path.startswith("/module/sampling"):
+            params = query_params(path)
+            uuid = params.get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    result = ModuleManager.configure_module_sampling(uuid, json.loads(body))
+                    response_body = json.dumps(result)
+                    if "error" in result:
+                        response_headers = HEADERS_BAD_REQUEST
+                    else:
+                        response_headers = HEADERS_OK
+                except ValueError:
+                    response_body = json.dumps({"error": "Invalid JSON"})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /module/calibration?uuid=<uuid>
+        elif method == "GET" and path.startswith("/module/calibration"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                response_body = json.dumps(ModuleManager.get_module_calibration(uuid))
+                response_headers = HEADERS_OK
+
+        # Endpoint: GET /module/history?uuid=<uuid>
+        elif method == "GET" and path.startswith("/module/history"):
+            uuid = query_params(path).get("uuid")
+            history = Sampler.get_history(uuid) if uuid else None
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            elif history is None:
+                response_body = json.dumps({"error": "No samples for this module"})
+                response_headers = HEADERS_NOT_FOUND
+            else:
+                response_headers, response_body = encode_response(history, use_cbor)
+
+        # Endpoint: POST /module/calibrate?uuid=<uuid>  body: {"bursts": 20, "temperatureUuid": "<uuid>"}
+        elif method == "POST" and path.startswith("/module/calibrate"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    data = json.loads(body) if body.strip() else {}
+                    result = await ModuleManager.calibrate_module(
+                        uuid,
+                        int(data.get("bursts", 20)),
+                        data.get("temperatureUuid")
+                    )
+                    response_body = json.dumps(result)
+                    response_headers = HEADERS_BAD_REQUEST if "error" in result else HEADERS_OK
+                except ValueError:
+                    response_body = json.dumps({"error": "Invalid JSON"})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /module/alert?uuid=<uuid>  body: {"tos": 60, "thyst": 55, "osPin": 15, "mode": "comparator"}
+        elif method == "POST" and path.startswith("/module/alert"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    result = ModuleManager.configure_module_alert(uuid, json.loads(body))
+                    response_body = json.dumps(result)
+                    response_headers = HEADERS_BAD_REQUEST if "error" in result else HEADERS_OK
+                except ValueError:
                     response_body = json.dumps({"error": "Invalid JSON"})
-                    response_headers = "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n"
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /module/lowpower?uuid=<uuid>  body: {"enabled": true}
+        elif method == "POST" and path.startswith("/module/lowpower"):
+            uuid = query_params(path).get("uuid")
+
+            if not uuid:
+                response_body = json.dumps({"error": "Missing 'uuid' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+            else:
+                body = request.split("\r\n\r\n", 1)[-1]
+                try:
+                    data = json.loads(body)
+                    result = ModuleManager.set_module_low_power(uuid, bool(data.get("enabled", True)))
+                    response_body = json.dumps(result)
+                    response_headers = HEADERS_BAD_REQUEST if "error" in result else HEADERS_OK
+                except ValueError:
+                    response_body = json.dumps({"error": "Invalid JSON"})
+                    response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /events?since=<seq>&wait=<ms>  (long-poll when wait > 0)
+        elif method == "GET" and path.startswith("/events"):
+            params = query_params(path)
+            try:
+                since = int(params.get("since", 0))
+                wait_ms = min(int(params.get("wait", 0)), 30000)
+                rejection = Admission.park() if wait_ms > 0 else None
+                if rejection is not None:
+                    status, reason, retry_after_s = rejection
+                    response_body = json.dumps({"error": reason})
+                    response_headers = HEADERS_REJECTED.format(status, _STATUS_TEXT[status], retry_after_s)
+                else:
+                    try:
+                        recent = await events.wait_for_events(since, wait_ms)
+                    finally:
+                        if wait_ms > 0:
+                            Admission.resume()
+                    response_body = json.dumps({"last": events.last_sequence(), "events": recent})
+                    response_headers = HEADERS_OK
+            except ValueError:
+                response_body = json.dumps({"error": "Invalid 'since' or 'wait' parameter"})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: GET /waveform
+        elif method == "GET" and path == "/waveform":
+            response_body = json.dumps(WaveformGenerator.get_status())
+            response_headers = HEADERS_OK
+
+        # Endpoint: GET /waveform/selftest?ms=<duration>
+        elif method == "GET" and path.startswith("/waveform/selftest"):
+            try:
+                duration_ms = min(int(query_params(path).get("ms", 500)), 5000)
+                response_body = json.dumps(await WaveformGenerator.self_test(duration_ms))
+                response_headers = HEADERS_OK
+            except ValueError as e:
+                response_body = json.dumps({"error": str(e)})
+                response_headers = HEADERS_BAD_REQUEST
+
+        # Endpoint: POST /waveform
+        # body: {"shape": "sine", "frequency": 200, "lower": 0, "upper": 127, "table": [...], "running": true, "backend": "thread"}
+        elif method == "POST" and path == "/waveform":
+            body = request.split("\r\n\r\n", 1)[-1]
+            try:
+                data = json.loads(body)
+                if "backend" in data and data["backend"] != WaveformGenerator.backend and WaveformGenerator.running:
+                    WaveformGenerator.stop()
+                result = WaveformGenerator.configure(
+                    data.get("shape"),
+                    data.get("frequency"),
+                    data.get("lower"),
+                    data.get("upper"),
+                    data.get("table")
+                )
+                if data.get("running") is True:
+                    result = WaveformGenerator.start(data.get("backend", WaveformGenerator.backend or "thread"))
+                elif data.get("running") is False:
+                    result = WaveformGenerator.stop()
+                response_body = json.dumps(result)
+                response_headers = HEADERS_OK
+            except ValueError as e:
+                response_body = json.dumps({"error": str(e)})
+                response_headers = HEADERS_BAD_REQUEST
         else:
             response_body = json.dumps({"error": "Not Found"})
-            response_headers = "HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n\r\n"
+            response_headers = HEADERS_NOT_FOUND
 
-        response = response_headers + response_body
-        writer.write(response.encode())
-        await writer.drain()
+        writer.write(response_headers.encode())
+        writer.write(response_body if isinstance(response_body, (bytes, bytearray)) else response_body.encode())
+        await asyncio.wait_for_ms(writer.drain(), Admission.write_timeout_ms)
         await writer.aclose()
+        HealthMonitor.note_response()
+    except asyncio.TimeoutError:
+        # Slow or stalled client: drop it rather than hold a slot
+        Admission.note_timeout()
+        await writer.aclose()
+    except MemoryError:
+        Admission.note_memory_error()
+        await reject(writer, 503, REASON_MEMORY, 2)
     except Exception as e:
         print(f"Server error: {e}")
         await writer.aclose()
 
+_server = None
+
+async def bind(ip_address, port=8080):
+    """(Re)bind the listening socket, e.g. after the link manager reports a new IP"""
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+    _server = await asyncio.start_server(handle_client, ip_address, port)
+    print(f"HTTP server listening on {ip_address}:{port}")
+
 async def start_server(ip_address, port=8080):
     print(f"HTTP server starting on {ip_address}:{port}")  # Debugging
-    server = await asyncio.start_server(handle_client, ip_address, port)
+    await bind(ip_address, port)
     while True:
         await asyncio.sleep(1)  # Keep the loop running
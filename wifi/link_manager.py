@@ -0,0 +1,141 @@
+import network
+import time
+import uasyncio as asyncio
+import wifi.wifi_connect as wifi_connect
+import utils.events as events
+
+LINK_DOWN = "down"
+LINK_CONNECTING = "connecting"
+LINK_UP = "up"
+
+
+class LinkManager:
+    """Owns the station interface after boot: watches the link, reconnects in
+    the background and tells the rest of the firmware when the IP changes"""
+
+    wlan = None
+    state = LINK_DOWN
+    ip = None
+    rssi = None
+    check_interval_ms = 2000
+    max_backoff_s = 60
+    reconnects = 0
+    _last_change_ms = time.ticks_ms()
+    _down_since_ms = None
+    _link_callbacks = []
+    running = False
+
+    @staticmethod
+    def on_link_change(callback):
+        """Register callback(ip, old_ip), called when the link comes back up or
+        its IP changes; coroutine results are awaited"""
+        LinkManager._link_callbacks.append(callback)
+
+    @staticmethod
+    def is_up():
+        if not LinkManager.running:
+            # Before supervision starts (boot), ask the interface directly
+            return network.WLAN(network.STA_IF).isconnected()
+        return LinkManager.state == LINK_UP
+
+    @staticmethod
+    def _set_state(state):
+        if state == LinkManager.state:
+            return
+        print(f"📶 Link: {LinkManager.state} -> {state}")
+        LinkManager.state = state
+        LinkManager._last_change_ms = time.ticks_ms()
+        events.publish("link", {"state": state, "ip": LinkManager.ip})
+
+    @staticmethod
+    async def _notify(ip, old_ip):
+        if ip != old_ip:
+            print(f"📶 IP changed: {old_ip} -> {ip}")
+        for callback in LinkManager._link_callbacks:
+            try:
+                result = callback(ip, old_ip)
+                if hasattr(result, "send"):
+                    await result
+            except Exception as e:
+                print(f"❌ IP change callback error: {e}")
+
+    @staticmethod
+    def _read_rssi():
+        try:
+            LinkManager.rssi = LinkManager.wlan.status("rssi")
+        except Exception:
+            LinkManager.rssi = None
+
+    @staticmethod
+    async def _reconnect():
+        """One reconnect round: cached AP first, then a single scan attempt"""
+        LinkManager._set_state(LINK_CONNECTING)
+        try:
+            ip = await wifi_connect.connect_to_wifi_async(max_attempts=1)
+        except Exception as e:
+            print(f"⚠️ Reconnect failed: {e}")
+            LinkManager._set_state(LINK_DOWN)
+            return False
+        LinkManager.reconnects += 1
+        LinkManager._down_since_ms = None
+        old_ip = LinkManager.ip
+        LinkManager.ip = ip
+        LinkManager._set_state(LINK_UP)
+        await LinkManager._notify(ip, old_ip)
+        return True
+
+    @staticmethod
+    async def run(ip_address=None):
+        """Supervise the link; ip_address is the address obtained at boot"""
+        if LinkManager.running:
+            return
+        LinkManager.running = True
+        LinkManager.wlan = network.WLAN(network.STA_IF)
+        if ip_address is not None:
+            LinkManager.ip = ip_address
+            LinkManager._set_state(LINK_UP)
+
+        backoff_s = 1
+        while True:
+            await asyncio.sleep_ms(LinkManager.check_interval_ms)
+            try:
+                wlan = LinkManager.wlan
+                if wlan.isconnected():
+                    LinkManager._read_rssi()
+                    ip = wlan.ifconfig()[0]
+                    old_ip = LinkManager.ip
+                    came_back = LinkManager.state != LINK_UP
+                    LinkManager.ip = ip
+                    LinkManager._set_state(LINK_UP)
+                    if came_back or ip != old_ip:
+                        LinkManager._down_since_ms = None
+                        await LinkManager._notify(ip, old_ip)
+                    backoff_s = 1
+                    continue
+
+                if LinkManager.state == LINK_UP:
+                    print("⚠️ WiFi link lost, reconnecting in the background")
+                    LinkManager._down_since_ms = time.ticks_ms()
+                    LinkManager._set_state(LINK_DOWN)
+                LinkManager.rssi = None
+
+                if await LinkManager._reconnect():
+                    backoff_s = 1
+                else:
+                    await asyncio.sleep(backoff_s)
+                    backoff_s = min(backoff_s * 2, LinkManager.max_backoff_s)
+            except Exception as e:
+                print(f"❌ Link manager error: {e}")
+
+    @staticmethod
+    def get_status():
+        now = time.ticks_ms()
+        return {
+            "state": LinkManager.state,
+            "ip": LinkManager.ip,
+            "rssi": LinkManager.rssi,
+            "reconnects": LinkManager.reconnects,
+            "sinceChangeMs": time.ticks_diff(now, LinkManager._last_change_ms),
+            "downForMs": time.ticks_diff(now, LinkManager._down_since_ms) if LinkManager._down_since_ms is not None else 0,
+            "connect": wifi_connect.connect_stats,
+        }
@@ -2,13 +2,27 @@ import network
 import json
 import time
 import os
+import ubinascii
+import uasyncio as asyncio
+from utils.health import HealthMonitor
+from utils.power import PowerManager
 
 WIFI_CREDENTIALS_FILE = "wifi_credentials.json"
 
-def connect_to_wifi():
-    # Load credentials from JSON file
+# Set whenever new credentials are saved, so a running retry loop picks them up
+credentials_changed = asyncio.Event()
+
+FAST_CONNECT_TIMEOUT_S = 8  # Cached BSSID/channel: give up quickly and scan instead
+
+# How the last connection was made, for /debug/health
+connect_stats = {"path": None, "durationMs": None, "attempts": 0}
+
+def _read_credentials_file():
     with open(WIFI_CREDENTIALS_FILE, "r") as f:
-        data = json.load(f)
+        return json.load(f)
+
+def _load_credentials():
+    data = _read_credentials_file()
 
     ssid = data.get("ssid")
     password = data.get("password")
@@ -16,6 +30,84 @@ def connect_to_wifi():
     if not ssid or not password:
         print("⚠️ Invalid WiFi credentials!")
         raise Exception("Invalid WiFi credentials")
+    return ssid, password, data
+
+def _associated_ap(wlan, bssid=None, channel=None):
+    """BSSID/channel the radio actually joined, read back after association.
+    Falls back to what the caller pinned when the driver cannot report it."""
+    try:
+        bssid = wlan.config("bssid")
+    except (ValueError, OSError, TypeError):
+        pass
+    try:
+        channel = wlan.config("channel")
+    except (ValueError, OSError, TypeError):
+        pass
+    return bssid, channel
+
+def _save_connection_cache(wlan, bssid=None, channel=None):
+    """Remember the AP and lease that worked, next to the credentials.
+    Set "staticIp": true in wifi_credentials.json to reuse the lease without DHCP."""
+    bssid, channel = _associated_ap(wlan, bssid, channel)
+    try:
+        data = _read_credentials_file()
+        data["cache"] = {
+            "bssid": ubinascii.hexlify(bssid).decode() if bssid else None,
+            "channel": channel,
+            "ifconfig": list(wlan.ifconfig()),
+        }
+        with open(WIFI_CREDENTIALS_FILE, "w") as f:
+            json.dump(data, f)
+    except Exception as e:
+        print(f"⚠️ Error saving connection cache: {e}")
+
+def _clear_connection_cache():
+    """Forget a cached AP that no longer answers, so the next boot scans"""
+    try:
+        data = _read_credentials_file()
+        if data.pop("cache", None) is not None:
+            with open(WIFI_CREDENTIALS_FILE, "w") as f:
+                json.dump(data, f)
+    except Exception as e:
+        print(f"⚠️ Error clearing connection cache: {e}")
+
+async def _connect_cached(wlan, ssid, password, data):
+    """Fast path: join the cached AP directly, no scan and no channel guessing"""
+    cache = data.get("cache") or {}
+    if not cache.get("bssid"):
+        return False
+    print(f"⚡ Fast connect to {ssid} via cached AP {cache['bssid']} (Ch{cache.get('channel')})")
+    static = data.get("staticIp") and cache.get("ifconfig")
+    try:
+        if static:
+            wlan.ifconfig(tuple(cache["ifconfig"]))
+        wlan.connect(ssid, password, bssid=ubinascii.unhexlify(cache["bssid"]))
+        if await _wait_for_connection(wlan, FAST_CONNECT_TIMEOUT_S):
+            return True
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Fast connect error: {e}")
+    print("⚠️ Cached AP not reachable, falling back to scan")
+    wlan.disconnect()
+    _clear_connection_cache()
+    data.pop("cache", None)
+    if static:
+        try:
+            wlan.ifconfig("dhcp")
+        except Exception:
+            pass
+    return False
+
+def connect_to_wifi():
+    """Blocking connect for scripts; the firmware uses connect_to_wifi_async()"""
+    return asyncio.run(connect_to_wifi_async())
+
+async def connect_to_wifi_async(max_attempts=5):
+    """Connect with the saved credentials, yielding to the event loop between
+    steps. The cached AP is tried first; the scan path re-reads credentials
+    every attempt, so ones provisioned over BLE meanwhile are used straight away."""
+    ssid, password, data = _load_credentials()
+    credentials_changed.clear()
+    start_ms = time.ticks_ms()
 
     print(f"📡 Connecting to WiFi: {ssid}...")
 
@@ -27,46 +119,62 @@ def connect_to_wifi():
     if ap_if.active():
         ap_if.active(False)
     
-    wlan.active(True)
-    time.sleep(2)  # Critical: Allow chip initialization
+    activated = not wlan.active()
+    if activated:
+        wlan.active(True)
     
     # Configure for optimal Android hotspot compatibility
     network.country('US')  # Set country code for proper channel access
-    wlan.config(pm=0xa11140)  # Disable power management for stability
+    PowerManager.apply_wifi_pm(wlan)  # Current power mode, not a fixed PM_NONE
+
+    if await _connect_cached(wlan, ssid, password, data):
+        return _connected(wlan, ssid, "cache", start_ms, 1)
+
+    if activated:
+        await asyncio.sleep(2)  # Critical: Allow chip initialization
     
     # Connection strategies with exponential backoff
-    max_attempts = 5
     for attempt in range(max_attempts):
+        if credentials_changed.is_set():
+            ssid, password, data = _load_credentials()
+            credentials_changed.clear()
+            print(f"📡 New credentials received, connecting to: {ssid}")
+
         print(f"🔄 Connection attempt {attempt + 1}/{max_attempts}")
         
-        # Verify network is visible
-        if not _verify_network_visibility(wlan, ssid):
+        # Verify network is visible (the scan itself cannot yield)
+        with HealthMonitor.blocking("wifi_scan"):
+            network_info = _verify_network_visibility(wlan, ssid)
+        if not network_info:
             print(f"⚠️ Network '{ssid}' not found in scan")
-            time.sleep(2)
+            await asyncio.sleep(2)
             continue
+        bssid, channel = network_info[1], network_info[2]
         
         # Clean connection state
         if wlan.isconnected():
             wlan.disconnect()
-            time.sleep(1)
+            await asyncio.sleep(1)
         
         try:
-            # Try different connection strategies
+            # Try different connection strategies, using the AP found by the scan
             strategies = [
                 lambda: wlan.connect(ssid, password),
-                lambda: wlan.connect(ssid, password, channel=6),  # Force channel 6
-                lambda: wlan.connect(ssid, password, channel=1),  # Try channel 1
+                lambda: wlan.connect(ssid, password, bssid=bssid),  # Pin the scanned AP
+                lambda: wlan.connect(ssid, password, channel=channel),  # Force its channel
             ]
             
             strategy_index = min(attempt, len(strategies) - 1)
             strategies[strategy_index]()
+            # Only what this strategy pinned is known to be the AP it joins
+            pinned_bssid = bssid if strategy_index == 1 else None
+            pinned_channel = channel if strategy_index == 2 else None
             
             # Wait for connection with increasing timeout
             timeout = 20 + (attempt * 5)  # 20, 25, 30, 35, 40 seconds
-            if _wait_for_connection(wlan, timeout):
-                ip = wlan.ifconfig()[0]
-                print(f"✅ Connected to {ssid}, IP: {ip}")
-                return ip
+            if await _wait_for_connection(wlan, timeout):
+                _save_connection_cache(wlan, pinned_bssid, pinned_channel)
+                return _connected(wlan, ssid, "scan", start_ms, attempt + 1)
                 
         except OSError as e:
             print(f"⚠️ Connection error: {e}")
@@ -75,13 +183,23 @@ def connect_to_wifi():
         if attempt < max_attempts - 1:
             delay = min(2 ** attempt, 16)
             print(f"⏳ Waiting {delay}s before retry...")
-            time.sleep(delay)
+            await asyncio.sleep(delay)
     
     print("❌ WiFi connection failed after all attempts!")
     raise Exception("WiFi connection failed after all attempts")
 
+def _connected(wlan, ssid, path, start_ms, attempts):
+    ip = wlan.ifconfig()[0]
+    duration = time.ticks_diff(time.ticks_ms(), start_ms)
+    connect_stats["path"] = path
+    connect_stats["durationMs"] = duration
+    connect_stats["attempts"] = attempts
+    print(f"✅ Connected to {ssid}, IP: {ip} ({path}, {duration}ms)")
+    return ip
+
 def _verify_network_visibility(wlan, target_ssid):
-    """Verify target network is detectable and check signal strength"""
+    """Verify target network is detectable and check signal strength.
+    Returns the scan entry (ssid, bssid, channel, rssi, security, hidden) or None."""
     try:
         networks = wlan.scan()
         for net in networks:
@@ -98,12 +216,12 @@ def _verify_network_visibility(wlan, target_ssid):
                 if channel > 11:
                     print(f"⚠️ Channel {channel} may not be fully supported")
                     
-                return True
+                return net
     except Exception as e:
         print(f"⚠️ Network scan error: {e}")
-    return False
+    return None
 
-def _wait_for_connection(wlan, timeout_seconds):
+async def _wait_for_connection(wlan, timeout_seconds):
     """Wait for connection with detailed status monitoring"""
     start_time = time.ticks_ms()
     
@@ -123,7 +241,7 @@ def _wait_for_connection(wlan, timeout_seconds):
         if elapsed % 5000 < 500:  # Print roughly every 5 seconds
             print(f"🔄 Connecting... ({_decode_status(status)})")
         
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
     
     return True
 
@@ -156,6 +274,7 @@ def write_credentials(ssid, password, central_ip):
         }
         with open(WIFI_CREDENTIALS_FILE, "w") as f:
             json.dump(credentials, f)
+        credentials_changed.set()
         print("✅ WiFi credentials saved!")
     except Exception as e:
         print(f"⚠️ Error saving credentials: {e}")
\ No newline at end of file